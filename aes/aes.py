@@ -18,6 +18,31 @@ def GenKey(Nb, Nk, random_bytes):
     return {'Nb': Nb, 'Nk': Nk, 'k': [ [random_bytes[i + 4 * j] for i in range(4)] for j in range(Nk)]}
 
 
+def ComputeSBox(x):
+    """
+    S-box evaluated from its definition, x -> A * x^-1 + 0x63 with A the affine map mod x^8 + 1.
+    Used once at import time to fill SBOX.
+    """
+    a_ij = GF256Element(x)
+    a_ij_inverse = a_ij.inverse()
+    b_ij = GF256Element(GF256Element.mul_mod(a_ij_inverse, GF256Element([1, 1, 1, 1, 1, 0, 0, 0]), [1, 0, 0, 0, 0, 0, 0, 0, 1])) + GF256Element([1, 1, 0, 0, 0, 1, 1, 0])
+    return int(b_ij)
+
+
+def ComputeSBoxInv(x):
+    """
+    Inverse S-box evaluated from its definition. Used once at import time to fill SBOX_INV.
+    """
+    a_ij = GF256Element(x)
+    a_ij = GF256Element(GF256Element.mul_mod(a_ij, GF256Element([0, 1, 0, 1, 0, 0, 1, 0]), [1, 0, 0, 0, 0, 0, 0, 0, 1])) + GF256Element([1, 0, 1, 0, 0, 0, 0, 0])
+    b_ij = a_ij.inverse()
+    return int(b_ij)
+
+
+SBOX = [ComputeSBox(x) for x in range(256)]
+SBOX_INV = [ComputeSBoxInv(x) for x in range(256)]
+
+
 def SBox(x):
     """
     TEST:
@@ -43,11 +68,8 @@ def SBox(x):
     True
     """
     global COUNT
-    a_ij = GF256Element(x)
-    a_ij_inverse = a_ij.inverse()
     COUNT += 1
-    b_ij = GF256Element(GF256Element.mul_mod(a_ij_inverse, GF256Element([1, 1, 1, 1, 1, 0, 0, 0]), [1, 0, 0, 0, 0, 0, 0, 0, 1])) + GF256Element([1, 1, 0, 0, 0, 1, 1, 0])
-    return int(b_ij)
+    return SBOX[int(GF256Element(x))]
 
 
 def SBoxInv(x):
@@ -74,10 +96,7 @@ def SBoxInv(x):
     >>> SBOXINV == list(map(SBoxInv, range(256)))
     True
     """
-    a_ij = GF256Element(x)
-    a_ij = GF256Element(GF256Element.mul_mod(a_ij, GF256Element([0, 1, 0, 1, 0, 0, 1, 0]), [1, 0, 0, 0, 0, 0, 0, 0, 1])) + GF256Element([1, 0, 1, 0, 0, 0, 0, 0])
-    b_ij = a_ij.inverse()
-    return sum([b_ij[k] * (1 << k) for k in range(8)])
+    return SBOX_INV[int(GF256Element(x))]
 
 
 def ByteSub(state, inverse=False):
@@ -124,7 +143,7 @@ def MixColumn(state, inverse=False):
     for j in range(Nb):
         a_x = GF256Poly(state['a'][j])
         ca_x = c * a_x
-        state['a'][j] = [int(co) for co in ca_x.coeffs]
+        state['a'][j] = ca_x.values
 
 
 def RotByte(word):
@@ -0,0 +1,154 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Batched Rijndael encryption over NumPy arrays.
+
+Encrypts N (key, message) pairs at once, for generating large numbers of plaintext-ciphertext
+pairs (e.g. when sampling spurious key statistics). States are uint8 arrays of shape (N, 4*Nb),
+with byte 4*j + i holding row i of column j, as in aes.GenState. Results match aes.Rijndael.
+"""
+import numpy as np
+from aes import SBOX
+from gf256 import power
+
+_SBOX = np.array(SBOX, dtype=np.uint8)
+
+
+def _as_blocks(data, width, name):
+    data = np.asarray(data, dtype=np.uint8)
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    if data.ndim != 2 or data.shape[1] != width:
+        raise ValueError("%s must have shape (N, %d), got %s" % (name, width, data.shape))
+    return data
+
+
+def xtime(a):
+    """
+    Multiply every byte of a by x in GF(2^8).
+
+    TEST:
+        >>> from gf256 import GF256Element
+        >>> a = np.arange(256, dtype=np.uint8)
+        >>> list(xtime(a)) == [int(GF256Element(x).xtime()) for x in range(256)]
+        True
+    """
+    return (a << 1) ^ ((a >> 7) * np.uint8(0x1b))
+
+
+def ShiftRowPermutation(Nb):
+    """
+    Flat byte permutation p such that state[:, p] is ShiftRow(state).
+
+    TEST:
+        >>> ShiftRowPermutation(4)
+        [0, 5, 10, 15, 4, 9, 14, 3, 8, 13, 2, 7, 12, 1, 6, 11]
+    """
+    if Nb == 4 or Nb == 6:
+        C = [0, 1, 2, 3]
+    elif Nb == 8:
+        C = [0, 1, 3, 4]
+    else:
+        raise ValueError("Nb = %d not valid" % Nb)
+    return [4 * ((j + C[i]) % Nb) + i for j in range(Nb) for i in range(4)]
+
+
+def ByteSub(state):
+    return _SBOX[state]
+
+
+def ShiftRow(state, Nb=4):
+    return state[:, ShiftRowPermutation(Nb)]
+
+
+def MixColumn(state):
+    """
+    Multiply every column of every state by c(y) = 03 y^3 + 01 y^2 + 01 y + 02 mod y^4 + 1.
+
+    TEST:
+        >>> import aes
+        >>> rng = np.random.default_rng(0)
+        >>> states = rng.integers(0, 256, size=(16, 16), dtype=np.uint8)
+        >>> res = []
+        >>> for s in states:
+        ...     state = aes.GenState(4, [int(x) for x in s])
+        ...     aes.MixColumn(state)
+        ...     res.append(sum(state['a'], []))
+        >>> MixColumn(states).tolist() == res
+        True
+    """
+    a = state.reshape(state.shape[0], -1, 4)
+    t = a[:, :, 0] ^ a[:, :, 1] ^ a[:, :, 2] ^ a[:, :, 3]
+    b = np.empty_like(a)
+    for i in range(4):
+        b[:, :, i] = a[:, :, i] ^ t ^ xtime(a[:, :, i] ^ a[:, :, (i + 1) % 4])
+    return b.reshape(state.shape)
+
+
+def KeyExpansion(keys, Nr, Nb=4, Nk=8):
+    """
+    Expand a batch of keys of shape (N, 4*Nk) into round keys of shape (Nr+1, N, 4*Nb).
+
+    TEST:
+        >>> import aes
+        >>> rng = np.random.default_rng(1)
+        >>> keys = rng.integers(0, 256, size=(4, 24), dtype=np.uint8)
+        >>> rks = KeyExpansion(keys, 12, Nk=6)
+        >>> res = []
+        >>> for k in keys:
+        ...     expanded = aes.KeyExpansion(aes.GenKey(4, 6, [int(x) for x in k]), 12)
+        ...     res.append([sum(rk, []) for rk in expanded])
+        >>> rks.transpose(1, 0, 2).tolist() == res
+        True
+    """
+    keys = _as_blocks(keys, 4 * Nk, "keys")
+    N = keys.shape[0]
+    W = np.empty((Nb * (Nr + 1), N, 4), dtype=np.uint8)
+    W[:Nk] = keys.reshape(N, Nk, 4).transpose(1, 0, 2)
+
+    for i in range(Nk, Nb * (Nr + 1)):
+        temp = W[i - 1]
+        if i % Nk == 0:
+            temp = _SBOX[np.roll(temp, -1, axis=1)]
+            temp[:, 0] ^= power(0x02, (i//Nk - 1) % 255)
+        elif i % Nk == 4 and Nk > 6:
+            temp = _SBOX[temp]
+        W[i] = W[i - Nk] ^ temp
+
+    return W.reshape(Nr + 1, Nb, N, 4).transpose(0, 2, 1, 3).reshape(Nr + 1, N, 4 * Nb)
+
+
+def Rijndael(messages, cipher_keys, Nb=4, Nk=8, Nr=14):
+    """
+    Encrypt messages[n] under cipher_keys[n] for every n.
+
+    :params messages:       uint8 array of shape (N, 4*Nb)
+    :params cipher_keys:    uint8 array of shape (N, 4*Nk)
+    :returns:               uint8 array of shape (N, 4*Nb) of ciphertexts
+
+    TEST:
+        >>> import aes
+        >>> rng = np.random.default_rng(2)
+        >>> res = []
+        >>> for Nk, Nr in [(4, 10), (6, 12), (8, 14)]:
+        ...     keys = rng.integers(0, 256, size=(8, 4*Nk), dtype=np.uint8)
+        ...     messages = rng.integers(0, 256, size=(8, 16), dtype=np.uint8)
+        ...     ciphertexts = Rijndael(messages, keys, Nk=Nk, Nr=Nr)
+        ...     res.append([bytes(c) for c in ciphertexts] == [aes.Rijndael(bytes(m), bytes(k), Nk=Nk, Nr=Nr) for m, k in zip(messages, keys)])
+        >>> res
+        [True, True, True]
+    """
+    state = _as_blocks(messages, 4 * Nb, "messages")
+    round_keys = KeyExpansion(cipher_keys, Nr, Nb=Nb, Nk=Nk)
+    if round_keys.shape[1] != state.shape[0]:
+        raise ValueError("Got %d messages but %d keys" % (state.shape[0], round_keys.shape[1]))
+
+    state = state ^ round_keys[0]
+    for i in range(1, Nr):
+        state = MixColumn(ShiftRow(ByteSub(state), Nb=Nb)) ^ round_keys[i]
+    return ShiftRow(ByteSub(state), Nb=Nb) ^ round_keys[Nr]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
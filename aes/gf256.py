@@ -1,25 +1,202 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
+"""
+GF(2^8) arithmetic as used by AES, with the field defined by m(x) = x^8 + x^4 + x^3 + x + 1.
+
+Elements are backed by integers in range(256), with bit i holding the coefficient of x^i.
+Multiplication goes through log/antilog tables and a full 256x256 product table built at
+import time, so that the classical reference code does not pay for polynomial arithmetic.
+"""
+
+_M = 0x11b # m(x) = x**8 + x**4 + x**3 + x + 1
+_GENERATOR = 0x03 # x + 1, a primitive element of GF(2^8) under m(x)
+
+
+def int_to_bits(a, n=8):
+    """
+    Little-endian coefficient list of integer a.
+
+    TEST:
+        >>> int_to_bits(0x1b)
+        [1, 1, 0, 1, 1, 0, 0, 0]
+        >>> int_to_bits(5, n=3)
+        [1, 0, 1]
+    """
+    return [(a >> i) & 1 for i in range(n)]
+
+
+def bits_to_int(bits):
+    """
+    Integer with bit i set to bits[i] % 2.
+
+    TEST:
+        >>> bits_to_int([1, 1, 0, 1, 1, 0, 0, 0, 1])
+        283
+        >>> bits_to_int([3, 0, 2])
+        1
+    """
+    a = 0
+    for i, b in enumerate(bits):
+        if b % 2:
+            a |= 1 << i
+    return a
+
+
+def clmul(a, b):
+    """
+    Carry-less product of integers a and b, i.e. multiplication in GF(2)[x].
+
+    TEST:
+        >>> clmul(0b11, 0b11)
+        5
+        >>> clmul(0x57, 0x83)
+        11129
+    """
+    acc = 0
+    while b:
+        if b & 1:
+            acc ^= a
+        a <<= 1
+        b >>= 1
+    return acc
+
+
+def reduce_int(a, char_poly):
+    """
+    Reduce polynomial a modulo char_poly, both encoded as integers over GF(2).
+
+    TEST:
+        >>> reduce_int(11129, 0x11b)
+        193
+        >>> reduce_int(0x100, 0x101)
+        1
+    """
+    deg = char_poly.bit_length() - 1
+    for i in range(a.bit_length() - 1, deg - 1, -1):
+        if (a >> i) & 1:
+            a ^= char_poly << (i - deg)
+    return a
+
+
+def _build_tables():
+    exp = [0] * 510
+    log = [0] * 256
+    a = 1
+    for i in range(255):
+        exp[i] = exp[i + 255] = a
+        log[a] = i
+        a = reduce_int(clmul(a, _GENERATOR), _M)
+    mul = [bytes(256)]
+    for a in range(1, 256):
+        la = log[a]
+        mul.append(bytes([0] + [exp[la + log[b]] for b in range(1, 256)]))
+    return exp, log, mul
+
+# _EXP[i] = g^i for i in range(510), _LOG[g^i] = i, _MUL[a][b] = a*b
+_EXP, _LOG, _MUL = _build_tables()
+
+
+def mul(a, b):
+    """
+    Product of bytes a and b in GF(2^8).
+
+    TEST:
+        >>> hex(mul(0x57, 0x83))
+        '0xc1'
+        >>> all(mul(a, b) == reduce_int(clmul(a, b), 0x11b) for a in range(256) for b in range(256))
+        True
+    """
+    return _MUL[a][b]
+
+
+def power(a, degree):
+    """
+    a^degree in GF(2^8) by left-to-right square-and-multiply.
+
+    TEST:
+        >>> power(0x02, 8) == 0x1b
+        True
+        >>> all(power(a, 255) == 1 for a in range(1, 256))
+        True
+        >>> power(0, 0)
+        1
+    """
+    acc = 1
+    for i in range(degree.bit_length() - 1, -1, -1):
+        acc = _MUL[acc][acc]
+        if (degree >> i) & 1:
+            acc = _MUL[acc][a]
+    return acc
+
+
+def inverse_chain(a):
+    """
+    a^-1 = a^254 in GF(2^8) (with 0 mapped to 0) via the Itoh-Tsujii addition chain used by
+    QGF256.Inverse, so that the classical and quantum circuits perform the same sequence of
+    squarings and multiplications regardless of a.
+
+    TEST:
+        >>> all(mul(a, inverse_chain(a)) == 1 for a in range(1, 256))
+        True
+        >>> inverse_chain(0)
+        0
+    """
+    b = _MUL[a][a]                      # a^2
+    c = _MUL[a][b]                      # a^3 (beta_2)
+    d = power(c, 4)                     # a^12
+    e = _MUL[c][d]                      # a^15 (beta_4)
+    d = power(d, 4)                     # a^48
+    c = _MUL[e][d]                      # a^63 (beta_6)
+    b = _MUL[power(a, 64)][c]           # a^127
+    return _MUL[b][b]                   # a^254
+
+# _INV[a] = a^-1, with _INV[0] = 0
+_INV = bytes([inverse_chain(a) for a in range(256)])
+
+
+def inverse(a):
+    """
+    a^-1 in GF(2^8) (with 0 mapped to 0), looked up in a 256-entry table.
+
+    TEST:
+        >>> hex(inverse(0x53))
+        '0xca'
+    """
+    return _INV[a]
+
+
 class GF256Element:
 
     _m = [1, 1, 0, 1, 1, 0, 0, 0, 1] # m(x) = x**8 + x**4 + x**3 + x + 1
 
+    __slots__ = ['_value']
+
     def __init__(self, coeffs):
         if isinstance(coeffs, int):
             if coeffs not in range(256):
                 raise ValueError("%d not a byte" % coeffs)
-            coeffs = [int(bool(coeffs & (1 << i))) for i in range(8)]
+            self._value = coeffs
         elif isinstance(coeffs, GF256Element):
-            coeffs = coeffs.coeffs
-        self._coeffs = GF256Element.reduce(coeffs)
+            self._value = coeffs._value
+        else:
+            self._value = reduce_int(bits_to_int(coeffs), _M)
+
+    @staticmethod
+    def _from_int(value):
+        """
+        Wrap an integer already known to be in range(256), skipping validation.
+        """
+        x = object.__new__(GF256Element)
+        x._value = value
+        return x
 
     @staticmethod
     def one():
-        return GF256Element([1])
+        return GF256Element._from_int(1)
 
     @staticmethod
     def zero():
-        return GF256Element([0])
+        return GF256Element._from_int(0)
 
     @staticmethod
     def reduce(coeffs):
@@ -66,9 +243,15 @@ class GF256Element:
 
     @property
     def coeffs(self):
-        return self._coeffs
+        return int_to_bits(self._value)
+
+    @property
+    def value(self):
+        return self._value
 
     def __getitem__(self, key):
+        if isinstance(key, int) and 0 <= key < 8:
+            return (self._value >> key) & 1
         return self.coeffs[key]
 
     def __repr__(self):
@@ -95,7 +278,7 @@ class GF256Element:
             >>> res == [True] * trials
             True
         """
-        return GF256Element([(self.coeffs[i] + other.coeffs[i]) % 2 for i in range(8)])
+        return GF256Element._from_int(self._value ^ other._value)
 
     def __mul__(self, other):
         """
@@ -111,15 +294,7 @@ class GF256Element:
             >>> x*y == xy
             True
         """
-        # schoolbook
-        # x = self.coeffs
-        # y = other.coeffs
-        # xy = [0] * 16
-
-        # for j in range(8):
-        #     for i in range(8):
-        #         xy[i+j] += y[j] * x[i]
-        return GF256Element(self.mul_mod(self, other, GF256Element._m))
+        return GF256Element._from_int(_MUL[self._value][other._value])
 
     @staticmethod
     def mul_mod(self, other, min_poly):
@@ -135,17 +310,14 @@ class GF256Element:
             True
             >>> x*y == xy
             True
+            >>> GF256Element.mul_mod(x, y, [1, 0, 0, 0, 0, 0, 0, 0, 1])
+            [0, 1, 0, 0, 1, 0, 1, 0]
         """
+        if min_poly == GF256Element._m:
+            return int_to_bits(_MUL[int(self)][int(other)])
         # schoolbook
-        x = self.coeffs
-        y = other.coeffs
-        xy = [0] * 16
-
-        for j in range(8):
-            for i in range(8):
-                xy[i+j] += y[j] * x[i]
-
-        return GF256Element.reduce_mod_m(xy, min_poly)
+        xy = clmul(int(self), int(other))
+        return int_to_bits(reduce_int(xy, bits_to_int(min_poly)), len(min_poly) - 1)
 
     def __lshift__(self, shift):
         """
@@ -159,8 +331,7 @@ class GF256Element:
             >>> (z<<1) == zero
             True
         """
-        c = [0] + self.coeffs[:7]
-        return GF256Element(c)
+        return GF256Element._from_int((self._value << 1) & 0xff)
 
     def xtime(self):
         """
@@ -183,25 +354,24 @@ class GF256Element:
             >>> res2 == [True] * trials
             True
         """
-        up = self << 1
-        if self.coeffs[7] == 1:
-            return up + GF256Element([1,1,0,1,1])
-        else:
-            return up
+        a = self._value << 1
+        return GF256Element._from_int(a ^ _M if a & 0x100 else a)
 
     def __pow__(self, degree):
         """
-        SLOW: should do square/multiply
         TEST:
             >>> x = GF256Element([0, 1])
             >>> y = x.xtime()
             >>> y == x**2
             True
+            >>> x**0 == GF256Element.one()
+            True
+            >>> x**254 == x.inverse()
+            True
         """
-        acc = GF256Element.one()
-        for _ in range(degree):
-            acc *= self
-        return acc
+        if degree < 0:
+            degree = 0
+        return GF256Element._from_int(power(self._value, degree))
 
     def inverse(self):
         """
@@ -218,9 +388,7 @@ class GF256Element:
             >>> res == [True] * trials
             True
         """
-        cube = self * self**2
-        return (cube*cube**4*cube**16*self**64)**2
-        # return self ** 254
+        return GF256Element._from_int(_INV[self._value])
 
     def __eq__(self, other):
         """
@@ -238,9 +406,9 @@ class GF256Element:
             True
         """
         if isinstance(other, GF256Element):
-            return self.coeffs == other.coeffs
+            return self._value == other._value
         else:
-            return self.coeffs == GF256Element(other).coeffs
+            return self._value == GF256Element(other)._value
 
     def __ne__(self, other):
         """
@@ -270,19 +438,34 @@ class GF256Element:
             >>> res == [True] * trials
             True
         """
-        return sum([self[k] * (1 << k) for k in range(8)])
+        return self._value
 
 
 class GF256Poly:
 
     _f = [GF256Element.one(), GF256Element.zero(), GF256Element.zero(), GF256Element.zero(), GF256Element.one()]
 
+    __slots__ = ['_values']
+
     def __init__(self, coeffs):
-        self._coeffs = GF256Poly.reduce(coeffs)
+        self._values = GF256Poly.reduce_values([GF256Element(x)._value for x in coeffs])
+
+    @staticmethod
+    def _from_values(values):
+        """
+        Wrap a reduced list of 4 integers in range(256), skipping validation.
+        """
+        x = object.__new__(GF256Poly)
+        x._values = values
+        return x
 
     @property
     def coeffs(self):
-        return self._coeffs
+        return [GF256Element._from_int(v) for v in self._values]
+
+    @property
+    def values(self):
+        return list(self._values)
 
     def __getitem__(self, key):
         return self.coeffs[key]
@@ -316,14 +499,26 @@ class GF256Poly:
             >>> GF256Poly.reduce([0, 0, 0, 0, 1, GF256Element(123)]) == [1, GF256Element(123), 0, 0]
             True
         """
-        c = [GF256Element(x) for x in coeffs]
+        return [GF256Element._from_int(v) for v in GF256Poly.reduce_values([GF256Element(x)._value for x in coeffs])]
+
+    @staticmethod
+    def reduce_values(c):
+        """
+        Reduce a polynomial with integer coefficients modulo y^4 + 1.
+
+        TEST:
+            >>> GF256Poly.reduce_values([1])
+            [1, 0, 0, 0]
+            >>> GF256Poly.reduce_values([0, 0, 0, 0, 1, 123])
+            [1, 123, 0, 0]
+        """
+        c = list(c)
         if len(c) < 4:
-            c += [GF256Element.zero()] * (4 - len(c))
+            c += [0] * (4 - len(c))
 
+        # y^4 = 1 mod y^4 + 1
         for i in range(len(c)-1, 3, -1):
-            if c[i] != 0:
-                for j in range(5):
-                    c[i - 4 + j] += c[i] * GF256Poly._f[j]
+            c[i - 4] ^= c[i]
 
         return c[:4]
 
@@ -349,7 +544,7 @@ class GF256Poly:
             >>> res == [True] * trials
             True
         """
-        return GF256Poly([self.coeffs[i] + other.coeffs[i] for i in range(4)])
+        return GF256Poly._from_values([self._values[i] ^ other._values[i] for i in range(4)])
 
     def __mul__(self, other):
         """
@@ -369,15 +564,15 @@ class GF256Poly:
             >>> x*y == xy
             True
         """
-        # schoolbook
-        x = self.coeffs
-        y = other.coeffs
-        xy = [GF256Element.zero()] * 8
+        # schoolbook, reduced on the fly since y^(i+j) = y^((i+j) % 4)
+        x = self._values
+        xy = [0] * 4
 
-        for j in range(4):
+        for j, yj in enumerate(other._values):
+            row = _MUL[yj]
             for i in range(4):
-                xy[i+j] += y[j] * x[i]
-        return GF256Poly(xy)
+                xy[(i+j) % 4] ^= row[x[i]]
+        return GF256Poly._from_values(xy)
 
     def xtime(self):
         """
@@ -392,7 +587,7 @@ class GF256Poly:
             >>> res == [True] * trials
             True
         """
-        return GF256Poly([self.coeffs[3]] + self.coeffs[:3])
+        return GF256Poly._from_values([self._values[3]] + self._values[:3])
 
     def __eq__(self, other):
         """
@@ -408,9 +603,9 @@ class GF256Poly:
             True
         """
         if isinstance(other, GF256Poly):
-            return self.coeffs == other.coeffs
+            return self._values == other._values
         else:
-            return self.coeffs == GF256Poly(other).coeffs
+            return self._values == GF256Poly(other)._values
 
     def __ne__(self, other):
         """
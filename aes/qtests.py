@@ -1,40 +1,75 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-import qsharp
+import os
+import sys
+if "QSHARP_SERVER" not in os.environ:
+    # compiles the Q# project, unless run through ../qsharp_server.py test
+    import qsharp
 from gf256 import GF256Element, GF256Poly
 import aes
+# registers.py is shared with lowmc/ at the root of the repository
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _ROOT)
+from registers import encode_bytes, encode_columns, decode_bytes, decode_columns
+
+# inputs sent to the simulator by each call of a batched driver
+BATCH_SIZE = 4096
+
+
+def simulate_batched(op, inputs, batch_size=BATCH_SIZE, **kwargs):
+    """
+    Toffoli-simulates a batched driver operation (e.g. QTests.GF256.MulBatch), which maps arrays
+    of inputs to the array of their outputs, on slices of at most batch_size inputs at a time.
+    Returns the list of outputs.
+
+    :params op:         batched Q# operation
+    :params inputs:     dictionary mapping the array arguments of op to lists of equal length
+    :params batch_size: inputs per call to the simulator
+    :params kwargs:     other arguments of op, passed to every call
+    """
+    lengths = set(len(v) for v in inputs.values())
+    if len(lengths) != 1:
+        raise ValueError("input arrays of different lengths")
+    n = lengths.pop()
+    res = []
+    for start in range(0, n, batch_size):
+        batch = {name: v[start:start+batch_size] for name, v in inputs.items()}
+        res += op.toffoli_simulate(**batch, **kwargs)
+    return res
+
 
 class Tests:
 
     @staticmethod
     def Mul(unrolled=False, cost=False):
-        # """
-        # Slow exhaustive tests
-        # TESTS:
-        #     >>> Tests.Mul(unrolled=False)
-        #     Testing Mul (unrolled=False)
-        #     >>> Tests.Mul(unrolled=True)
-        #     Testing Mul (unrolled=True)
-        # """
+        """
+        Exhaustive tests
+        TESTS:
+            >>> Tests.Mul(unrolled=False)
+            Testing Mul (unrolled=False)
+            >>> Tests.Mul(unrolled=True)
+            Testing Mul (unrolled=True)
+        """
         print("%s Mul (unrolled=%s)" % ("Costing" if cost else "Testing", unrolled))
-        from QTests.GF256 import Mul # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import Mul # pylint: disable=no-name-in-module,import-error
+            x = GF256Element(0)
+            return Mul.estimate_resources(_a=x.coeffs, _b=x.coeffs, unrolled=unrolled)
+        from QTests.GF256 import MulBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256) for _y in range(256)]
+        ys = [GF256Element(_y) for _x in range(256) for _y in range(256)]
+        qxys = simulate_batched(MulBatch, {'_as': [x.coeffs for x in xs], '_bs': [y.coeffs for y in ys]}, unrolled=unrolled, costing=False)
         res = []
-        for _x in range(256):
-            for _y in range(256):
-                x = GF256Element(_x)
-                y = GF256Element(_y)
-                if cost:
-                    return Mul.estimate_resources(_a=x.coeffs, _b=y.coeffs, unrolled=unrolled)
-
-                xy = x*y
-                _xy = GF256Element(Mul.toffoli_simulate(_a=x.coeffs, _b=y.coeffs, unrolled=unrolled))
-                res.append(xy == _xy)
-                if (xy != _xy):
-                    print("Error")
-                    print("  x:", x)
-                    print("  y:", y)
-                    print(" xy:", xy)
-                    print("qxy:", _xy)
+        for x, y, qxy in zip(xs, ys, qxys):
+            xy = x*y
+            _xy = GF256Element(qxy)
+            res.append(xy == _xy)
+            if (xy != _xy):
+                print("Error")
+                print("  x:", x)
+                print("  y:", y)
+                print(" xy:", xy)
+                print("qxy:", _xy)
 
     @staticmethod
     def Square(in_place=False, cost=False):
@@ -46,15 +81,16 @@ class Tests:
             Testing Square (in_place=False)
         """
         print("%s Square (in_place=%s)" % ("Costing" if cost else "Testing", in_place))
-        from QTests.GF256 import Square # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import Square # pylint: disable=no-name-in-module,import-error
+            return Square.estimate_resources(_a=GF256Element(0).coeffs, in_place=in_place, costing=True)
+        from QTests.GF256 import SquareBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qxxs = simulate_batched(SquareBatch, {'_as': [x.coeffs for x in xs]}, in_place=in_place, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return Square.estimate_resources(_a=x.coeffs, in_place=in_place, costing=True)
-
+        for x, qxx in zip(xs, qxxs):
             xx = x*x
-            _xx = GF256Element(Square.toffoli_simulate(_a=x.coeffs, in_place=in_place, costing=False))
+            _xx = GF256Element(qxx)
             res.append(xx == _xx)
             if (xx != _xx):
                 print("Error")
@@ -72,15 +108,16 @@ class Tests:
             Testing Fourth (in_place=False)
         """
         print("%s Fourth (in_place=%s)" % ("Costing" if cost else "Testing", in_place))
-        from QTests.GF256 import Fourth # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import Fourth # pylint: disable=no-name-in-module,import-error
+            return Fourth.estimate_resources(_a=GF256Element(0).coeffs, in_place=in_place, costing=True)
+        from QTests.GF256 import FourthBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qxxs = simulate_batched(FourthBatch, {'_as': [x.coeffs for x in xs]}, in_place=in_place, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return Fourth.estimate_resources(_a=x.coeffs, in_place=in_place, costing=True)
-
+        for x, qxx in zip(xs, qxxs):
             xx = x**4
-            _xx = GF256Element(Fourth.toffoli_simulate(_a=x.coeffs, in_place=in_place, costing=False))
+            _xx = GF256Element(qxx)
             res.append(xx == _xx)
             if (xx != _xx):
                 print("Error")
@@ -96,15 +133,16 @@ class Tests:
             Testing Sixteenth
         """
         print("%s Sixteenth" % ("Costing" if cost else "Testing"))
-        from QTests.GF256 import Sixteenth # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import Sixteenth # pylint: disable=no-name-in-module,import-error
+            return Sixteenth.estimate_resources(_a=GF256Element(0).coeffs, costing=True)
+        from QTests.GF256 import SixteenthBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qx16s = simulate_batched(SixteenthBatch, {'_as': [x.coeffs for x in xs]}, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return Sixteenth.estimate_resources(_a=x.coeffs, costing=True)
-
+        for x, qx16 in zip(xs, qx16s):
             x16 = x**16
-            _x16 = GF256Element(Sixteenth.toffoli_simulate(_a=x.coeffs, costing=False))
+            _x16 = GF256Element(qx16)
             res.append(x16 == _x16)
             if (x16 != _x16):
                 print("Error")
@@ -120,15 +158,16 @@ class Tests:
             Testing SixtyFourth (in_place=True)
         """
         print("%s SixtyFourth (in_place=%s)" % ("Costing" if cost else "Testing", in_place))
-        from QTests.GF256 import SixtyFourth # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import SixtyFourth # pylint: disable=no-name-in-module,import-error
+            return SixtyFourth.estimate_resources(_a=GF256Element(0).coeffs, in_place=in_place, costing=True)
+        from QTests.GF256 import SixtyFourthBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qxxs = simulate_batched(SixtyFourthBatch, {'_as': [x.coeffs for x in xs]}, in_place=in_place, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return SixtyFourth.estimate_resources(_a=x.coeffs, in_place=in_place, costing=True)
-
+        for x, qxx in zip(xs, qxxs):
             xx = x**64
-            _xx = GF256Element(SixtyFourth.toffoli_simulate(_a=x.coeffs, in_place=in_place, costing=False))
+            _xx = GF256Element(qxx)
             res.append(xx == _xx)
             if (xx != _xx):
                 print("Error")
@@ -146,15 +185,16 @@ class Tests:
             Testing Inverse
         """
         print("%s Inverse" %("Costing" if cost else "Testing"))
-        from QTests.GF256 import Inverse # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.GF256 import Inverse # pylint: disable=no-name-in-module,import-error
+            return Inverse.estimate_resources(_a=GF256Element(0).coeffs, costing=True)
+        from QTests.GF256 import InverseBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qinvs = simulate_batched(InverseBatch, {'_as': [x.coeffs for x in xs]}, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return Inverse.estimate_resources(_a=x.coeffs, costing=True)
-
+        for x, qinv in zip(xs, qinvs):
             x16 = x.inverse()
-            _x16 = GF256Element(Inverse.toffoli_simulate(_a=x.coeffs, costing=False))
+            _x16 = GF256Element(qinv)
             res.append(x16 == _x16)
             if (x16 != _x16):
                 print("Error")
@@ -175,15 +215,16 @@ class Tests:
             Testing SBox(tower_field=True, LPS19=True)
         """
         print("%s SBox(tower_field=%s, LPS19=%s)" %("Costing" if cost else "Testing", tower_field, LPS19))
-        from QTests.AES import SBox # pylint: disable=no-name-in-module,import-error
+        if cost:
+            from QTests.AES import SBox # pylint: disable=no-name-in-module,import-error
+            return SBox.estimate_resources(_a=GF256Element(0).coeffs, tower_field=tower_field, LPS19=LPS19, costing=True)
+        from QTests.AES import SBoxBatch # pylint: disable=no-name-in-module,import-error
+        xs = [GF256Element(_x) for _x in range(256)]
+        qsboxes = simulate_batched(SBoxBatch, {'_as': [x.coeffs for x in xs]}, tower_field=tower_field, LPS19=LPS19, costing=False)
         res = []
-        for _x in range(256):
-            x = GF256Element(_x)
-            if cost:
-                return SBox.estimate_resources(_a=x.coeffs, tower_field=tower_field, LPS19=LPS19, costing=True)
-
+        for x, _qsbox in zip(xs, qsboxes):
             sbox = GF256Element(aes.SBox(x))
-            qsbox = GF256Element(SBox.toffoli_simulate(_a=x.coeffs, tower_field=tower_field, LPS19=LPS19, costing=False))
+            qsbox = GF256Element(_qsbox)
             res.append(sbox == qsbox)
             if (sbox != qsbox):
                 print("Error")
@@ -201,17 +242,13 @@ class Tests:
         """
         print("%s ByteSub" %("Costing" if cost else "Testing"))
         from QTests.AES import ByteSub # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
-        qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-        qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-        qstate = [ i for e in qstate for i in e ]
+        qstate = encode_columns(state['a'])
         if cost:
             return ByteSub.estimate_resources(_input_state=qstate, costing=True)
         aes.ByteSub(state)
         qstate = ByteSub.toffoli_simulate(_input_state=qstate, costing=False)
-        qstate = [ [bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+        qstate = decode_columns(qstate)
         assert(state['a'] == qstate)
 
     @staticmethod
@@ -223,17 +260,13 @@ class Tests:
         """
         print("%s ShiftRow" %("Costing" if cost else "Testing"))
         from QTests.AES import ShiftRow # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
-        qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-        qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-        qstate = [ i for e in qstate for i in e ]
+        qstate = encode_columns(state['a'])
         if cost:
             return ShiftRow.estimate_resources(_state=qstate, costing=True)
         aes.ShiftRow(state)
         qstate = ShiftRow.toffoli_simulate(_state=qstate, costing=False)
-        qstate = [ [bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+        qstate = decode_columns(qstate)
         assert(state['a'] == qstate)
 
     @staticmethod
@@ -254,22 +287,18 @@ class Tests:
         res = []
         for t in range(trials):
             word = list(map(GF256Element, map(int, [randint(0,255) for _ in range(4)])))
-            qword = [word[i].coeffs for i in range(4)]
-            qword = [e for sub in qword for e in sub]
+            qword = encode_bytes([int(w) for w in word])
 
             if cost:
                 return MixWord.estimate_resources(_word=qword, in_place=in_place, costing=True)
 
-            def bits_to_int(bits):
-                return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
-
             # Mixcols using GF256 library
             mix_cols_word = c * GF256Poly(word)
-            mix_cols_word = [bits_to_int(w.coeffs) for w in mix_cols_word]
+            mix_cols_word = [int(w) for w in mix_cols_word]
 
             # Mixcols using Q#
             qword = MixWord.toffoli_simulate(_word=qword, in_place=in_place, costing=False)
-            qword = [bits_to_int(qword[i*8:(i+1)*8]) for i in range(4)]
+            qword = decode_bytes(qword).tolist()
 
             res.append(mix_cols_word == qword)
         assert(res == [True] * trials)
@@ -292,22 +321,17 @@ class Tests:
         for _ in range(trials):
             state = {'Nb': 4, 'a': [[randint(0, 255) for _ in range(4)] for __ in range(4)]}
             # state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
-            qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-            qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-            qstate = [ i for e in qstate for i in e ]
+            qstate = encode_columns(state['a'])
 
             if cost:
                 return MixColumn.estimate_resources(_state=qstate, in_place=in_place, costing=True)
 
-            def bits_to_int(bits):
-                return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
-
             # Mixcols using GF256 library
             aes.MixColumn(state)
 
             # Mixcols using Q#
             qstate = MixColumn.toffoli_simulate(_state=qstate, in_place=in_place, costing=False)
-            qstate = [[bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+            qstate = decode_columns(qstate)
 
             res.append(state['a'] == qstate)
             if state['a'] != qstate:
@@ -325,24 +349,18 @@ class Tests:
         print("%s AddRoundKey" %("Costing" if cost else "Testing"))
         from random import randint
         from QTests.AES import AddRoundKey # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 128
         res = []
         for t in range(trials):
             state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
             key = [[randint(0, 255) for i in range(4)] for j in range(4)]
-            qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-            qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-            qstate = [ i for e in qstate for i in e ]
-            qkey = [[GF256Element(key[j][i]).coeffs for i in range(4)] for j in range(4)]
-            qkey = [ [e for sub in qkey[j] for e in sub] for j in range(4)]
-            qkey = [ i for e in qkey for i in e ]
+            qstate = encode_columns(state['a'])
+            qkey = encode_columns(key)
             if cost:
                 return AddRoundKey.estimate_resources(_state=qstate, _round_key=qkey)
             aes.AddRoundKey(state, key)
             qstate = AddRoundKey.toffoli_simulate(_state=qstate, _round_key=qkey)
-            qstate = [ [bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+            qstate = decode_columns(qstate)
             res.append(state['a'] == qstate)
         assert(res == [True] * trials)
 
@@ -369,21 +387,17 @@ class Tests:
             from QTests.AES import InPlaceKeyExpansion as KeyExpansion # pylint: disable=no-name-in-module,import-error
         else:
             from QTests.AES import KeyExpansion # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 1
         res = []
         for t in range(trials):
             key = {'Nb': 4, 'Nk': Nk, 'k': [ [randint(0, 255) for i in range(4)] for j in range(Nk)]}
-            qkey = [GF256Element(key['k'][j][i]).coeffs for j in range(Nk) for i in range(4)]
-            qkey = [e for sub in qkey for e in sub]
+            qkey = encode_columns(key['k'])
             if cost:
                 return KeyExpansion.estimate_resources(_key=qkey, Nr=Nr, Nk=Nk, costing=True)
 
             key = aes.KeyExpansion(key, Nr)
             qkey = KeyExpansion.toffoli_simulate(_key=qkey, Nr=Nr, Nk=Nk, costing=False)
-            qkey = [bits_to_int(qkey[i*8:(i+1)*8]) for i in range(len(qkey)//8)]
-            qkey = [qkey[i*4:(i+1)*4] for i in range(len(qkey)//4)]
+            qkey = decode_columns(qkey)
             qkey = [qkey[i*4:(i+1)*4] for i in range(len(qkey)//4)]
             if key != qkey:
                 print('c', key)
@@ -401,24 +415,18 @@ class Tests:
         print("%s Round(smart_wide=%s, round=%d, Nk=%d)" %("Costing" if cost else "Testing", smart_wide, round, Nk))
         from random import randint
         from QTests.AES import Round # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 32
         res = []
         for t in range(trials):
             state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
             key = [[randint(0, 255) for i in range(4)] for j in range(4)]
-            qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-            qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-            qstate = [ i for e in qstate for i in e ]
-            qkey = [[GF256Element(key[j][i]).coeffs for i in range(4)] for j in range(4)]
-            qkey = [ [e for sub in qkey[j] for e in sub] for j in range(4)]
-            qkey = [ i for e in qkey for i in e ]
+            qstate = encode_columns(state['a'])
+            qkey = encode_columns(key)
             if cost:
                 return Round.estimate_resources(_state=qstate, _round_key=qkey, round=round, smart_wide=smart_wide, Nk=Nk, in_place_mixcolumn=True, costing=True)
             aes.Round(state, key)
             qstate = Round.toffoli_simulate(_state=qstate, _round_key=qkey, round=round, smart_wide=smart_wide, Nk=Nk, in_place_mixcolumn=True, costing=False)
-            qstate = [ [bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+            qstate = decode_columns(qstate)
             res.append(state['a'] == qstate)
         assert(res == [True] * trials)
 
@@ -435,24 +443,18 @@ class Tests:
             pass
         else:
             from QTests.AES import FinalRound # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 32
         res = []
         for t in range(trials):
             state = {'Nb': 4, 'a': [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]}
             key = [[randint(0, 255) for i in range(4)] for j in range(4)]
-            qstate = [[GF256Element(state['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-            qstate = [ [e for sub in qstate[j] for e in sub] for j in range(4)]
-            qstate = [ i for e in qstate for i in e ]
-            qkey = [[GF256Element(key[j][i]).coeffs for i in range(4)] for j in range(4)]
-            qkey = [ [e for sub in qkey[j] for e in sub] for j in range(4)]
-            qkey = [ i for e in qkey for i in e ]
+            qstate = encode_columns(state['a'])
+            qkey = encode_columns(key)
             if cost:
                 return FinalRound.estimate_resources(_state=qstate, _round_key=qkey, smart_wide=smart_wide, Nr=Nr, costing=True)
             aes.FinalRound(state, key)
             qstate = FinalRound.toffoli_simulate(_state=qstate, _round_key=qkey, smart_wide=smart_wide, Nr=Nr, costing=False)
-            qstate = [ [bits_to_int(qstate[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+            qstate = decode_columns(qstate)
             res.append(state['a'] == qstate)
         assert(res == [True] * trials)
 
@@ -485,25 +487,19 @@ class Tests:
             from QTests.AES import SmartWideRijndael as Rijndael # pylint: disable=no-name-in-module,import-error
         else:
             from QTests.AES import WideRijndael as Rijndael # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 4
         res = []
         for t in range(trials):
             message = {'Nb': 4, 'a': [[randint(0, 255) for i in range(4)] for j in range(4)]}
             key = {'Nb': 4, 'Nk': Nk, 'k': [ [randint(0, 255) for i in range(4)] for j in range(Nk)]}
-            qmessage = [[GF256Element(message['a'][j][i]).coeffs for i in range(4)] for j in range(4)]
-            qmessage = [ [e for sub in qmessage[j] for e in sub] for j in range(4)]
-            qmessage = [ i for e in qmessage for i in e ]
-            qkey = [[GF256Element(key['k'][j][i]).coeffs for i in range(4)] for j in range(Nk)]
-            qkey = [ [e for sub in qkey[j] for e in sub] for j in range(Nk)]
-            qkey = [ i for e in qkey for i in e ]
+            qmessage = encode_columns(message['a'])
+            qkey = encode_columns(key['k'])
             if cost:
                 return Rijndael.estimate_resources(_message=qmessage, _key=qkey, Nr=Nr, Nk=Nk, in_place_mixcolumn=in_place_mixcolumn, costing=True)
             # qstate = [e for sub in qstate for e in sub]
             aes.InnerRijndael(key, message, Nb=4, Nk=Nk, Nr=Nr)
             qmessage = Rijndael.toffoli_simulate(_message=qmessage, _key=qkey, Nr=Nr, Nk=Nk, in_place_mixcolumn=in_place_mixcolumn, costing=False)
-            qmessage = [ [bits_to_int(qmessage[j][i*8:(i+1)*8]) for i in range(4)] for j in range(4)]
+            qmessage = decode_columns(qmessage)
             if message['a'] != qmessage:
                 print('c', message['a'])
                 print('q', qmessage)
@@ -550,20 +546,14 @@ class Tests:
         from random import randint
         if smart_wide:
             from QTests.AES import SmartWideGroverOracle as GroverOracle # pylint: disable=no-name-in-module,import-error
-        def bits_to_int(bits):
-            return sum([1 << i if bits[i] == 1 else 0 for i in range(8)])
         trials = 10
         res = []
         for t in range(trials):
             message = {'Nb': 4, 'a': [[randint(0, 255) for i in range(4)] for j in range(4*pairs)]}
-            qmessage = [[GF256Element(message['a'][j][i]).coeffs for i in range(4)] for j in range(4*pairs)]
-            qmessage = [ [e for sub in qmessage[j] for e in sub] for j in range(4*pairs)]
-            qmessage = [ i for e in qmessage for i in e ]
+            qmessage = encode_columns(message['a'])
 
             key = {'Nb': 4, 'Nk': Nk, 'k': [ [randint(0, 255) for i in range(4)] for j in range(Nk)]}
-            qkey = [[GF256Element(key['k'][j][i]).coeffs for i in range(4)] for j in range(Nk)]
-            qkey = [ [e for sub in qkey[j] for e in sub] for j in range(Nk)]
-            qkey = [ i for e in qkey for i in e ]
+            qkey = encode_columns(key['k'])
 
             # compute p-c pairs
             ciphertexts = []
@@ -572,9 +562,7 @@ class Tests:
                 aes.InnerRijndael(key, ciphertext, Nb=4, Nk=Nk, Nr=Nr)
                 ciphertexts.append(ciphertext)
 
-            target_ciphertext = [[GF256Element(c['a'][j][i]).coeffs for i in range(4)] for c in ciphertexts for j in range(4)]
-            target_ciphertext = [ [e for sub in target_ciphertext[j] for e in sub] for j in range(4*pairs)]
-            target_ciphertext = [ i for e in target_ciphertext for i in e ]
+            target_ciphertext = encode_columns([column for c in ciphertexts for column in c['a']])
 
             # test also that we correctly fail to identify wrong keys
             flip = bool(randint(0, 1))
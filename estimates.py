@@ -0,0 +1,141 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Resource estimates written by the Q# drivers (aes/Driver.cs, lowmc/Driver.cs) into numbers/*.csv,
+indexed by (operation, Nk or security category, MixColumn variant, r), where r is the number of
+plaintext-ciphertext pairs of a Grover oracle or the round of a round operation. Parts a row
+name does not give are None, e.g.
+
+    QAES.SmartWide.GroverOracle_128_in-place-MC_r1  ->  ("QAES.SmartWide.GroverOracle", 4, "in-place", 1)
+    QLowMC.GroverOracle_l1_r2                       ->  ("QLowMC.GroverOracle", 1, None, 2)
+    QLowMC.InPlace.L1.AffineLayer_r5                ->  ("QLowMC.InPlace.L1.AffineLayer", None, None, 5)
+
+Files are parsed once, and parsed again when they change on disk, so that running the
+estimators again is enough to update the cost tables.
+
+TESTS:
+    >>> aes = load(AES_CSV)
+    >>> row = aes.row("QAES.SmartWide.GroverOracle", 4, "in-place", 1)
+    >>> row.GD, row.W, row.G, row.t_depth
+    (2816, 1665, 445376, 121)
+    >>> load(LOWMC_CSV).row("QLowMC.GroverOracle", 5, None, 2).G
+    10212595
+    >>> load(AES_CSV) is aes
+    True
+"""
+
+import collections
+import csv
+import os
+import re
+
+NUMBERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "numbers")
+AES_CSV = os.path.join(NUMBERS, "aes.csv")
+LOWMC_CSV = os.path.join(NUMBERS, "lowmc.csv")
+
+# columns of the CSV files, in order
+COLUMNS = ["operation", "cnot", "clifford", "t", "r_count", "m", "t_depth", "initial_width", "extra_width", "comment", "full_depth"]
+
+
+class Row(collections.namedtuple("Row", COLUMNS)):
+    """
+    A line of estimates, with the figures used by the Grover cost model.
+    """
+    __slots__ = ()
+
+    @property
+    def G(self):
+        """
+        Gate count, CNOT + 1-qubit Clifford + T + measurements.
+        """
+        return self.cnot + self.clifford + self.t + self.m
+
+    @property
+    def W(self):
+        """
+        Width, initial + extra qubits.
+        """
+        return self.initial_width + self.extra_width
+
+    @property
+    def GD(self):
+        """
+        Full depth.
+        """
+        return self.full_depth
+
+
+_NAME = re.compile(r"^(?P<op>[^_]+)(?:_(?:(?P<k>\d+)|l(?P<l>\d+)))?(?:_(?P<mc>[a-z-]+)-MC)?(?:_r(?P<r>\d+))?$")
+
+
+def key(name):
+    """
+    Index key of an operation name.
+
+    TESTS:
+        >>> key("QAES.SmartWide.GroverOracle_256_maximov-MC_r3")
+        ('QAES.SmartWide.GroverOracle', 8, 'maximov', 3)
+        >>> key("QLowMC.Encrypt_l5"), key("QGF256.Mul")
+        (('QLowMC.Encrypt', 5, None, None), ('QGF256.Mul', None, None, None))
+    """
+    m = _NAME.match(name)
+    if m is None:
+        return (name, None, None, None)
+    size = None
+    if m.group("k") is not None:
+        # AES key length, in 32-bit words
+        size = int(m.group("k")) // 32
+    elif m.group("l") is not None:
+        size = int(m.group("l"))
+    r = int(m.group("r")) if m.group("r") is not None else None
+    return (m.group("op"), size, m.group("mc"), r)
+
+
+class Estimates(object):
+    """
+    Rows of an estimates file, indexed by key().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = []
+        self.index = {}
+        with open(path, newline="") as f:
+            reader = csv.reader(f, skipinitialspace=True)
+            next(reader)
+            for line in reader:
+                if not line:
+                    continue
+                values = [line[0]] + [int(v) for v in line[1:9]] + [line[9], int(line[10])]
+                row = Row(*values)
+                self.rows.append(row)
+                self.index.setdefault(key(row.operation), []).append(row)
+
+    def row(self, operation, size=None, variant=None, r=None):
+        """
+        The row with the given key. Raises KeyError if there is none, ValueError if several
+        rows share the key (e.g. rounds told apart only by their comment).
+        """
+        rows = self.index[(operation, size, variant, r)]
+        if len(rows) > 1:
+            raise ValueError("%d rows for %s" % (len(rows), (operation, size, variant, r)))
+        return rows[0]
+
+
+_loaded = {}
+
+
+def load(path):
+    """
+    Estimates of a CSV file, parsed again only if the file changed since the last call.
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    if path not in _loaded or _loaded[path][0] != version:
+        _loaded[path] = (version, Estimates(path))
+    return _loaded[path][1]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,182 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Vectorised evaluation of the inner parallelisation cost model of parallel_grover.GroverDWCost
+over grids of design points (MAXDEPTH, key length, r, p, oracle depth, width and gate count).
+
+Everything is computed in double precision with NumPy, which is more than enough for the
+reported figures, except where a floor or a ceiling lands next to an integer (for instance
+whether S is 1 or 2, which switches between serial and parallel Grover, or floor(MD/GD) when GD
+divides MD). Such points are evaluated again one by one by parallel_grover in high precision,
+and flagged in the 'exact' field of the result.
+
+    >>> res = sweep_grid(log_md=[40, 64, 96], key_length=[128, 192, 256], r=[1, 2, 3], gd=2816, gw=1665, gg=445376)
+    >>> len(res), res.dtype.names[:4]
+    (27, ('log_md', 'key_length', 'r', 'p'))
+"""
+import numpy as np
+
+# bits of precision used near boundaries, as parallel_grover's RealField(1000)
+PRECISION = 1000
+
+DTYPE = np.dtype([
+    ('log_md', np.int32),       # log2(MAXDEPTH)
+    ('key_length', np.int32),   # k, search space of size N = 2^k
+    ('r', np.int32),            # plaintext-ciphertext pairs
+    ('p', np.float64),          # target success probability
+    ('gd', np.float64),         # oracle depth
+    ('gw', np.float64),         # oracle width
+    ('gg', np.float64),         # oracle gate count
+    ('block_size', np.int32),   # n, for the spurious key probability
+    ('iterations', np.float64), # Grover iterations of a single instance searching the whole space
+    ('S', np.float64),          # parallel instances
+    ('D', np.float64),          # depth
+    ('W', np.float64),          # width, S * gw
+    ('G_cost', np.float64),
+    ('DW_cost', np.float64),
+    ('log2_skp', np.float64),   # log2 of the spurious key probability, -inf if 0
+    ('exact', np.bool_),        # evaluated in high precision
+])
+
+_INPUTS = DTYPE.names[:8]
+_OUTPUTS = DTYPE.names[8:15]
+
+# above this, floor or ceil being off by one changes the results by less than 1e-9 relative
+_LARGE = 2.0 ** 30
+
+
+def _near_integer(x):
+    """
+    True where rounding errors of a few ulps could move floor(x) or ceil(x) by one, and it
+    would matter.
+    """
+    return (np.abs(x) < _LARGE) & (np.abs(x - np.rint(x)) <= 64 * np.finfo(np.float64).eps * np.abs(x))
+
+
+def sweep(log_md, key_length, r, gd, gw, gg, p=1, block_size=128, prec=PRECISION):
+    """
+    Evaluates the cost model at every design point. Arguments are scalars or arrays, broadcast
+    against each other, and the result is a flat structured array with dtype DTYPE.
+
+    :params log_md:     log2(MAXDEPTH)
+    :params key_length: key length k
+    :params r:          number of plaintext-ciphertext pairs
+    :params gd:         depth of the Grover oracle for r pairs
+    :params gw:         width of the Grover oracle for r pairs
+    :params gg:         gate count of the Grover oracle for r pairs
+    :params p:          target success probability
+    :params block_size: block size n, equal to k for LowMC
+    :params prec:       bits of precision for points close to a boundary
+
+    TESTS:
+        >>> res = sweep(log_md=[40, 64, 96], key_length=128, r=1, gd=2816, gw=1665, gg=445376)
+        >>> [round(float(np.log2(s)), 2) for s in res['S']], res['exact'].tolist()
+        ([70.22, 22.22, 0.0], [False, False, False])
+        >>> bool(np.isclose(res['D'][2], res['iterations'][2] * 2816)), bool(res['W'][0] == res['S'][0] * 1665)
+        (True, True)
+        >>> res = sweep(log_md=[40, 64, 96], key_length=[128, 192, 256], r=[[1], [2], [3]], gd=[2816, 2978, 3353], gw=1665, gg=445376)
+        >>> slow = np.array([_point(*pt, prec=200) for pt in res[list(_INPUTS)].tolist()])
+        >>> bool(np.allclose(np.array(res[list(_OUTPUTS)].tolist()), slow, rtol=1e-12, atol=1e-9))
+        True
+        >>> from parallel_grover import GroverCost, R
+        >>> res = sweep(log_md=96, key_length=129, r=1, gd=2816, gw=1665, gg=445376)
+        >>> c = GroverCost(129, 96, 1, 1, 2816, 1665, 445376, 128, R)
+        >>> float(res['S'][0]), bool(np.isclose(res['G_cost'][0], float(c["G_cost"]), rtol=1e-12))
+        (1.0, True)
+        >>> res = sweep(log_md=40, key_length=80, r=1, gd=[2**20, 3 * 2**20], gw=1, gg=1)
+        >>> res['exact'].tolist()
+        [True, False]
+    """
+    args = np.broadcast_arrays(*[np.asarray(a) for a in (log_md, key_length, r, p, gd, gw, gg, block_size)])
+    res = np.zeros(args[0].size, dtype=DTYPE)
+    for name, a in zip(_INPUTS, args):
+        res[name] = a.ravel()
+    if len(res) == 0:
+        return res
+
+    lmd = res['log_md'].astype(np.float64)
+    lk = res['key_length'].astype(np.float64)
+    p = res['p']
+    gd, gw, gg = res['gd'], res['gw'], res['gg']
+    N = np.exp2(lk)
+    MD = np.exp2(lmd)
+
+    # iterations(p, N, 1)
+    asp = np.arcsin(np.sqrt(p))
+    it = (asp / np.arcsin(np.sqrt(1 / N)) - 1) / 2
+    D = np.minimum(it * gd, MD)
+
+    # instances(GD, N, MD, p)
+    q = MD / gd
+    unsafe = _near_integer(q)
+    j = np.floor(q)
+    x = N * (np.pi / (2 * (2 * j + 1))) ** 2
+    unsafe |= _near_integer(x)
+    S = np.ceil(x)
+    y = N * (asp / (2 * j + 1)) ** 2
+    unsafe |= (p != 1) & (_near_integer(y) | _near_integer(p * S))
+    S = np.where(p == 1, S, np.minimum(np.ceil(y), np.ceil(p * S)))
+
+    # spurious_keys_probability(k, n, r, S) = 1 - exp(-x), for tiny x it is x up to relative error x
+    with np.errstate(over='ignore', divide='ignore'):
+        log2_x = lk - res['block_size'] * res['r'] - np.log2(S)
+        skp = np.log2(-np.expm1(-np.exp2(np.minimum(log2_x, 1000))))
+        log2_skp = np.where(log2_x < -60, log2_x, skp)
+
+    c_p = np.pi / 4
+    parallel = S > 1
+    G_cost = np.where(parallel, c_p ** 2 * np.exp2(lk - lmd) * gd * gg, np.floor(c_p * np.exp2(lk / 2)) * gg)
+    DW_cost = np.where(parallel, c_p ** 2 * np.exp2(lk - lmd) * gd ** 2 * gw, gw * D)
+
+    for name, a in zip(_OUTPUTS, (it, S, D, S * gw, G_cost, DW_cost, log2_skp)):
+        res[name] = a
+
+    # points next to a boundary are computed again
+    for i in np.flatnonzero(unsafe):
+        pt = [res[name][i].item() for name in _INPUTS]
+        for name, v in zip(_OUTPUTS, _point(*pt, prec=prec)):
+            res[name][i] = v
+        res['exact'][i] = True
+    return res
+
+
+def sweep_grid(prec=PRECISION, **axes):
+    """
+    Evaluates the cost model on the cartesian product of the values given for every argument
+    of sweep, ordered as for nested loops over the arguments in the order of sweep.
+
+    TESTS:
+        >>> res = sweep_grid(log_md=[40, 64], key_length=[128, 256], r=[1, 2], gd=100, gw=1, gg=1)
+        >>> [tuple(pt) for pt in res[['log_md', 'key_length', 'r']][:3].tolist()]
+        [(40, 128, 1), (40, 128, 2), (40, 256, 1)]
+    """
+    names = [name for name in ('log_md', 'key_length', 'r', 'gd', 'gw', 'gg', 'p', 'block_size') if name in axes]
+    unknown = set(axes) - set(names)
+    if unknown:
+        raise TypeError("unknown arguments %s" % ", ".join(sorted(unknown)))
+    grids = np.meshgrid(*[np.atleast_1d(axes[name]) for name in names], indexing='ij')
+    return sweep(prec=prec, **dict(zip(names, grids)))
+
+
+def _point(log_md, key_length, r, p, gd, gw, gg, block_size, prec=PRECISION):
+    """
+    Outputs of sweep for a single point, computed by parallel_grover with prec bits of precision.
+    """
+    import contextlib, io
+    from mpmath import MPContext
+    from parallel_grover import GroverCost
+
+    ctx = MPContext()
+    ctx.prec = prec
+    # integral depths keep floor(MD/GD) exact
+    gd = int(gd) if float(gd).is_integer() else gd
+    # instances() prints notes meant for the tables
+    with contextlib.redirect_stdout(io.StringIO()):
+        c = GroverCost(key_length, log_md, r, p, gd, gw, gg, block_size, ctx)
+    log2_skp = ctx.log(c["skp"], 2) if c["skp"] > 0 else -np.inf
+    return tuple(float(v) for v in (c["iterations"], c["S"], c["D"], c["W"], c["G_cost"], c["DW_cost"], log2_skp))
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
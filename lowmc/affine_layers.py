@@ -1,175 +1,212 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-from sage.all import GF, matrix
-from plu_decomposition import PermutationToREWIRE, LowerTriangularToCNOT, UpperTriangularToCNOT
-import L1, L3, L5
-import L0
-import os
+from plu_decomposition import PermutationToREWIRE, TranspositionsToREWIRE, CNOTsToQSharp, Synthesize, SYNTHESIS, CNOTCount, CNOTDepth, ScheduleCNOTs, ScheduleParts
+from plu_decomposition import RelabelCNOTs, PermuteLayout, FixLayout
+from gf2 import Matrix
+from lowmc_scheme import LowMCScheme, CATEGORIES
+from manifest import Manifest, input_hash, source_hash
+from codegen import run, CodeWriter
+import plu_decomposition, gf2, manifest, codegen
 """
 Due to large compile times for long operations, it appears more efficient to break the affine layer
 into smaller operations.
 """
 
-import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument("-s", "--single_file", action="store_true", help="combine output into a single Q# file")
-parser.add_argument("--cnots", action="store_true", help="list explicitly all cnots for L and U")
-parser.add_argument("-c", "--category", type=int, default=-1, help="generate code only a single security category")
-args = parser.parse_args()
-
-single_file = args.single_file
-categories = {
-    0: (L0, "L0"),
-    1: (L1, "L1"),
-    3: (L3, "L3"),
-    5: (L5, "L5"),
-}
-use_apply_each = not args.cnots
-
-if args.category == -1:
-    schemes = categories.values()
-else:
-    try:
-        schemes = [categories[args.category]]
-    except:
-        print "Security category %d not available" % args.category
-
-K = GF(2)
-
-for params in schemes:
-    L, L_name = params
-    lm = [matrix(K, L.LM[_]) for _ in range(len(L.LM))]
-    b = L.b
-
-    if single_file:
-        if os.path.exists('affine_layers_%s.qs' % L_name):
-            os.remove('affine_layers_%s.qs' % L_name)
-
-    for i in range(len(lm)):
-    # for i in range(3):
-        code = """\nnamespace QLowMC.InPlace.%s
+
+def AffineLayerRound(L_name, i, lm, b, blocksize, synth="plu", schedule=False, use_apply_each=True):
+    """
+    Q# code for the affine layer of round i+1, and a line reporting its CNOT count and depth.
+    Only takes plain lists and ints, so that it can run in a worker process.
+    """
+    out = CodeWriter()
+    out.write("""\nnamespace QLowMC.InPlace.%s
     {
         open Microsoft.Quantum.Intrinsic;
         open Microsoft.Quantum.Canon;
         open QUtilities;
-    """ % L_name
-
-        M = lm[i]
-        P, L, U = M.LU()
-
-        # print U
+    """ % L_name)
 
-        if use_apply_each:
-            # using ApplyToEachA
-            code += """
-            operation AffineLayerRound%dU(state: Qubit[], costing: Bool) : Unit
-            {
-                body (...)
-                {
-                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, state), [\n""" % (i+1)
-            code += UpperTriangularToCNOT(U, tabs=5)
-            code += """                ]);
-                }
-                adjoint auto;
-            }\n"""
-        else:
-            # list all cnots
-            code += """
-            operation AffineLayerRound%dU(state: Qubit[], costing: Bool) : Unit
-            {
-                body (...)
-                {\n""" % (i + 1)
-            code += UpperTriangularToCNOT(U, tabs=3, use_apply_each=False)
-            code += """        }
-                adjoint auto;
-            }\n"""
+    parts, perm = Synthesize(Matrix(lm, blocksize), method=synth)
+    layers = [None] * len(parts)
+    if schedule:
+        parts, layers = ScheduleParts(parts, blocksize)
+    report = "%s round %d: %d CNOTs, CNOT depth %d (%s%s)" % (L_name, i+1, CNOTCount(parts), CNOTDepth(parts, blocksize), synth, ", scheduled" if schedule else "")
 
-        # print L
+    for (part, cnots), part_layers in zip(parts, layers):
         if use_apply_each:
             # using ApplyToEachA
-            code += """
-            operation AffineLayerRound%dL(state: Qubit[], costing: Bool) : Unit
+            out.write("""
+            operation AffineLayerRound%d%s(state: Qubit[], costing: Bool) : Unit
             {
                 body (...)
                 {
-                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, state), [\n""" % (i+1)
-            code += LowerTriangularToCNOT(L, tabs=5)
-            code += """                ]);
+                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, state), [\n""" % (i+1, part))
+            out.write(CNOTsToQSharp(cnots, tabs=5, layers=part_layers))
+            out.write("""                ]);
                 }
                 adjoint auto;
-            }\n"""
+            }\n""")
         else:
             # list all cnots
-            code += """
-            operation AffineLayerRound%dL(state: Qubit[], costing: Bool) : Unit
+            out.write("""
+            operation AffineLayerRound%d%s(state: Qubit[], costing: Bool) : Unit
             {
                 body (...)
-                {\n""" % (i + 1)
-            code += LowerTriangularToCNOT(L, tabs=3, use_apply_each=False)
-            code += """        }
+                {\n""" % (i + 1, part))
+            out.write(CNOTsToQSharp(cnots, tabs=3, use_apply_each=False, layers=part_layers))
+            out.write("""        }
                 adjoint auto;
-            }\n"""
-
+            }\n""")
 
-        # print P
-        code += """
+    # print P
+    out.write("""
         operation AffineLayerRound%dP(state: Qubit[], costing: Bool) : Unit
         {
             body (...)
-            {\n""" % (i + 1)
-        code += PermutationToREWIRE(P, tabs=3)
-        code += """        }
+            {\n""" % (i + 1))
+    out.write(PermutationToREWIRE(perm, tabs=3))
+    out.write("""        }
             adjoint auto;
-        }\n"""
+        }\n""")
 
-        # print the constant added after multiplication
-        code += """
+    # print the constant added after multiplication
+    out.write("""
         operation AffineLayerRound%dConstantAddition(state: Qubit[], costing: Bool) : Unit
         {
             body (...)
-            {\n""" % (i + 1)
-        for j in range(len(b[i])):
-            if b[i][j] == 1:
-                code += "            X(state[%d]);\n" % (j)
-        code += "        }\n"
-        code += "        adjoint auto;\n"
-        code += "    }"
-        code += "\n"
-
-
-        # full affine operation
-        code +="""
+            {\n""" % (i + 1))
+    for j in range(len(b)):
+        if b[j] == 1:
+            out.write("            X(state[%d]);\n" % (j))
+    out.write("        }\n")
+    out.write("        adjoint auto;\n")
+    out.write("    }")
+    out.write("\n")
+
+
+    # full affine operation
+    out.write("""
         operation AffineLayerRound%d(state: Qubit[], costing: Bool) : Unit
+        {
+            body (...)
+            {\n""" % (i+1))
+    for part in [part for part, _ in parts] + ["P", "ConstantAddition"]:
+        out.write("                AffineLayerRound%d%s(state, costing);\n" % (i+1, part))
+    out.write("""            }
+            adjoint auto;
+        }\n}""")
+
+    return out.getvalue(), report
+
+
+def FusedRound(L_name, i, lm, b, ikm, blocksize, synth="plu", schedule=False, use_apply_each=True, layouts=None, lanes=None, synthesis=None):
+    """
+    Q# code for AffineLayerKeyAdditionRound<i+1>(state, round_key, costing), which does the
+    in-place key expansion round_key <- IKM[i+1] * round_key, the affine layer on state and the
+    round key addition in a single operation, and a line reporting its gate counts.
+
+    The operation works on qubits = state + round_key. The permutations left by the synthesis of
+    both matrices are not applied in between: the constant addition and the round key addition
+    address the qubits where the permutations leave them, and the qubits are only swapped at the
+    end. Relabelled rounds (from --relabel) leave entries away from their qubits for the next
+    round to pick up, so they only compute the right thing when run in order from round 1, as
+    AllRounds does.
+
+    :params layouts:    (state, round key) layouts at the start of the round, as left by the
+                        previous round (see RoundLayouts), or None if all entries are in place
+    :params lanes:      state entries that have to be in place at the end of the round, the round
+                        key being left as it is, or None to put every entry of both back in place
+    :params synthesis:  FusedRoundSynthesis of the round, if already computed
+    """
+    out = CodeWriter()
+    n = blocksize
+    state_layout, key_layout = layouts or (list(range(n)), list(range(n)))
+    if synthesis is None:
+        synthesis = FusedRoundSynthesis(lm, ikm, n, synth)
+    (state_parts, state_perm), (key_parts, key_perm) = synthesis
+
+    # round_key[j] is qubits[n + j]
+    cnots = [g for _, part in key_parts for g in RelabelCNOTs(part, key_layout, n)]
+    cnots += [g for _, part in state_parts for g in RelabelCNOTs(part, state_layout)]
+    state_at = PermuteLayout(state_layout, state_perm)
+    key_at = PermuteLayout(key_layout, key_perm)
+    cnots += [(n + key_at[j], state_at[j]) for j in range(n)]
+    xs = [state_at[j] for j in range(n) if b[j] == 1]
+    swaps, _ = FixLayout(state_at, lanes)
+    if lanes is None:
+        swaps += [(n + c, n + t) for c, t in FixLayout(key_at)[0]]
+
+    layers = None
+    if schedule:
+        cnots, layers = ScheduleCNOTs(cnots, 2 * n)
+    report = "%s round %d: %d CNOTs, %d X, %d REWIREs, CNOT depth %d (%s, fused%s%s)" % (
+        L_name, i+1, len(cnots), len(xs), len(swaps), CNOTDepth([("", cnots)], 2 * n), synth,
+        ", scheduled" if schedule else "", ", relabelled" if layouts is not None or lanes is not None else "")
+
+    out.write("""\nnamespace QLowMC.InPlace.%s
+    {
+        open Microsoft.Quantum.Intrinsic;
+        open Microsoft.Quantum.Canon;
+        open QUtilities;
+
+        operation AffineLayerKeyAdditionRound%d(state: Qubit[], round_key: Qubit[], costing: Bool) : Unit
         {
             body (...)
             {
-                %sAffineLayerRound%dU(state, costing);
-                %sAffineLayerRound%dL(state, costing);
-                %sAffineLayerRound%dP(state, costing);
-                %sAffineLayerRound%dConstantAddition(state, costing);
-            }
+                let qubits = state + round_key;\n""" % (L_name, i+1))
+    if use_apply_each:
+        out.write("""                ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, qubits), [\n""")
+        out.write(CNOTsToQSharp(cnots, tabs=5, layers=layers))
+        out.write("""                ]);\n""")
+    else:
+        out.write(CNOTsToQSharp(cnots, bufname="qubits", tabs=4, use_apply_each=False, layers=layers))
+    out.write("".join("                X(qubits[%d]);\n" % j for j in xs))
+    out.write(TranspositionsToREWIRE(swaps, bufname="qubits", tabs=4))
+    out.write("""            }
             adjoint auto;
-        }\n}""" % (
-            i+1,
-            "", # "// ", # if i < 3 else "// ",
-            i+1,
-            "", # "// ", # if i < 3 else "// ",
-            i+1,
-            "", # "// ", # if i < 3 else "// ",
-            i+1,
-            "", # if i < 3 else "// ",
-            i+1
-        )
+        }
+    }""")
 
-        if single_file:
-            with open('affine_layers_%s.qs' % (L_name), 'a') as f:
-                f.write(code)
-        else:
-            with open('affine_layers_%s_Round%d.qs' % (L_name, i+1), 'w') as f:
-                f.write(code)
+    return out.getvalue(), report
+
+
+def FusedRoundSynthesis(lm, ikm, blocksize, synth="plu"):
+    """
+    (CNOT parts, permutation) of the affine layer and key expansion matrices of a fused round.
+    The permutations determine where the round leaves the entries of the state and round key.
+    """
+    return Synthesize(Matrix(lm, blocksize), method=synth), Synthesize(Matrix(ikm, blocksize), method=synth)
+
+
+def RoundLayouts(layouts, perms, lanes=None):
+    """
+    (state, round key) layouts at the end of FusedRound(..., layouts=layouts, lanes=lanes),
+    given the permutations (state, round key) of the FusedRoundSynthesis of the round.
+
+    TESTS:
+        >>> RoundLayouts(([0, 1, 2, 3], [0, 1, 2, 3]), ([3, 2, 1, 0], [1, 0, 2, 3]), lanes=[3])
+        ([0, 2, 1, 3], [1, 0, 2, 3])
+        >>> RoundLayouts(([0, 1, 2, 3], [0, 1, 2, 3]), ([3, 2, 1, 0], [1, 0, 2, 3]))
+        ([0, 1, 2, 3], [0, 1, 2, 3])
+    """
+    state_layout, key_layout = layouts
+    state_perm, key_perm = perms
+    state_layout = FixLayout(PermuteLayout(state_layout, state_perm), lanes)[1]
+    key_layout = PermuteLayout(key_layout, key_perm)
+    if lanes is None:
+        key_layout = FixLayout(key_layout)[1]
+    return state_layout, key_layout
 
-    # muxer
-    code = """\nnamespace QLowMC.InPlace.%s
+
+def AffineLayerMuxer(L_name, rounds, fused=False):
+    """
+    Q# code for AffineLayer(state, round, costing), calling the operation of the given round,
+    and for AffineLayerKeyAddition(state, round_key, round, costing), doing the key expansion,
+    the affine layer and the key addition of a round. The latter calls the fused operations if
+    they have been generated, or KeyExpansion and AffineLayer otherwise.
+    """
+    out = CodeWriter()
+    out.write("""\nnamespace QLowMC.InPlace.%s
     {
         open Microsoft.Quantum.Intrinsic;
         open QUtilities;
@@ -178,25 +215,155 @@ for params in schemes:
         {
             body (...)
             {
-                if""" % L_name
+                if""" % L_name)
 
-    for i in range(len(lm)):
-        code += "(round == %d)\n" % (i+1)
-        code += "            {\n"
-        code += "                %sAffineLayerRound%d(state, costing);\n" % (
+    for i in range(rounds):
+        out.write("(round == %d)\n" % (i+1))
+        out.write("            {\n")
+        out.write("                %sAffineLayerRound%d(state, costing);\n" % (
             "", # if i < 3 else "// ",
             i+1
-            )
-        code += "            }"
-        if i < len(lm) - 1:
-            code += "\n            elif "
+            ))
+        out.write("            }")
+        if i < rounds - 1:
+            out.write("\n            elif ")
 
-    code += """
+    out.write("""
             }
             adjoint auto;
         }
+""")
+
+    out.write("""
+        operation AffineLayerKeyAddition(state: Qubit[], round_key: Qubit[], round: Int, costing: Bool) : Unit
+        {
+            body (...)
+            {
+""")
+    if fused:
+        out.write("                if")
+        for i in range(rounds):
+            out.write("(round == %d)\n" % (i+1))
+            out.write("            {\n")
+            out.write("                AffineLayerKeyAdditionRound%d(state, round_key, costing);\n" % (i+1))
+            out.write("            }")
+            if i < rounds - 1:
+                out.write("\n            elif ")
+        out.write("\n")
+    else:
+        out.write("""                KeyExpansion(round_key, round, costing);
+                AffineLayer(state, round, costing);
+                for (j in 0..(Length(state) - 1))
+                {
+                    CNOT(round_key[j], state[j]);
+                }
+""")
+    out.write("""            }
+            adjoint auto;
+        }
     }
-    """
+    """)
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--single_file", action="store_true", help="combine output into a single Q# file")
+    parser.add_argument("--cnots", action="store_true", help="list explicitly all cnots for L and U")
+    parser.add_argument("--synth", choices=sorted(SYNTHESIS) + ["best"], default="plu", help="CNOT synthesis method for the linear layers")
+    parser.add_argument("--schedule", action="store_true", help="reorder the cnots into layers of parallel gates, exploiting commutation")
+    parser.add_argument("--fused", action="store_true", help="also generate operations fusing key expansion, affine layer and key addition of every round")
+    parser.add_argument("--relabel", action="store_true", help="with --fused, keep track of where entries are across rounds instead of swapping qubits back every round")
+    parser.add_argument("-f", "--force", action="store_true", help="regenerate files even if their inputs did not change")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes generating rounds in parallel")
+    parser.add_argument("-c", "--category", type=int, default=-1, help="generate code only a single security category")
+    args = parser.parse_args()
+
+    single_file = args.single_file
+    use_apply_each = not args.cnots
+    fused = args.fused or args.relabel
+
+    # files whose inputs (matrices, options, generator sources) did not change are not generated again
+    outputs = Manifest(force=args.force)
+    sources = source_hash(__file__, plu_decomposition.__file__, gf2.__file__, manifest.__file__, codegen.__file__)
+    options = (single_file, use_apply_each, args.synth, args.schedule, fused, args.relabel)
+
+    if args.category == -1:
+        schemes = [LowMCScheme.load(c) for c in CATEGORIES]
+    else:
+        try:
+            schemes = [LowMCScheme.load(args.category)]
+        except ValueError:
+            print("Security category %d not available" % args.category)
+            schemes = []
+
+    # collect the rounds to generate for all schemes, so that they go through a single pool
+    work = []
+    todo = []
+    for scheme in schemes:
+        L_name = scheme.name
+        lm = scheme.LM_rows
+        b = scheme.b
+        ikm = scheme.IKM if fused else None
+
+        muxer_name = 'affine_layers_%s.qs' % L_name
+        scheme_inputs = input_hash(sources, options, L_name, lm, b, ikm)
+        if single_file and outputs.fresh(muxer_name, scheme_inputs):
+            continue
+
+        if args.relabel:
+            # the S-box layer between rounds expects its input lanes in place, other entries of
+            # the state and the round key stay wherever the previous rounds left them
+            n = scheme.blocksize
+            lanes = list(range(n - 3 * scheme.sboxes, n))
+            # synthesised once, for the layouts and for generating the rounds; list() closes the pool
+            synthesis = list(run([(FusedRoundSynthesis, (lm[i], ikm[i+1], n, args.synth)) for i in range(len(lm))], args.jobs))
+            layouts = [(list(range(n)), list(range(n)))]
+            for i in range(len(lm) - 1):
+                (_, state_perm), (_, key_perm) = synthesis[i]
+                layouts.append(RoundLayouts(layouts[-1], (state_perm, key_perm), lanes))
+
+        rounds = []
+        for i in range(len(lm)):
+        # for i in range(3):
+            round_name = 'affine_layers_%s_Round%d.qs' % (L_name, i+1)
+            round_inputs = input_hash(sources, options, L_name, i, lm[i], b[i])
+            if single_file or not outputs.fresh(round_name, round_inputs):
+                rounds.append((round_name, round_inputs))
+                work.append((AffineLayerRound, (L_name, i, lm[i], b[i], scheme.blocksize, args.synth, args.schedule, use_apply_each)))
+            if fused:
+                # round i+1 expands the round key with IKM[i+1]
+                fused_name = 'affine_layers_%s_Round%dFused.qs' % (L_name, i+1)
+                relabel = (layouts[i], lanes if i < len(lm) - 1 else None) if args.relabel else (None, None)
+                fused_inputs = input_hash(sources, options, L_name, i, lm[i], b[i], ikm[i+1], relabel)
+                if single_file or not outputs.fresh(fused_name, fused_inputs):
+                    rounds.append((fused_name, fused_inputs))
+                    work.append((FusedRound, (L_name, i, lm[i], b[i], ikm[i+1], scheme.blocksize, args.synth, args.schedule, use_apply_each) + relabel
+                                 + ((synthesis[i],) if args.relabel else ())))
+        todo.append((scheme, muxer_name, scheme_inputs, rounds))
+
+    # rounds come back in the order of work, and are written out as they come
+    results = run(work, args.jobs)
+
+    for scheme, muxer_name, scheme_inputs, rounds in todo:
+        L_name = scheme.name
+        if single_file:
+            single = outputs.open(muxer_name, scheme_inputs)
+        for round_name, round_inputs in rounds:
+            code, report = next(results)
+            print(report)
+            if single_file:
+                single.write(code)
+            else:
+                outputs.write(round_name, round_inputs, code)
+
+        code = AffineLayerMuxer(L_name, scheme.rounds, fused=fused)
+        if single_file:
+            single.write(code)
+            single.close()
+        else:
+            outputs.write(muxer_name, input_hash(sources, options, L_name, scheme.rounds), code)
 
-    with open('affine_layers_%s.qs' % L_name, 'a' if single_file else 'w') as f:
-        f.write(code)
+    outputs.save()
+    print(outputs.summary())
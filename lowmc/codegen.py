@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Helpers shared by the Q# code generators (affine_layers.py, in_place_round_key_generation.py).
+
+Generated code is collected in CodeWriter buffers (a list of chunks joined once) rather than by
+repeated string concatenation, and written out through manifest.GeneratedFile, which streams the
+chunks to disk. Rounds are generated by run, in worker processes if asked to, and handed over
+one at a time in order, so that at most a few rounds are held in memory at once.
+"""
+
+from multiprocessing import Pool
+
+
+class CodeWriter(object):
+    """
+    Buffer of generated code, with the write() interface of a file.
+
+    TESTS:
+        >>> out = CodeWriter()
+        >>> out.write("operation ", "Foo")
+        >>> out.write("();\\n")
+        >>> out.getvalue()
+        'operation Foo();\\n'
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, *chunks):
+        self.chunks.extend(chunks)
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
+def run(work, jobs=1):
+    """
+    Yields f(*args) for f, args in work, computed in up to jobs processes if jobs > 1.
+    Results come in the order of work whatever order the workers finish in, so that the
+    generated files do not depend on the number of jobs. f has to be a module level function.
+
+    TESTS:
+        >>> list(run([(pow, (2, i)) for i in range(10)], jobs=4))
+        [1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+    """
+    if jobs <= 1 or len(work) <= 1:
+        for f, args in work:
+            yield f(*args)
+        return
+    with Pool(min(jobs, len(work))) as pool:
+        for result in pool.imap(_call, work, chunksize=1):
+            yield result
+
+
+def _call(work):
+    f, args = work
+    return f(*args)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,254 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Dense linear algebra over GF(2) on packed rows, replacing the parts of Sage's matrix(GF(2), ...)
+used by the LowMC code generators.
+
+Row i of a matrix is stored as an integer, with bit j holding entry [i][j], so that adding rows
+is a single XOR. Matrix exposes the small subset of the Sage interface the generators rely on
+(dimensions(), M[i][j], *, inverse(), LU(), str()).
+"""
+
+from lowmc_packed import pack, unpack
+
+
+class Matrix(object):
+    """
+    Binary matrix.
+
+    :param M:       list of rows, each a list of bits or a packed integer
+    :param ncols:   number of columns, needed when rows are packed
+
+    TESTS:
+        >>> M = Matrix([[1, 0, 1], [0, 1, 1]])
+        >>> M.dimensions()
+        (2, 3)
+        >>> M[1][2], M.rows
+        (1, [5, 6])
+        >>> print(M.transpose().str())
+        [1 0]
+        [0 1]
+        [1 1]
+    """
+
+    def __init__(self, M, ncols=None):
+        M = list(M)
+        if len(M) > 0 and not isinstance(M[0], int):
+            ncols = len(M[0]) if ncols is None else ncols
+            M = [pack(row) for row in M]
+        self.rows = M
+        self.nrows = len(M)
+        self.ncols = ncols if ncols is not None else 0
+
+    @staticmethod
+    def identity(n):
+        return Matrix([1 << i for i in range(n)], n)
+
+    def dimensions(self):
+        return (self.nrows, self.ncols)
+
+    def __getitem__(self, i):
+        return unpack(self.rows[i], self.ncols)
+
+    def list(self):
+        return [unpack(row, self.ncols) for row in self.rows]
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and self.dimensions() == other.dimensions() and self.rows == other.rows
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return self.str()
+
+    def str(self):
+        """
+        Same format as Sage's Matrix.str().
+        """
+        return "\n".join("[%s]" % " ".join(map(str, row)) for row in self.list())
+
+    def is_one(self):
+        return self == Matrix.identity(self.nrows)
+
+    def __mul__(self, other):
+        """
+        Matrix product, or matrix-vector product if other is a list of bits.
+
+        TESTS:
+            >>> A = Matrix([[1, 1], [0, 1]])
+            >>> (A * A).list()
+            [[1, 0], [0, 1]]
+            >>> A * [1, 1]
+            [0, 1]
+        """
+        if isinstance(other, Matrix):
+            if self.ncols != other.nrows:
+                raise ValueError("dimension mismatch %s * %s" % (self.dimensions(), other.dimensions()))
+            return Matrix([mul_row(row, other.rows) for row in self.rows], other.ncols)
+        v = pack(other)
+        return [parity(row & v) for row in self.rows]
+
+    def transpose(self):
+        return Matrix([pack([(row >> j) & 1 for row in self.rows]) for j in range(self.ncols)], self.nrows)
+
+    def inverse(self):
+        """
+        Inverse by Gauss-Jordan elimination. Raises ZeroDivisionError if singular.
+
+        TESTS:
+            >>> import random
+            >>> M = Matrix([[random.randint(0, 1) for _ in range(40)] for _ in range(40)])
+            >>> try:
+            ...     ok = (M * M.inverse()).is_one() and (M.inverse() * M).is_one()
+            ... except ZeroDivisionError:
+            ...     ok = rank(M) < 40
+            >>> ok
+            True
+            >>> Matrix([[1, 1], [1, 1]]).inverse()
+            Traceback (most recent call last):
+            ...
+            ZeroDivisionError: matrix must be nonsingular
+        """
+        n = self.nrows
+        if n != self.ncols:
+            raise ArithmeticError("self must be a square matrix")
+        A = list(self.rows)
+        inv = [1 << i for i in range(n)]
+        for col in range(n):
+            piv = next((i for i in range(col, n) if (A[i] >> col) & 1), None)
+            if piv is None:
+                raise ZeroDivisionError("matrix must be nonsingular")
+            A[col], A[piv] = A[piv], A[col]
+            inv[col], inv[piv] = inv[piv], inv[col]
+            for i in range(n):
+                if i != col and (A[i] >> col) & 1:
+                    A[i] ^= A[col]
+                    inv[i] ^= inv[col]
+        return Matrix(inv, n)
+
+    def LU(self):
+        """
+        Returns (P, L, U) such that self = P * L * U, with P a permutation matrix, L unit lower
+        triangular and U upper triangular (in row echelon form). Pivots are the first nonzero
+        entry at or below the current row, as for Sage's LU() over GF(2).
+
+        TESTS:
+            >>> import random
+            >>> res = []
+            >>> for n, m in [(24, 24), (16, 24), (24, 16)]:
+            ...     M = Matrix([[random.randint(0, 1) for _ in range(m)] for _ in range(n)])
+            ...     P, L, U = M.LU()
+            ...     lower = all(L[i][j] == int(i == j) for i in range(n) for j in range(i, n))
+            ...     upper = all(U[i][j] == 0 for i in range(n) for j in range(min(i, m)))
+            ...     res.append(P * L * U == M and lower and upper and (P * P.transpose()).is_one())
+            >>> res
+            [True, True, True]
+        """
+        n, m = self.nrows, self.ncols
+        U = list(self.rows)
+        L = [0] * n
+        perm = list(range(n))
+
+        k = 0
+        for col in range(m):
+            if k == n:
+                break
+            piv = next((i for i in range(k, n) if (U[i] >> col) & 1), None)
+            if piv is None:
+                continue
+            U[k], U[piv] = U[piv], U[k]
+            L[k], L[piv] = L[piv], L[k]
+            perm[k], perm[piv] = perm[piv], perm[k]
+            for i in range(k + 1, n):
+                if (U[i] >> col) & 1:
+                    U[i] ^= U[k]
+                    L[i] |= 1 << k
+            k += 1
+
+        # rows of self were permuted as self[perm[i]] -> i, so P has ones at [perm[i]][i]
+        P = [0] * n
+        for i in range(n):
+            P[perm[i]] = 1 << i
+        return Matrix(P, n), Matrix([L[i] | (1 << i) for i in range(n)], n), Matrix(U, m)
+
+
+def parity(x):
+    return bin(x).count("1") & 1
+
+
+def mul_row(row, rows):
+    """
+    Returns row * M for a packed row vector and M given by its packed rows.
+    """
+    acc = 0
+    j = 0
+    while row:
+        if row & 1:
+            acc ^= rows[j]
+        row >>= 1
+        j += 1
+    return acc
+
+
+def rank(M):
+    """
+    Rank of a Matrix.
+
+    TESTS:
+        >>> rank(Matrix([[1, 1], [1, 1]])), rank(Matrix.identity(5))
+        (1, 5)
+    """
+    U = M.LU()[2]
+    return sum(1 for row in U.rows if row != 0)
+
+
+def permutation(P):
+    """
+    Returns p with p[i] = j where P[j][i] == 1, i.e. P maps unit vector i to unit vector p[i].
+
+    TESTS:
+        >>> permutation(Matrix([[0, 0, 1], [1, 0, 0], [0, 1, 0]]))
+        [1, 2, 0]
+    """
+    p = [None] * P.ncols
+    for j, row in enumerate(P.rows):
+        if row == 0 or row & (row - 1):
+            raise ValueError("not a permutation matrix")
+        p[row.bit_length() - 1] = j
+    if None in p:
+        raise ValueError("not a permutation matrix")
+    return p
+
+
+def to_cycles(p, singletons=False):
+    """
+    Cycle decomposition of permutation p (on 0..n-1), with every cycle starting at its smallest
+    element and cycles sorted by it, as Sage's Permutation.to_cycles().
+
+    TESTS:
+        >>> to_cycles([1, 2, 0, 3, 5, 4])
+        [(0, 1, 2), (4, 5)]
+        >>> to_cycles([1, 0, 2], singletons=True)
+        [(0, 1), (2,)]
+    """
+    seen = [False] * len(p)
+    cycles = []
+    for i in range(len(p)):
+        if seen[i]:
+            continue
+        cycle = [i]
+        seen[i] = True
+        j = p[i]
+        while j != i:
+            cycle.append(j)
+            seen[j] = True
+            j = p[j]
+        if singletons or len(cycle) > 1:
+            cycles.append(tuple(cycle))
+    return cycles
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
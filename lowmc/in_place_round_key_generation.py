@@ -1,145 +1,95 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-from sage.all import GF, matrix
 from plu_decomposition import PermutationToREWIRE, LowerTriangularToCNOT, UpperTriangularToCNOT
-import L1, L3, L5
-import L0
-import os
-
-import argparse
-parser = argparse.ArgumentParser()
-parser.add_argument("-s", "--single_file", action="store_true", help="combine output into a single Q# file")
-parser.add_argument("--cnots", action="store_true", help="list explicitly all cnots for L and U")
-parser.add_argument("-c", "--category", type=int, default=-1, help="generate code only a single security category")
-args = parser.parse_args()
-
-single_file = args.single_file
-categories = {
-    0: (L0, "L0"),
-    1: (L1, "L1"),
-    3: (L3, "L3"),
-    5: (L5, "L5"),
-}
-use_apply_each = not args.cnots
-
-if args.category == -1:
-    schemes = categories.values()
-else:
-    try:
-        schemes = [categories[args.category]]
-    except:
-        print "Security category %d not available" % args.category
-
-K = GF(2)
-
-for params in schemes:
-    L, L_name = params
-    km = [matrix(K, L.KM[_]) for _ in range(len(L.KM))]
-    km_inv = [kmi.inverse() for kmi in km]
-    ikm = [km[0]]
-
-    if single_file:
-        if os.path.exists('in_place_key_expansion_%s.qs' % L_name):
-            os.remove('in_place_key_expansion_%s.qs' % L_name)
-
-    for i in range(1, L.rounds+1):
-        _m = km[i] * km_inv[i-1]
-        ikm.append(_m)
-
-    ikm.append(km_inv[-1])
-
-    # python lowmc implementation output
-
-    code = """IKM = [
+from lowmc_scheme import LowMCScheme, CATEGORIES
+from manifest import Manifest, input_hash, source_hash
+from codegen import run, CodeWriter
+from gf2 import Matrix
+import plu_decomposition, gf2, manifest, codegen
+
+
+def KeyExpansionRound(L_name, i, ikm, use_apply_each=True):
     """
-    for m in ikm:
-        code += "["
-        code += m.str().replace('\n', ',\n').replace(' ', ', ')
-        code += "],"
-    code += ']\n'
-    with open('in_place_km_%s.py' % L_name, 'w') as f:
-        f.write(code)
-
-    # qsharp lowmc implementation output
-
-    for i in range(len(ikm)):
-        code = """namespace QLowMC.InPlace.%s
+    Q# code for the in-place key expansion of round i, round_key <- IKM[i] * round_key.
+    Only takes plain lists and ints, so that it can run in a worker process.
+    """
+    out = CodeWriter()
+    out.write("""namespace QLowMC.InPlace.%s
     {
         open Microsoft.Quantum.Intrinsic;
         open Microsoft.Quantum.Canon;
         open QUtilities;
-    """ % L_name
+    """ % L_name)
 
-        M = ikm[i]
-        P, L, U = M.LU()
+    P, L, U = Matrix(ikm).LU()
 
-        # print U
+    # print U
 
-        if use_apply_each:
-            # using ApplyToEachA
-            code += """
+    if use_apply_each:
+        # using ApplyToEachA
+        out.write("""
             operation KeyExpansionRound%dU(round_key: Qubit[], costing: Bool) : Unit
             {
                 body (...)
                 {
-                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, round_key), [\n""" % (i)
-            code += UpperTriangularToCNOT(U, bufname="round_key", tabs=5)
-            code += """                ]);
+                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, round_key), [\n""" % (i))
+        out.write(UpperTriangularToCNOT(U, bufname="round_key", tabs=5))
+        out.write("""                ]);
                 }
                 adjoint auto;
-            }\n"""
-        else:
-            # listing all cnots
-            code += """
+            }\n""")
+    else:
+        # listing all cnots
+        out.write("""
             operation KeyExpansionRound%dU(round_key: Qubit[], costing: Bool) : Unit
             {
                 body (...)
-                {\n""" % (i)
-            code += UpperTriangularToCNOT(U, bufname="round_key", tabs=5, use_apply_each=False)
-            code += """        }
+                {\n""" % (i))
+        out.write(UpperTriangularToCNOT(U, bufname="round_key", tabs=5, use_apply_each=False))
+        out.write("""        }
                 adjoint auto;
-            }\n"""
+            }\n""")
 
-        # print L
+    # print L
 
-        if use_apply_each:
-            # using ApplyToEachA
-            code += """
+    if use_apply_each:
+        # using ApplyToEachA
+        out.write("""
             operation KeyExpansionRound%dL(round_key: Qubit[], costing: Bool) : Unit
             {
                 body (...)
                 {
-                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, round_key), [\n""" % (i)
-            code += LowerTriangularToCNOT(L, bufname="round_key", tabs=5)
-            code += """                ]);
+                    ApplyToEachA(ApplyToPairOfIndices(CNOT, _, _, round_key), [\n""" % (i))
+        out.write(LowerTriangularToCNOT(L, bufname="round_key", tabs=5))
+        out.write("""                ]);
                 }
                 adjoint auto;
-            }\n"""
-        else:
-            # listing all cnots
-            code += """
+            }\n""")
+    else:
+        # listing all cnots
+        out.write("""
             operation KeyExpansionRound%dL(round_key: Qubit[], costing: Bool) : Unit
             {
                 body (...)
-                {\n""" % (i)
-            code += LowerTriangularToCNOT(L, bufname="round_key", tabs=3, use_apply_each=False)
-            code += """        }
+                {\n""" % (i))
+        out.write(LowerTriangularToCNOT(L, bufname="round_key", tabs=3, use_apply_each=False))
+        out.write("""        }
                 adjoint auto;
-            }\n"""
+            }\n""")
 
-        # print P
-        code += """
+    # print P
+    out.write("""
         operation KeyExpansionRound%dP(round_key: Qubit[], costing: Bool) : Unit
         {
             body (...)
-            {\n""" % (i)
-        code += PermutationToREWIRE(P, bufname="round_key", tabs=3)
-        code += """        }
+            {\n""" % (i))
+    out.write(PermutationToREWIRE(P, bufname="round_key", tabs=3))
+    out.write("""        }
             adjoint auto;\
-        }\n"""
+        }\n""")
 
-        # full linear operation
-        code +="""
+    # full linear operation
+    out.write("""
         operation KeyExpansionRound%d(round_key: Qubit[], costing: Bool) : Unit
         {
             body (...)
@@ -150,26 +100,25 @@ for params in schemes:
             }
             adjoint auto;
         }\n""" % (
-            i,
-            "", # "// ", # if i < 3 else "// ",
-            i,
-            "", # "// ", # if i < 3 else "// ",
-            i,
-            "", # "// ", # if i < 3 else "// ",
-            i,
-        )
+        i,
+        "", # "// ", # if i < 3 else "// ",
+        i,
+        "", # "// ", # if i < 3 else "// ",
+        i,
+        "", # "// ", # if i < 3 else "// ",
+        i,
+    ))
 
-        code += "}\n"
+    out.write("}\n")
+    return out.getvalue()
 
-        if single_file:
-            with open('in_place_key_expansion_%s.qs' % (L_name), 'a') as f:
-                f.write(code)
-        else:
-            with open('in_place_key_expansion_%s_Round%d.qs' % (L_name, i), 'w') as f:
-                f.write(code)
 
-    # muxer
-    code = """namespace QLowMC.InPlace.%s
+def KeyExpansionMuxer(L_name, rounds):
+    """
+    Q# code for KeyExpansion(round_key, round, costing), calling the operation of the given round.
+    """
+    out = CodeWriter()
+    out.write("""namespace QLowMC.InPlace.%s
     {
         open Microsoft.Quantum.Intrinsic;
         open QUtilities;
@@ -178,25 +127,110 @@ for params in schemes:
         {
             body (...)
             {
-                if""" % L_name
+                if""" % L_name)
 
-    for i in range(len(ikm)):
-        code += "(round == %d)\n" % (i)
-        code += "            {\n"
-        code += "                %sKeyExpansionRound%d(round_key, costing);\n" % (
+    for i in range(rounds):
+        out.write("(round == %d)\n" % (i))
+        out.write("            {\n")
+        out.write("                %sKeyExpansionRound%d(round_key, costing);\n" % (
             "", # if i < 3 else "// ",
             i
-            )
-        code += "            }"
-        if i < len(ikm) - 1:
-            code += "\n            elif "
+            ))
+        out.write("            }")
+        if i < rounds - 1:
+            out.write("\n            elif ")
 
-    code += """
+    out.write("""
             }
             adjoint auto;
         }
     }
-    """
+    """)
+    return out.getvalue()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--single_file", action="store_true", help="combine output into a single Q# file")
+    parser.add_argument("--cnots", action="store_true", help="list explicitly all cnots for L and U")
+    parser.add_argument("-f", "--force", action="store_true", help="regenerate files even if their inputs did not change")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes generating rounds in parallel")
+    parser.add_argument("-c", "--category", type=int, default=-1, help="generate code only a single security category")
+    args = parser.parse_args()
+
+    single_file = args.single_file
+    use_apply_each = not args.cnots
+
+    # files whose inputs (matrices, options, generator sources) did not change are not generated again
+    outputs = Manifest(force=args.force)
+    sources = source_hash(__file__, plu_decomposition.__file__, gf2.__file__, manifest.__file__, codegen.__file__)
+    options = (single_file, use_apply_each)
+
+    if args.category == -1:
+        schemes = [LowMCScheme.load(c) for c in CATEGORIES]
+    else:
+        try:
+            schemes = [LowMCScheme.load(args.category)]
+        except ValueError:
+            print("Security category %d not available" % args.category)
+            schemes = []
+
+    # collect the rounds to generate for all schemes, so that they go through a single pool
+    work = []
+    todo = []
+    for scheme in schemes:
+        L_name = scheme.name
+        km = scheme.KM_rows
+        muxer_name = 'in_place_key_expansion_%s.qs' % L_name
+        km_name = 'in_place_km_%s.py' % L_name
+        km_inputs = input_hash(sources, L_name, km)
+        scheme_inputs = input_hash(sources, options, L_name, km)
+        if single_file and outputs.fresh(muxer_name, scheme_inputs) and outputs.fresh(km_name, km_inputs):
+            continue
+        ikm = scheme.compute_IKM()
+
+        # python lowmc implementation output
+
+        with outputs.open(km_name, km_inputs) as f:
+            f.write("""IKM = [
+    """)
+            for m in ikm:
+                f.write("[", ",\n".join("[%s]" % ", ".join(map(str, row)) for row in m), "],")
+            f.write(']\n')
+
+        # qsharp lowmc implementation output
+
+        rounds = []
+        for i in range(len(ikm)):
+            # IKM[i] only depends on KM[i-1] and KM[i]
+            round_name = 'in_place_key_expansion_%s_Round%d.qs' % (L_name, i)
+            round_inputs = input_hash(sources, options, L_name, i, km[max(0, i-1):i+1])
+            if not single_file and outputs.fresh(round_name, round_inputs):
+                continue
+            rounds.append((round_name, round_inputs))
+            work.append((KeyExpansionRound, (L_name, i, ikm[i], use_apply_each)))
+        todo.append((L_name, len(ikm), muxer_name, scheme_inputs, rounds))
+
+    # rounds come back in the order of work, and are written out as they come
+    results = run(work, args.jobs)
+
+    for L_name, n_rounds, muxer_name, scheme_inputs, rounds in todo:
+        if single_file:
+            single = outputs.open(muxer_name, scheme_inputs)
+        for round_name, round_inputs in rounds:
+            code = next(results)
+            if single_file:
+                single.write(code)
+            else:
+                outputs.write(round_name, round_inputs, code)
+
+        code = KeyExpansionMuxer(L_name, n_rounds)
+        if single_file:
+            single.write(code)
+            single.close()
+        else:
+            outputs.write(muxer_name, input_hash(sources, options, L_name, n_rounds), code)
 
-    with open('in_place_key_expansion_%s.qs' % L_name, 'a' if single_file else 'w') as f:
-        f.write(code)
+    outputs.save()
+    print(outputs.summary())
@@ -63,11 +63,10 @@ def RoundKey(k, t, scheme, in_place=False, IKM=None):
     :param scheme: lowmc parametrization + constants
 
     TESTS:
-        >>> import L1
-        >>> LowMCL1 = { 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 }
+        >>> from lowmc_scheme import LowMCScheme
+        >>> LowMCL1 = LowMCScheme.load(1)
         >>> str_to_buf = lambda s: [0 if s[i] == '0' else 1 for i in range(len(s))]
-        >>> from in_place_km_L1 import IKM
-        >>> LowMCL1['IKM'] = IKM
+        >>> IKM = LowMCL1.IKM
         >>> # Testing L1
         >>> k = str_to_buf("10000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000000")
         >>> rks = []
@@ -269,6 +268,83 @@ def Encrypt(k, m, scheme):
     return s
 
 
+def encrypt_batch(keys, plaintexts, scheme):
+    """
+    Batched LowMC evaluation, matching Encrypt bit for bit. Needs NumPy.
+
+    :params keys:       (N, keysize) array of bits
+    :params plaintexts: (N, blocksize) array of bits
+    :param scheme:      lowmc parametrization + constants
+    :returns:           (N, blocksize) array of bits
+
+    TESTS:
+        >>> scheme = random_scheme(32, 32, 4, seed=0)
+        >>> from random import randint
+        >>> keys = [[randint(0, 1) for _ in range(32)] for _ in range(8)]
+        >>> plaintexts = [[randint(0, 1) for _ in range(32)] for _ in range(8)]
+        >>> encrypt_batch(keys, plaintexts, scheme).tolist() == [Encrypt(k, m, scheme) for k, m in zip(keys, plaintexts)]
+        True
+    """
+    import lowmc_batch
+    return lowmc_batch.Encrypt(keys, plaintexts, scheme)
+
+
+def rank(M):
+    """
+    Rank of a binary matrix given as a list of rows.
+
+    TESTS:
+        >>> rank([[1, 0], [0, 1]])
+        2
+        >>> rank([[1, 1], [1, 1]])
+        1
+    """
+    rows = [int("".join(map(str, row[::-1])), 2) for row in M]
+    r = 0
+    for col in range(len(M[0]) if M else 0):
+        pivot = next((i for i in range(r, len(rows)) if (rows[i] >> col) & 1), None)
+        if pivot is None:
+            continue
+        rows[r], rows[pivot] = rows[pivot], rows[r]
+        for i in range(len(rows)):
+            if i != r and (rows[i] >> col) & 1:
+                rows[i] ^= rows[r]
+        r += 1
+    return r
+
+
+def random_scheme(blocksize, keysize, rounds, sboxes=10, seed=None):
+    """
+    Random LowMC instance with full rank linear layer and key matrices, in the same format as
+    the L* parameter sets. Only meant for testing code that does not depend on actual constants.
+
+    TESTS:
+        >>> scheme = random_scheme(32, 32, 4, seed=1)
+        >>> len(scheme['LM']), len(scheme['KM']), len(scheme['b'])
+        (4, 5, 4)
+        >>> all(rank(M) == 32 for M in scheme['LM'] + scheme['KM'])
+        True
+    """
+    import random
+    rng = random.Random(seed)
+
+    def full_rank(rows, cols):
+        while True:
+            M = [[rng.randint(0, 1) for _ in range(cols)] for _ in range(rows)]
+            if rank(M) == min(rows, cols):
+                return M
+
+    return {
+        'rounds': rounds,
+        'blocksize': blocksize,
+        'keysize': keysize,
+        'sboxes': sboxes,
+        'LM': [full_rank(blocksize, blocksize) for _ in range(rounds)],
+        'KM': [full_rank(blocksize, keysize) for _ in range(rounds + 1)],
+        'b': [[rng.randint(0, 1) for _ in range(blocksize)] for _ in range(rounds)],
+    }
+
+
 def print_buf(buf, lable=""):
     print(lable + (" " if lable != "" else "") + "".join(map(str, buf)))
 
@@ -0,0 +1,109 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+LowMC encryption of many (key, message) pairs at once, over NumPy arrays of bits.
+
+Keys and messages are (N, keysize) and (N, blocksize) arrays of 0/1 entries, with column i
+holding entry i of the corresponding list in lowmc.py. Matrix products are done as float32
+matrix multiplications (exact, since the sums are at most 256) reduced mod 2, so they go
+through BLAS. The S-box layer is bitsliced across the 3-bit lanes of the whole batch.
+"""
+import numpy as np
+
+
+class BatchArrays:
+    """
+    Matrices of a LowMC scheme, transposed and converted for batched products.
+
+    :param scheme: lowmc parametrization + constants, as used in lowmc.py
+    """
+
+    def __init__(self, scheme):
+        self.rounds = scheme['rounds']
+        self.blocksize = scheme['blocksize']
+        self.keysize = scheme['keysize']
+        # state @ LM[t] computes LinearLayer for round t+1
+        self.LM = [np.array(M, dtype=np.float32).T.copy() for M in scheme['LM']]
+        # key @ KS gives all round keys side by side
+        self.KS = np.concatenate([np.array(M, dtype=np.float32) for M in scheme['KM']]).T.copy()
+        self.b = [np.array(b, dtype=np.uint8) for b in scheme['b']]
+
+        lanes = np.arange(self.blocksize - 3 * scheme['sboxes'], self.blocksize, 3)
+        self.lane_a, self.lane_b, self.lane_c = lanes, lanes + 1, lanes + 2
+
+
+def mul_mod2(x, M):
+    """
+    Product of 0/1 uint8 array x with float32 0/1 matrix M, over GF(2).
+    """
+    return (x.astype(np.float32) @ M).astype(np.uint16).astype(np.uint8) & 1
+
+
+def as_bits(data, width, name):
+    data = np.asarray(data, dtype=np.uint8)
+    if data.ndim == 1:
+        data = data.reshape(1, -1)
+    if data.ndim != 2 or data.shape[1] != width:
+        raise ValueError("%s must have shape (N, %d), got %s" % (name, width, data.shape))
+    return data & 1
+
+
+def RoundKeys(keys, arrays):
+    """
+    Returns an array of shape (rounds+1, N, blocksize) of round keys.
+    """
+    keys = as_bits(keys, arrays.keysize, "keys")
+    ks = mul_mod2(keys, arrays.KS)
+    return ks.reshape(keys.shape[0], arrays.rounds + 1, arrays.blocksize).transpose(1, 0, 2)
+
+
+def SboxLayer(s, arrays):
+    """
+    Apply the S-box layer to every state in s, in place.
+    """
+    a, b, c = s[:, arrays.lane_a], s[:, arrays.lane_b], s[:, arrays.lane_c]
+    s[:, arrays.lane_a] = a ^ (b & c)
+    s[:, arrays.lane_b] = a ^ b ^ (a & c)
+    s[:, arrays.lane_c] = a ^ b ^ c ^ (a & b)
+    return s
+
+
+def Encrypt(keys, messages, scheme, arrays=None):
+    """
+    Encrypt messages[i] under keys[i] for every i.
+
+    :params keys:       (N, keysize) array of bits
+    :params messages:   (N, blocksize) array of bits
+    :param scheme:      lowmc parametrization + constants
+    :param arrays:      BatchArrays for scheme, built if not passed
+    :returns:           (N, blocksize) uint8 array of bits
+
+    TESTS:
+        >>> import lowmc
+        >>> scheme = lowmc.random_scheme(32, 32, 6, seed=0)
+        >>> rng = np.random.default_rng(0)
+        >>> keys = rng.integers(0, 2, size=(32, 32), dtype=np.uint8)
+        >>> messages = rng.integers(0, 2, size=(32, 32), dtype=np.uint8)
+        >>> c = Encrypt(keys, messages, scheme)
+        >>> c.tolist() == [lowmc.Encrypt(list(k), list(m), scheme) for k, m in zip(keys.tolist(), messages.tolist())]
+        True
+    """
+    if arrays is None:
+        arrays = getattr(scheme, 'batch_arrays', None) or BatchArrays(scheme)
+    s = as_bits(messages, arrays.blocksize, "messages")
+    rks = RoundKeys(keys, arrays)
+    if rks.shape[1] != s.shape[0]:
+        raise ValueError("Got %d messages but %d keys" % (s.shape[0], rks.shape[1]))
+
+    s = s ^ rks[0]
+    for t in range(1, arrays.rounds + 1):
+        s = SboxLayer(s, arrays)
+        s = mul_mod2(s, arrays.LM[t-1])
+        s ^= arrays.b[t-1]
+        s ^= rks[t]
+    return s
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
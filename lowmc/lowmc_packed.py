@@ -0,0 +1,242 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+LowMC on packed integers.
+
+State, key and matrix rows are Python ints, with bit i holding entry i of the corresponding
+list in lowmc.py. The S-box layer is bitsliced over the 3-bit lanes, and matrix-vector products
+XOR together precomputed combinations of 8 matrix columns (method of four Russians), which is
+the same as taking the parity of every AND-ed row but needs n/8 rather than n operations.
+"""
+
+from collections import OrderedDict
+
+_CHUNK = 8
+
+
+def pack(bits):
+    """
+    Pack a list of bits into an integer, with bits[i] as bit i.
+
+    TESTS:
+        >>> pack([1, 0, 1, 1])
+        13
+    """
+    x = 0
+    for i, b in enumerate(bits):
+        if b:
+            x |= 1 << i
+    return x
+
+
+def unpack(x, n):
+    """
+    Inverse of pack.
+
+    TESTS:
+        >>> unpack(13, 6)
+        [1, 0, 1, 1, 0, 0]
+    """
+    return [(x >> i) & 1 for i in range(n)]
+
+
+def parity(x):
+    """
+    Parity of the Hamming weight of x.
+
+    TESTS:
+        >>> parity(0b1011), parity(0b11)
+        (1, 0)
+    """
+    return bin(x).count("1") & 1
+
+
+class PackedMatrix:
+    """
+    Binary matrix stored as packed rows, plus lookup tables over chunks of packed columns.
+
+    TESTS:
+        >>> import random
+        >>> M = [[random.randint(0, 1) for _ in range(20)] for _ in range(12)]
+        >>> v = [random.randint(0, 1) for _ in range(20)]
+        >>> P = PackedMatrix(M)
+        >>> Mv = [sum(M[i][j] & v[j] for j in range(20)) % 2 for i in range(12)]
+        >>> unpack(P.mul(pack(v)), 12) == Mv
+        True
+        >>> unpack(P.mul_rows(pack(v)), 12) == Mv
+        True
+    """
+
+    def __init__(self, M, ncols=None):
+        self.nrows = len(M)
+        self.ncols = len(M[0]) if ncols is None else ncols
+        if isinstance(M[0], int):
+            self.rows = list(M)
+        else:
+            self.rows = [pack(row) for row in M]
+        self._tables = None
+
+    @property
+    def columns(self):
+        return [pack([(row >> j) & 1 for row in self.rows]) for j in range(self.ncols)]
+
+    @property
+    def tables(self):
+        """
+        tables[c][v] is the XOR of columns CHUNK*c + b for all bits b set in v.
+        Built on first use.
+        """
+        if self._tables is None:
+            cols = self.columns
+            self._tables = []
+            for c in range(0, self.ncols, _CHUNK):
+                t = [0] * (1 << _CHUNK)
+                for v in range(1, 1 << _CHUNK):
+                    low = (v & -v).bit_length() - 1
+                    t[v] = t[v & (v - 1)] ^ (cols[c + low] if c + low < self.ncols else 0)
+                self._tables.append(t)
+        return self._tables
+
+    def mul(self, x):
+        """
+        Returns M * x, with x and the result packed.
+        """
+        r = 0
+        for t in self.tables:
+            r ^= t[x & 0xff]
+            x >>= _CHUNK
+        return r
+
+    def mul_rows(self, x):
+        """
+        Returns M * x computing each output bit as the parity of an AND-ed row.
+        """
+        r = 0
+        for i, row in enumerate(self.rows):
+            if parity(row & x):
+                r |= 1 << i
+        return r
+
+
+class PackedLowMC:
+    """
+    LowMC evaluation over packed integers for a given parameter set.
+
+    :param scheme:              lowmc parametrization + constants, as used in lowmc.py
+    :param key_schedule_cache:  number of expanded keys to keep, least recently used are dropped
+
+    The round key matrices KM are stacked into a single (rounds+1)*blocksize x keysize matrix,
+    so that expanding a key is one matrix-vector product. Expanded keys are cached, so that
+    encrypting many messages under the same key skips the key schedule.
+
+    TESTS:
+        >>> import lowmc, random
+        >>> scheme = lowmc.random_scheme(32, 32, 6, sboxes=10, seed=0)
+        >>> engine = PackedLowMC(scheme)
+        >>> res = []
+        >>> for _ in range(16):
+        ...     k = [random.randint(0, 1) for _ in range(32)]
+        ...     m = [random.randint(0, 1) for _ in range(32)]
+        ...     res.append(engine.Encrypt(k, m) == lowmc.Encrypt(k, m, scheme))
+        >>> res == [True] * 16
+        True
+        >>> scheme = lowmc.random_scheme(30, 30, 3, sboxes=10, seed=1)
+        >>> k, m = [1] + [0] * 29, [1, 0] * 15
+        >>> PackedLowMC(scheme).Encrypt(k, m) == lowmc.Encrypt(k, m, scheme)
+        True
+    """
+
+    def __init__(self, scheme, key_schedule_cache=256):
+        self.rounds = scheme['rounds']
+        self.blocksize = scheme['blocksize']
+        self.keysize = scheme['keysize']
+        self.sboxes = scheme['sboxes']
+        # lowmc_scheme.LowMCScheme instances come with packed rows already
+        LM = getattr(scheme, 'LM_rows', None) or scheme['LM']
+        KM = getattr(scheme, 'KM_rows', None) or scheme['KM']
+        self.LM = [PackedMatrix(M, self.blocksize) for M in LM]
+        self.KM = [PackedMatrix(M, self.keysize) for M in KM]
+        self.b = [pack(b) for b in scheme['b']]
+
+        # rows of KM[0], KM[1], ... stacked, so bits t*blocksize.. of KS * k are round key t
+        self.KS = PackedMatrix([row for KM in self.KM for row in KM.rows], self.keysize)
+        self._round_key_mask = (1 << self.blocksize) - 1
+        self._key_schedule_cache = OrderedDict()
+        self._key_schedule_cache_size = key_schedule_cache
+
+        # bit positions of the first input of every S-box, see lowmc.SboxLayer
+        offset = self.blocksize - 3 * self.sboxes
+        self._lane = pack([0] * offset + [1, 0, 0] * self.sboxes)
+        self._sbox_mask = pack([0] * offset + [1] * (3 * self.sboxes))
+
+    def round_keys(self, k):
+        """
+        Returns [rk^0, ..., rk^rounds] for packed key k, reusing recently expanded keys.
+
+        TESTS:
+            >>> import lowmc, random
+            >>> scheme = lowmc.random_scheme(32, 32, 4, seed=2)
+            >>> engine = PackedLowMC(scheme, key_schedule_cache=2)
+            >>> k = [random.randint(0, 1) for _ in range(32)]
+            >>> rks = engine.round_keys(pack(k))
+            >>> [unpack(rk, 32) for rk in rks] == [lowmc.RoundKey(k, t, scheme) for t in range(5)]
+            True
+            >>> engine.round_keys(pack(k)) is rks
+            True
+            >>> _ = engine.round_keys(1), engine.round_keys(2)
+            >>> engine.round_keys(pack(k)) is rks
+            False
+        """
+        cache = self._key_schedule_cache
+        if k in cache:
+            cache.move_to_end(k)
+            return cache[k]
+        rks = self.expand_key(k)
+        if self._key_schedule_cache_size > 0:
+            cache[k] = rks
+            if len(cache) > self._key_schedule_cache_size:
+                cache.popitem(last=False)
+        return rks
+
+    def expand_key(self, k):
+        """
+        Returns [rk^0, ..., rk^rounds] for packed key k, without caching.
+        """
+        ks = self.KS.mul(k)
+        n, mask = self.blocksize, self._round_key_mask
+        return [(ks >> (t * n)) & mask for t in range(self.rounds + 1)]
+
+    def sbox_layer(self, s):
+        """
+        Apply all S-boxes at once, computing (a + bc, a + b + ac, a + b + c + ab) lane-wise.
+        """
+        a = s & self._lane
+        b = (s >> 1) & self._lane
+        c = (s >> 2) & self._lane
+        na = a ^ (b & c)
+        nb = a ^ b ^ (a & c)
+        nc = a ^ b ^ c ^ (a & b)
+        return (s & ~self._sbox_mask) | na | (nb << 1) | (nc << 2)
+
+    def encrypt(self, k, m, rks=None):
+        """
+        Encrypt packed message m under packed key k. Round keys can be passed in as rks,
+        otherwise they are taken from the key schedule cache.
+        """
+        if rks is None:
+            rks = self.round_keys(k)
+        s = m ^ rks[0]
+        for t in range(1, self.rounds + 1):
+            s = self.LM[t-1].mul(self.sbox_layer(s)) ^ self.b[t-1] ^ rks[t]
+        return s
+
+    def Encrypt(self, k, m):
+        """
+        Same interface as lowmc.Encrypt, taking and returning lists of bits.
+        """
+        return unpack(self.encrypt(pack(k), pack(m)), self.blocksize)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
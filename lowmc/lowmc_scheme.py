@@ -0,0 +1,168 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+LowMC parameter sets, loaded once per security category and shared between the Python
+reference implementations, the tests and the Q# code generators.
+
+The matrices are kept both as nested lists (as in the L*.py files generated from the LowMC
+spec, which is what lowmc.py indexes into) and as packed rows, with bit j of row i holding
+entry [i][j]. Derived data (in-place key expansion matrices, PLU factors) is computed on first use.
+"""
+
+import importlib
+from lowmc_packed import pack, PackedLowMC
+from gf2 import Matrix
+
+CATEGORIES = [0, 1, 3, 5]
+
+
+class LowMCScheme(object):
+    """
+    A LowMC parameter set. Supports scheme['rounds'] style access for code written against the
+    plain dictionaries used before.
+
+    :param category:    security category, L<category>.py holds the constants
+    :param params:      module or object with rounds, blocksize, keysize, LM, KM and b, defaults
+                        to importing L<category>
+    :param sboxes:      number of S-boxes per round
+
+    TESTS:
+        >>> import lowmc
+        >>> scheme = LowMCScheme(0, params=lowmc.random_scheme(32, 32, 4, seed=0))
+        >>> scheme['rounds'], scheme.name, scheme['id']
+        (4, 'L0', 0)
+        >>> scheme.LM_rows[0][1] == sum(scheme.LM[0][1][j] << j for j in range(32))
+        True
+        >>> 'IKM' in scheme.keys()
+        True
+        >>> ikm = scheme.compute_IKM()
+        >>> k = [1, 0] * 16
+        >>> rks = [k]
+        >>> for t in range(scheme.rounds + 2): rks.append(lowmc.RoundKey(rks[-1], t, scheme, in_place=True, IKM=ikm))
+        >>> rks[1:-1] == [lowmc.RoundKey(k, t, scheme) for t in range(scheme.rounds + 1)] and rks[-1] == k
+        True
+        >>> P, L, U = scheme.LM_PLU[0]
+        >>> (P * L * U).list() == scheme.LM[0]
+        True
+    """
+
+    _cache = {}
+
+    def __init__(self, category, params=None, sboxes=10):
+        if params is None:
+            params = importlib.import_module("L%d" % category)
+        if isinstance(params, dict):
+            get = lambda name: params[name]
+        else:
+            get = lambda name: getattr(params, name)
+
+        self.id = category
+        self.name = "L%d" % category
+        self.rounds = get('rounds')
+        self.blocksize = get('blocksize')
+        self.keysize = get('keysize')
+        self.sboxes = sboxes
+        self.LM = get('LM')
+        self.KM = get('KM')
+        self.b = get('b')
+
+        self.LM_rows = [[pack(row) for row in M] for M in self.LM]
+        self.KM_rows = [[pack(row) for row in M] for M in self.KM]
+        self.b_packed = [pack(b) for b in self.b]
+
+        self._IKM = None
+        self._LM_PLU = None
+        self._IKM_PLU = None
+        self._packed = None
+        self._batch_arrays = None
+
+    @staticmethod
+    def load(category):
+        """
+        Returns the scheme for a security category, loading it only the first time.
+        """
+        if category not in LowMCScheme._cache:
+            if category not in CATEGORIES:
+                raise ValueError("Security category %d not available" % category)
+            LowMCScheme._cache[category] = LowMCScheme(category)
+        return LowMCScheme._cache[category]
+
+    _keys = ['id', 'rounds', 'blocksize', 'keysize', 'sboxes', 'LM', 'KM', 'b', 'IKM']
+
+    def keys(self):
+        return list(LowMCScheme._keys)
+
+    def __getitem__(self, key):
+        if key not in LowMCScheme._keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return "LowMCScheme(%s: n = %d, k = %d, r = %d, s = %d)" % (self.name, self.blocksize, self.keysize, self.rounds, self.sboxes)
+
+    @property
+    def IKM(self):
+        """
+        Matrices for expanding round keys in place, IKM[t] * rk^(t-1) = rk^t, with the last
+        one mapping rk^rounds back to the key. Read from in_place_km_L*.py if it has been
+        generated, computed otherwise.
+        """
+        if self._IKM is None:
+            try:
+                self._IKM = importlib.import_module("in_place_km_%s" % self.name).IKM
+            except ImportError:
+                self._IKM = self.compute_IKM()
+        return self._IKM
+
+    def compute_IKM(self):
+        """
+        Computes IKM from KM, replacing whatever IKM had been loaded before.
+        """
+        km = [Matrix(M, self.keysize) for M in self.KM_rows]
+        km_inv = [M.inverse() for M in km]
+        ikm = [km[0]] + [km[i] * km_inv[i-1] for i in range(1, self.rounds + 1)] + [km_inv[-1]]
+        self._IKM = [M.list() for M in ikm]
+        self._IKM_PLU = None
+        return self._IKM
+
+    @property
+    def LM_PLU(self):
+        """
+        PLU factors of the linear layer matrices, LM[t] = P * L * U, as gf2.Matrix.
+        """
+        if self._LM_PLU is None:
+            self._LM_PLU = [Matrix(M, self.blocksize).LU() for M in self.LM_rows]
+        return self._LM_PLU
+
+    @property
+    def IKM_PLU(self):
+        """
+        PLU factors of the in-place key expansion matrices, IKM[t] = P * L * U, as gf2.Matrix.
+        """
+        if self._IKM_PLU is None:
+            self._IKM_PLU = [Matrix(M).LU() for M in self.IKM]
+        return self._IKM_PLU
+
+    @property
+    def packed(self):
+        """
+        lowmc_packed.PackedLowMC engine for this scheme.
+        """
+        if self._packed is None:
+            self._packed = PackedLowMC(self)
+        return self._packed
+
+    @property
+    def batch_arrays(self):
+        """
+        lowmc_batch.BatchArrays for this scheme. Needs NumPy.
+        """
+        if self._batch_arrays is None:
+            from lowmc_batch import BatchArrays
+            self._batch_arrays = BatchArrays(self)
+        return self._batch_arrays
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,203 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Bookkeeping for generated Q# files, so that regenerating them only rewrites the files whose
+content changes. Every rewritten file makes dotnet build recompile the project, which takes hours.
+
+The manifest maps every generated file to a hash of the inputs it was generated from (matrices,
+generator options and the sources of the generator) and a hash of its content. Generators ask
+Manifest.fresh before building a file, to skip it altogether if its inputs did not change, and
+write through Manifest.open or Manifest.write, which leave the file untouched if the content is
+the same.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST = "generated_manifest.json"
+
+
+def sha256(data):
+    if not isinstance(data, bytes):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def source_hash(*paths):
+    """
+    Hash of the source files of a generator, standing for its version.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        with open(os.path.splitext(path)[0] + ".py", 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def input_hash(*inputs):
+    """
+    Hash of the inputs a file is generated from. Inputs are lists, tuples, strings, ints and
+    bools, hashed through their repr.
+
+    TESTS:
+        >>> input_hash([[1, 0], [0, 1]], "plu") == input_hash([[1, 0], [0, 1]], "plu")
+        True
+        >>> input_hash([[1, 0], [0, 1]], "plu") == input_hash([[1, 0], [1, 1]], "plu")
+        False
+    """
+    return sha256(repr(inputs))
+
+
+class Manifest(object):
+    """
+    Record of the generated files, kept in a JSON file.
+
+    :param path:    manifest file
+    :param force:   if True, fresh() is always False, so that every file gets built again
+
+    TESTS:
+        >>> import tempfile
+        >>> d = tempfile.mkdtemp()
+        >>> m = Manifest(os.path.join(d, MANIFEST))
+        >>> out = os.path.join(d, "out.qs")
+        >>> m.fresh(out, "key")
+        False
+        >>> m.write(out, "key", "code"), m.write(out, "key", "code")
+        (True, False)
+        >>> m.save()
+        >>> m = Manifest(os.path.join(d, MANIFEST))
+        >>> m.fresh(out, "key"), m.fresh(out, "other key")
+        (True, False)
+        >>> with open(out, 'w') as f: _ = f.write("edited")
+        >>> m.fresh(out, "key")
+        False
+        >>> m.written, m.unchanged, m.skipped
+        (0, 0, 1)
+    """
+
+    def __init__(self, path=MANIFEST, force=False):
+        self.path = path
+        self.force = force
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+        self.written = 0
+        self.unchanged = 0
+        self.skipped = 0
+
+    def fresh(self, filename, inputs):
+        """
+        True if filename was generated from the same inputs and has not been modified since.
+        """
+        entry = self.entries.get(filename)
+        if self.force or entry is None or entry["inputs"] != inputs or not os.path.exists(filename):
+            return False
+        if file_hash(filename) != entry["output"]:
+            return False
+        self.skipped += 1
+        return True
+
+    def open(self, filename, inputs):
+        """
+        Returns a GeneratedFile for streaming the content of filename, recorded on close.
+        """
+        return GeneratedFile(self, filename, inputs)
+
+    def write(self, filename, inputs, content):
+        """
+        Write content to filename unless it already holds it, and record it. Returns True if
+        the file was written.
+        """
+        with self.open(filename, inputs) as f:
+            f.write(content)
+        return f.written
+
+    def _record(self, filename, inputs, digest, written):
+        if written:
+            self.written += 1
+        else:
+            self.unchanged += 1
+        self.entries[filename] = {"inputs": inputs, "output": digest}
+
+    def save(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+            f.write("\n")
+
+    def summary(self):
+        return "%d files written, %d unchanged, %d skipped (inputs unchanged)" % (self.written, self.unchanged, self.skipped)
+
+
+class GeneratedFile(object):
+    """
+    Output file written in chunks through a buffered temporary file, hashing the content on the
+    way, so that the whole content never has to be in memory. On close the temporary file
+    replaces filename only if the content differs, so unchanged files keep their timestamp.
+    Content is written as UTF-8 with unix line endings.
+
+    TESTS:
+        >>> import tempfile
+        >>> d = tempfile.mkdtemp()
+        >>> m = Manifest(os.path.join(d, MANIFEST))
+        >>> out = os.path.join(d, "out.qs")
+        >>> with m.open(out, "key") as f:
+        ...     for i in range(3): f.write("line %d\\n" % i)
+        >>> f.written, open(out).read() == "line 0\\nline 1\\nline 2\\n", m.entries[out]["output"] == file_hash(out)
+        (True, True, True)
+        >>> with m.open(out, "key") as f: f.write("line 0\\nline 1\\n", "line 2\\n")
+        >>> f.written, os.listdir(d)
+        (False, ['out.qs'])
+    """
+
+    def __init__(self, manifest, filename, inputs):
+        self.manifest = manifest
+        self.filename = filename
+        self.inputs = inputs
+        self.written = None
+        self._tmp = filename + ".tmp"
+        self._hash = hashlib.sha256()
+        self._f = open(self._tmp, 'wb', buffering=1 << 20)
+
+    def write(self, *chunks):
+        for chunk in chunks:
+            data = chunk.encode()
+            self._hash.update(data)
+            self._f.write(data)
+
+    def close(self):
+        if self._f.closed:
+            return
+        self._f.close()
+        digest = self._hash.hexdigest()
+        self.written = not os.path.exists(self.filename) or file_hash(self.filename) != digest
+        if self.written:
+            os.replace(self._tmp, self.filename)
+        else:
+            os.remove(self._tmp)
+        self.manifest._record(self.filename, self.inputs, digest, self.written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # leave the previous output in place
+            self._f.close()
+            os.remove(self._tmp)
+
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
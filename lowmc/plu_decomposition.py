@@ -1,6 +1,7 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-from sage.all import GF, matrix, vector, Permutation
+from math import log2
+from gf2 import Matrix, permutation, to_cycles
 
 """
 Utilities for compiling constant matrix multiplications into no-ancilla Q# code
@@ -14,15 +15,15 @@ NOTE:
 """
 
 def MatrixToPermutation(P):
-    n = P.dimensions()[1]
-    ei = lambda i: vector([int(i == j) for j in range(n)])
-    def ie(v):
-        for _ in range(n):
-            if v[_] == 1: return _
-    for i in range(n): assert(ie(ei(i)) == i) # check
-    p = [ie(P * ei(i)) + 1 for i in range(n)] # need to shift up by one
+    """
+    Returns p such that P maps unit vector i to unit vector p[i].
 
-    return Permutation(p)
+    TESTS:
+        >>> from gf2 import Matrix
+        >>> MatrixToPermutation(Matrix([[0, 1, 0], [0, 0, 1], [1, 0, 0]]))
+        [2, 0, 1]
+    """
+    return permutation(P)
 
 
 def CycleToTranspositions(C):
@@ -34,40 +35,428 @@ def CycleToTranspositions(C):
     return res
 
 
+def PermutationToTranspositions(perm):
+    """
+    Transpositions applying permutation perm (mapping unit vector i to unit vector perm[i]),
+    in the order they are applied.
+
+    TESTS:
+        >>> PermutationToTranspositions([1, 2, 0, 3])
+        [(1, 2), (0, 1)]
+    """
+    cycles = map(CycleToTranspositions, to_cycles(perm, singletons=False))
+    cycles = [e for sub in cycles for e in sub]
+    # apply cycles right to left
+    return cycles[::-1]
+
+
 def PermutationToREWIRE(P, bufname="state", tabs=0, spaces=4):
-    code = ""
+    """
+    REWIREs applying permutation P, given as a permutation matrix or as the list of images.
+    """
+    perm = P if isinstance(P, list) else MatrixToPermutation(P)
+    return TranspositionsToREWIRE(PermutationToTranspositions(perm), bufname, tabs, spaces)
+
+
+def TranspositionsToREWIRE(transpositions, bufname="state", tabs=0, spaces=4):
+    """
+    REWIREs swapping the given pairs of qubits, in order.
+
+    TESTS:
+        >>> print(TranspositionsToREWIRE([(0, 3)], tabs=1), end="")
+            REWIRE(state[0], state[3], costing);
+    """
     tab = (" " * spaces) if spaces > 0 else "\t"
-    perm = MatrixToPermutation(P)
-    cycles = map(CycleToTranspositions, perm.to_cycles(singletons=False))
-    cycles = [e for sub in cycles for e in sub]
+    return "".join('%sREWIRE(%s[%d], %s[%d], costing);\n' % (tab * tabs, bufname, c[0], bufname, c[1]) for c in transpositions)
 
-    for c in cycles[::-1]: # apply cycles right to left
-        l, r = c[0]-1, c[1]-1 # sage Permutations work on {1..n}, so had to shift up indices
-        code += '%sREWIRE(%s[%d], %s[%d], costing);\n' % (tab * tabs, bufname, l, bufname, r)
-    return code
 
+# Compile-time relabelling of qubits.
+#
+# A layout lists, for every entry of a register, the qubit currently holding it. Rather than
+# applying the permutation left by the synthesis of a matrix, it can be folded into the layout,
+# and every later CNOT addresses the qubits through the layout. Qubits only have to be swapped
+# back where code that is not generated expects entries in place.
 
-def UpperTriangularToCNOT(U, bufname="state", tabs=0, spaces=4, use_apply_each=True):
-    code = ""
+def RelabelCNOTs(cnots, layout, offset=0):
+    """
+    Maps CNOTs on entries of a register to CNOTs on the qubits holding them, the register
+    starting at qubit offset.
+
+    TESTS:
+        >>> RelabelCNOTs([(0, 1), (2, 0)], [2, 0, 1], offset=3)
+        [(5, 3), (4, 5)]
+    """
+    return [(offset + layout[c], offset + layout[t]) for c, t in cnots]
+
+
+def PermuteLayout(layout, perm):
+    """
+    Layout after permutation perm (entry i moves to entry perm[i]) is folded into it instead of
+    being applied to the qubits.
+
+    TESTS:
+        >>> PermuteLayout([0, 1, 2, 3], [1, 2, 0, 3])
+        [2, 0, 1, 3]
+    """
+    new = [0] * len(layout)
+    for i in range(len(layout)):
+        new[perm[i]] = layout[i]
+    return new
+
+
+def FixLayout(layout, entries=None):
+    """
+    Swaps of qubits bringing every entry j in entries (all of them if None) back to qubit j.
+    Other entries may end up anywhere else. Returns the swaps, in order, and the new layout.
+
+    TESTS:
+        >>> FixLayout([2, 0, 1, 3])
+        ([(2, 0), (2, 1)], [0, 1, 2, 3])
+        >>> FixLayout([3, 2, 1, 0], entries=[3])
+        ([(0, 3)], [0, 2, 1, 3])
+    """
+    layout = list(layout)
+    holds = [0] * len(layout)
+    for j, q in enumerate(layout):
+        holds[q] = j
+    swaps = []
+    for j in (range(len(layout)) if entries is None else entries):
+        q = layout[j]
+        if q == j:
+            continue
+        # the entry on qubit j moves to qubit q
+        other = holds[j]
+        swaps.append((q, j))
+        layout[j], layout[other] = j, q
+        holds[j], holds[q] = j, other
+    return swaps, layout
+
+
+def CNOTsToQSharp(cnots, bufname="state", tabs=0, spaces=4, use_apply_each=True, layers=None):
+    """
+    Q# code for a list of (control, target) pairs, either as the body of an ApplyToEachA
+    array or as explicit CNOT calls. If the layer of every CNOT is passed (see ScheduleCNOTs),
+    the CNOTs of every layer go on their own line(s) with a "// layer" comment.
+
+    TESTS:
+        >>> CNOTsToQSharp([(1, 0), (2, 1)])
+        '(1, 0),(2, 1),'
+        >>> print(CNOTsToQSharp([(1, 0)], tabs=1, use_apply_each=False), end="")
+            CNOT(state[1], state[0]);
+        >>> print(CNOTsToQSharp([(1, 0), (3, 2), (2, 1)], tabs=1, layers=[0, 0, 1]), end="")
+            (1, 0),(3, 2), // layer 0
+            (2, 1), // layer 1
+        >>> print(CNOTsToQSharp([(1, 0), (3, 2)], use_apply_each=False, layers=[0, 0]), end="")
+        // layer 0
+        CNOT(state[1], state[0]);
+        CNOT(state[3], state[2]);
+    """
     tab = (" " * spaces) if spaces > 0 else "\t"
-    for row in range(U.dimensions()[0]):
-        for col in range(row + 1, U.dimensions()[1]):
-            if U[row][col] == 1:
-                if use_apply_each:
-                    code += "%s(%d, %d)," % (tab * tabs * 0, col, row)
-                else:
-                    code += "%sCNOT(%s[%d], %s[%d]);\n" % (tab * tabs, bufname, col, bufname, row)
-    return code
+    code = []
+    if layers is not None:
+        for k, ((control, target), layer) in enumerate(zip(cnots, layers)):
+            new_layer = k == 0 or layers[k-1] != layer
+            if use_apply_each:
+                code.append("%s(%d, %d)," % (tab * tabs if new_layer else "", control, target))
+                if k == len(cnots) - 1 or layers[k+1] != layer:
+                    code.append(" // layer %d\n" % layer)
+            else:
+                if new_layer:
+                    code.append("%s// layer %d\n" % (tab * tabs, layer))
+                code.append("%sCNOT(%s[%d], %s[%d]);\n" % (tab * tabs, bufname, control, bufname, target))
+    elif use_apply_each:
+        code = ["(%d, %d)," % (control, target) for control, target in cnots]
+    else:
+        code = ["%sCNOT(%s[%d], %s[%d]);\n" % (tab * tabs, bufname, control, bufname, target) for control, target in cnots]
+    return "".join(code)
+
+
+def UpperTriangularCNOTs(U):
+    """
+    CNOTs computing U * x in place, for U upper triangular with unit diagonal.
+    """
+    return [(col, row) for row in range(U.dimensions()[0]) for col in range(row + 1, U.dimensions()[1]) if (U.rows[row] >> col) & 1]
+
+
+def LowerTriangularCNOTs(L):
+    """
+    CNOTs computing L * x in place, for L lower triangular with unit diagonal.
+    """
+    return [(col, row) for row in range(L.dimensions()[0])[::-1] for col in range(row) if (L.rows[row] >> col) & 1]
+
+
+def UpperTriangularToCNOT(U, bufname="state", tabs=0, spaces=4, use_apply_each=True):
+    return CNOTsToQSharp(UpperTriangularCNOTs(U), bufname=bufname, tabs=tabs, spaces=spaces, use_apply_each=use_apply_each)
 
 
 def LowerTriangularToCNOT(L, bufname="state", tabs=0, spaces=4, use_apply_each=True):
-    code = ""
-    tab = (" " * spaces) if spaces > 0 else "\t"
-    for row in range(L.dimensions()[0])[::-1]:
-        for col in range(row):
-            if L[row][col] == 1:
-                if use_apply_each:
-                    code += "%s(%d, %d)," % (tab * tabs * 0, col, row)
-                else:
-                    code += "%sCNOT(%s[%d], %s[%d]);\n" % (tab * tabs, bufname, col, bufname, row)
-    return code
+    return CNOTsToQSharp(LowerTriangularCNOTs(L), bufname=bufname, tabs=tabs, spaces=spaces, use_apply_each=use_apply_each)
+
+
+# Synthesis backends.
+#
+# Every backend takes an invertible gf2.Matrix M and returns (parts, perm), where parts is a list
+# of (name, cnots) and perm a permutation, such that applying the CNOTs of every part in order
+# and then the permutation (as REWIREs, see PermutationToREWIRE) computes M * x in place. Parts
+# are emitted as separate Q# operations, named after the part.
+
+def SynthesizePLU(M):
+    """
+    One CNOT per nonzero off-diagonal entry of the PLU factors of M.
+    """
+    P, L, U = M.LU()
+    return [("U", UpperTriangularCNOTs(U)), ("L", LowerTriangularCNOTs(L))], permutation(P)
+
+
+def _lower_elimination(rows, n, section_size):
+    """
+    Patel-Markov-Hayes elimination of the entries below the diagonal of the packed rows,
+    in place. Returns the row operations done, as (source, destination) pairs.
+    """
+    ops = []
+    for start in range(0, n, section_size):
+        end = min(start + section_size, n)
+        mask = (1 << (end - start)) - 1
+
+        # remove duplicate sub-rows in the section with a single row operation each
+        patterns = {}
+        for row in range(start, n):
+            pattern = (rows[row] >> start) & mask
+            if pattern == 0:
+                continue
+            if pattern not in patterns:
+                patterns[pattern] = row
+            else:
+                rows[row] ^= rows[patterns[pattern]]
+                ops.append((patterns[pattern], row))
+
+        # Gaussian elimination of the rest of the section
+        for col in range(start, end):
+            diag_one = (rows[col] >> col) & 1
+            for row in range(col + 1, n):
+                if (rows[row] >> col) & 1:
+                    if not diag_one:
+                        rows[col] ^= rows[row]
+                        ops.append((row, col))
+                        diag_one = 1
+                    rows[row] ^= rows[col]
+                    ops.append((col, row))
+    return ops
+
+
+def SynthesizePMH(M, section_size=None):
+    """
+    Patel-Markov-Hayes synthesis [PMH08]: block-wise elimination of the lower triangle of M
+    and then of the transpose of what is left, removing repeated sub-rows of section_size
+    columns with a single CNOT. Needs O(n^2 / log n) CNOTs.
+
+    [PMH08] Patel, Markov, Hayes. Optimal synthesis of linear reversible circuits.
+            Quantum Information and Computation 8(3), 2008.
+
+    :params section_size:   number of columns per section, defaults to log2(n)/2
+    """
+    n = M.dimensions()[0]
+    if section_size is None:
+        section_size = max(1, int(round(log2(n) / 2)))
+    rows = list(M.rows)
+    lower_ops = _lower_elimination(rows, n, section_size)
+    # rows is now upper triangular, eliminate its transpose the same way
+    rows = Matrix(rows, n).transpose().rows
+    upper_ops = _lower_elimination(rows, n, section_size)
+    if rows != Matrix.identity(n).rows:
+        raise ZeroDivisionError("matrix must be nonsingular")
+
+    # M = E_L^-1 * (E_U^-1)^T, where transposing a row operation swaps source and destination
+    upper = [(dst, src) for src, dst in upper_ops]
+    lower = lower_ops[::-1]
+    return [("U", upper), ("L", lower)], list(range(n))
+
+
+def SynthesizeGreedy(M):
+    """
+    Greedy column reduction. Reduces M to a permutation matrix by adding columns together,
+    at every step picking the addition that lowers the number of ones in M the most, and
+    finishing with a greedily ordered Gauss-Jordan elimination once no addition helps.
+    Needs NumPy.
+    """
+    import numpy as np
+
+    n = M.dimensions()[0]
+    # columns of M, so that adding column c to column t is A[t] ^= A[c]
+    cols = M.transpose().rows
+    A = np.array([[(c >> j) & 1 for j in range(n)] for c in cols], dtype=np.int32)
+    weight = A.sum(axis=1)
+    overlap = A @ A.T
+    cnots = []
+
+    while True:
+        # weight(A[t] ^ A[c]) = weight[t] + weight[c] - 2 overlap[t, c]
+        gain = 2 * overlap - weight[None, :]
+        np.fill_diagonal(gain, 0)
+        t, c = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[t, c] <= 0:
+            break
+        A[t] ^= A[c]
+        weight[t] = A[t].sum()
+        overlap[t, :] = A @ A[t]
+        overlap[:, t] = overlap[t, :]
+        # M * (I + e_c e_t^T) adds column c to column t, and (I + e_c e_t^T) * x is CNOT(x[t], x[c])
+        cnots.append((int(t), int(c)))
+
+    # Gauss-Jordan elimination, clearing first the rows of M with fewest ones and pivoting on
+    # the lightest column
+    done = np.zeros(n, dtype=bool)
+    pivoted = np.zeros(n, dtype=bool)
+    for _ in range(n):
+        counts = A.sum(axis=0)
+        counts[done] = n + 1
+        row = np.argmin(counts)
+        candidates = np.flatnonzero(~pivoted & (A[:, row] == 1))
+        if len(candidates) == 0:
+            raise ZeroDivisionError("matrix must be nonsingular")
+        c = candidates[np.argmin(weight[candidates])]
+        done[row] = pivoted[c] = True
+        for t in np.flatnonzero(A[:, row]):
+            if t != c:
+                A[t] ^= A[c]
+                weight[t] = A[t].sum()
+                cnots.append((int(t), int(c)))
+
+    # M * F = Q with Q a permutation matrix, so M = Q * F^-1
+    perm = [int(j) for j in np.argmax(A, axis=1)]
+    return [("CNOT", cnots)], perm
+
+
+SYNTHESIS = {
+    "plu": SynthesizePLU,
+    "pmh": SynthesizePMH,
+    "greedy": SynthesizeGreedy,
+}
+
+
+def Synthesize(M, method="plu"):
+    """
+    CNOT circuit computing M * x in place, see the synthesis backends above. The "best" method
+    runs every backend and keeps the circuit with fewest CNOTs, then lowest CNOT depth.
+
+    TESTS:
+        >>> import random
+        >>> from gf2 import Matrix, rank
+        >>> random.seed(0)
+        >>> res = []
+        >>> for n in [1, 7, 24, 33]:
+        ...     M = Matrix([[random.randint(0, 1) for _ in range(n)] for _ in range(n)])
+        ...     while rank(M) < n:
+        ...         M = Matrix([[random.randint(0, 1) for _ in range(n)] for _ in range(n)])
+        ...     res.append([CircuitMatrix(*Synthesize(M, method), n=n) == M for method in ["plu", "pmh", "greedy", "best"]])
+        >>> res == [[True] * 4] * 4
+        True
+        >>> parts, perm = Synthesize(Matrix.identity(5), "greedy")
+        >>> CNOTCount(parts), perm
+        (0, [0, 1, 2, 3, 4])
+    """
+    if method == "best":
+        n = M.dimensions()[0]
+        circuits = [Synthesize(M, m) for m in sorted(SYNTHESIS)]
+        return min(circuits, key=lambda c: (CNOTCount(c[0]), CNOTDepth(c[0], n)))
+    if method not in SYNTHESIS:
+        raise ValueError("Unknown synthesis method %s" % method)
+    return SYNTHESIS[method](M)
+
+
+def CNOTCount(parts):
+    return sum(len(cnots) for _, cnots in parts)
+
+
+def CNOTDepth(parts, n):
+    """
+    Depth of the CNOTs in parts when every gate is applied as early as possible. REWIREs are
+    not counted, as they are free when costing.
+
+    TESTS:
+        >>> CNOTDepth([("U", [(0, 1), (2, 3), (1, 2)]), ("L", [(0, 3)])], 4)
+        2
+    """
+    level = [0] * n
+    for _, cnots in parts:
+        for control, target in cnots:
+            level[control] = level[target] = max(level[control], level[target]) + 1
+    return max(level) if n > 0 else 0
+
+
+def CircuitMatrix(parts, perm, n):
+    """
+    Matrix of the linear map computed by a synthesised circuit.
+    """
+    # track the images of the unit vectors as columns
+    cols = [1 << i for i in range(n)]
+    for _, cnots in parts:
+        for control, target in cnots:
+            cols = [col ^ (((col >> control) & 1) << target) for col in cols]
+    cols = [sum(((col >> i) & 1) << perm[i] for i in range(n)) for col in cols]
+    return Matrix(cols, n).transpose()
+
+
+def ScheduleCNOTs(cnots, n):
+    """
+    Layered schedule of a CNOT list. CNOTs sharing a control, or sharing a target, commute, so
+    every CNOT only has to come after the earlier ones that use its control as a target or its
+    target as a control. CNOTs are taken in order and put in the first layer after those in
+    which neither of their qubits is busy (list scheduling).
+
+    Returns the CNOTs sorted by layer (stable), and the layer of each.
+
+    TESTS:
+        >>> ScheduleCNOTs([(0, 1), (0, 2), (3, 2), (1, 3)], 4)
+        ([(0, 1), (3, 2), (0, 2), (1, 3)], [0, 0, 1, 1])
+        >>> import random
+        >>> from gf2 import Matrix
+        >>> cnots = [tuple(random.sample(range(20), 2)) for _ in range(400)]
+        >>> scheduled, layers = ScheduleCNOTs(cnots, 20)
+        >>> CircuitMatrix([("C", scheduled)], list(range(20)), 20) == CircuitMatrix([("C", cnots)], list(range(20)), 20)
+        True
+        >>> CNOTDepth([("C", scheduled)], 20) <= max(layers) + 1 <= CNOTDepth([("C", cnots)], 20)
+        True
+    """
+    # last layer in which a qubit was a control, resp. a target
+    last_control = [-1] * n
+    last_target = [-1] * n
+    busy = [set() for _ in range(n)]
+    layers = []
+    for control, target in cnots:
+        layer = max(last_target[control], last_control[target]) + 1
+        while layer in busy[control] or layer in busy[target]:
+            layer += 1
+        busy[control].add(layer)
+        busy[target].add(layer)
+        last_control[control] = max(last_control[control], layer)
+        last_target[target] = max(last_target[target], layer)
+        layers.append(layer)
+    order = sorted(range(len(cnots)), key=lambda k: layers[k])
+    return [cnots[k] for k in order], [layers[k] for k in order]
+
+
+def ScheduleParts(parts, n, name="CNOT"):
+    """
+    Schedules the CNOTs of all parts together (see ScheduleCNOTs). Gates move across part
+    boundaries, so the scheduled circuit is returned as a single part called name: no slice of it
+    computes one of the original parts on its own.
+
+    Returns (parts, layers), with layers[i] the layers of the CNOTs of parts[i].
+
+    TESTS:
+        >>> from gf2 import Matrix
+        >>> M = Matrix([[1, 1, 0, 1], [0, 1, 1, 0], [1, 0, 1, 1], [0, 0, 1, 1]], 4)
+        >>> parts, perm = SynthesizePLU(M)
+        >>> scheduled, layers = ScheduleParts(parts, 4)
+        >>> [name for name, _ in scheduled], CNOTCount(scheduled) == CNOTCount(parts), len(layers[0]) == CNOTCount(parts)
+        (['CNOT'], True, True)
+        >>> CircuitMatrix(scheduled, perm, 4) == CircuitMatrix(parts, perm, 4)
+        True
+    """
+    scheduled, layers = ScheduleCNOTs([g for _, cnots in parts for g in cnots], n)
+    return [(name, scheduled)], [layers]
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,7 +1,24 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-import qsharp
+import os
+if "QSHARP_SERVER" not in os.environ:
+    # compiles the Q# project, unless run through ../qsharp_server.py test
+    import qsharp
 import lowmc
+from lowmc_scheme import LowMCScheme, CATEGORIES
+
+
+def available_schemes():
+    """
+    LowMC schemes for which the Q# affine layers and key expansion have been generated.
+    Schemes are loaded once and shared across tests.
+    """
+    import os.path
+    ret = []
+    for i in CATEGORIES:
+        if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
+            ret.append(LowMCScheme.load(i))
+    return ret
 
 class Tests:
 
@@ -79,22 +96,7 @@ class Tests:
         print("%s AffineLayer()" %("Costing" if cost else "Testing"))
         import random
         from QTests.LowMC import AffineLayer # pylint: disable=no-name-in-module,import-error
-        import L1, L3, L5
-        import L0
-        def detect_schemes():
-            import os.path
-            ret = []
-            for i in [0, 1, 3, 5]:
-                if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
-                    ret.append(i)
-            return ret
-
-        schemes = list(filter(lambda x: x['id'] in detect_schemes(), [
-            { 'id': 0, 'rounds': L0.rounds, 'blocksize': L0.blocksize, 'keysize': L0.keysize, 'KM': L0.KM, 'LM': L0.LM, 'b': L0.b, 'sboxes': 10 },
-            { 'id': 1, 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 },
-            { 'id': 3, 'rounds': L3.rounds, 'blocksize': L3.blocksize, 'keysize': L3.keysize, 'KM': L3.KM, 'LM': L3.LM, 'b': L3.b, 'sboxes': 10 },
-            { 'id': 5, 'rounds': L5.rounds, 'blocksize': L5.blocksize, 'keysize': L5.keysize, 'KM': L5.KM, 'LM': L5.LM, 'b': L5.b, 'sboxes': 10 },
-        ]))
+        schemes = available_schemes()
 
         for scheme in schemes:
             rounds, blocksize = scheme['rounds'], scheme['blocksize']
@@ -124,22 +126,7 @@ class Tests:
         print("%s KeyExpansion()" %("Costing" if cost else "Testing"))
         import random
         from QTests.LowMC import KeyExpansion # pylint: disable=no-name-in-module,import-error
-        import L1, L3, L5
-        import L0
-        def detect_schemes():
-            import os.path
-            ret = []
-            for i in [0, 1, 3, 5]:
-                if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
-                    ret.append(i)
-            return ret
-
-        schemes = list(filter(lambda x: x['id'] in detect_schemes(), [
-            { 'id': 0, 'rounds': L0.rounds, 'blocksize': L0.blocksize, 'keysize': L0.keysize, 'KM': L0.KM, 'LM': L0.LM, 'b': L0.b, 'sboxes': 10 },
-            { 'id': 1, 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 },
-            { 'id': 3, 'rounds': L3.rounds, 'blocksize': L3.blocksize, 'keysize': L3.keysize, 'KM': L3.KM, 'LM': L3.LM, 'b': L3.b, 'sboxes': 10 },
-            { 'id': 5, 'rounds': L5.rounds, 'blocksize': L5.blocksize, 'keysize': L5.keysize, 'KM': L5.KM, 'LM': L5.LM, 'b': L5.b, 'sboxes': 10 },
-        ]))
+        schemes = available_schemes()
 
         for scheme in schemes:
             rounds, keysize = scheme['rounds'], scheme['keysize']
@@ -173,22 +160,7 @@ class Tests:
         print("%s Round()" %("Costing" if cost else "Testing"))
         import random
         from QTests.LowMC import Round # pylint: disable=no-name-in-module,import-error
-        import L1, L3, L5
-        import L0
-        def detect_schemes():
-            import os.path
-            ret = []
-            for i in [0, 1, 3, 5]:
-                if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
-                    ret.append(i)
-            return ret
-
-        schemes = list(filter(lambda x: x['id'] in detect_schemes(), [
-            { 'id': 0, 'rounds': L0.rounds, 'blocksize': L0.blocksize, 'keysize': L0.keysize, 'KM': L0.KM, 'LM': L0.LM, 'b': L0.b, 'sboxes': 10 },
-            { 'id': 1, 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 },
-            { 'id': 3, 'rounds': L3.rounds, 'blocksize': L3.blocksize, 'keysize': L3.keysize, 'KM': L3.KM, 'LM': L3.LM, 'b': L3.b, 'sboxes': 10 },
-            { 'id': 5, 'rounds': L5.rounds, 'blocksize': L5.blocksize, 'keysize': L5.keysize, 'KM': L5.KM, 'LM': L5.LM, 'b': L5.b, 'sboxes': 10 },
-        ]))
+        schemes = available_schemes()
 
         for scheme in schemes:
             rounds, keysize, blocksize = scheme['rounds'], scheme['keysize'], scheme['blocksize']
@@ -201,7 +173,7 @@ class Tests:
                     if cost:
                         raise ValueError("Use Driver.cs")
                     state = lowmc.LowMCRound(in_s[::], rk[::], _round, scheme, in_place=True)
-                    qstate = Round.toffoli_simulate(in_state=in_s, round_key=lowmc.RoundKey(rk, _round, scheme, in_place=True, IKM=IKM), round=_round, id=scheme['id'], costing=False)
+                    qstate = Round.toffoli_simulate(in_state=in_s, round_key=lowmc.RoundKey(rk, _round, scheme, in_place=True, IKM=scheme.IKM), round=_round, id=scheme['id'], costing=False)
                     res.append(state == qstate)
                     if (state != qstate):
                         print("Error")
@@ -219,22 +191,7 @@ class Tests:
         print("%s Encrypt()" %("Costing" if cost else "Testing"))
         import random
         from QTests.LowMC import Encrypt # pylint: disable=no-name-in-module,import-error
-        import L1, L3, L5
-        import L0
-        def detect_schemes():
-            import os.path
-            ret = []
-            for i in [0, 1, 3, 5]:
-                if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
-                    ret.append(i)
-            return ret
-
-        schemes = list(filter(lambda x: x['id'] in detect_schemes(), [
-            { 'id': 0, 'rounds': L0.rounds, 'blocksize': L0.blocksize, 'keysize': L0.keysize, 'KM': L0.KM, 'LM': L0.LM, 'b': L0.b, 'sboxes': 10 },
-            { 'id': 1, 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 },
-            { 'id': 3, 'rounds': L3.rounds, 'blocksize': L3.blocksize, 'keysize': L3.keysize, 'KM': L3.KM, 'LM': L3.LM, 'b': L3.b, 'sboxes': 10 },
-            { 'id': 5, 'rounds': L5.rounds, 'blocksize': L5.blocksize, 'keysize': L5.keysize, 'KM': L5.KM, 'LM': L5.LM, 'b': L5.b, 'sboxes': 10 },
-        ]))
+        schemes = available_schemes()
 
         for scheme in schemes:
             keysize, blocksize = scheme['keysize'], scheme['blocksize']
@@ -266,25 +223,11 @@ class Tests:
         print("%s GroverOracle(pairs=%d)" %("Costing" if cost else "Testing", pairs))
         from random import randint
         from QTests.LowMC import GroverOracle # pylint: disable=no-name-in-module,import-error
-        import L1, L3, L5
-        import L0
-        def detect_schemes():
-            import os.path
-            ret = []
-            for i in [0, 1, 3, 5]:
-                if os.path.exists('in_place_key_expansion_L%d.qs' % i) and os.path.exists('affine_layers_L%d.qs' % i):
-                    ret.append(i)
-            return ret
-
-        schemes = list(filter(lambda x: x['id'] in detect_schemes(), [
-            { 'id': 0, 'rounds': L0.rounds, 'blocksize': L0.blocksize, 'keysize': L0.keysize, 'KM': L0.KM, 'LM': L0.LM, 'b': L0.b, 'sboxes': 10 },
-            { 'id': 1, 'rounds': L1.rounds, 'blocksize': L1.blocksize, 'keysize': L1.keysize, 'KM': L1.KM, 'LM': L1.LM, 'b': L1.b, 'sboxes': 10 },
-            { 'id': 3, 'rounds': L3.rounds, 'blocksize': L3.blocksize, 'keysize': L3.keysize, 'KM': L3.KM, 'LM': L3.LM, 'b': L3.b, 'sboxes': 10 },
-            { 'id': 5, 'rounds': L5.rounds, 'blocksize': L5.blocksize, 'keysize': L5.keysize, 'KM': L5.KM, 'LM': L5.LM, 'b': L5.b, 'sboxes': 10 },
-        ]))
+        schemes = available_schemes()
 
         for scheme in schemes:
             keysize, blocksize = scheme['keysize'], scheme['blocksize']
+            engine = scheme.packed
             res = []
             trials = 10
             for _ in range(trials):
@@ -293,10 +236,10 @@ class Tests:
                 if cost:
                     raise ValueError("Use Driver.cs")
 
-                # compute p-c pairs
+                # compute p-c pairs, the key is only expanded once
                 target_ciphertext = []
                 for _ in range(pairs):
-                    target_ciphertext += lowmc.Encrypt(key[::], messages[_*blocksize:(_+1)*blocksize], scheme)
+                    target_ciphertext += engine.Encrypt(key[::], messages[_*blocksize:(_+1)*blocksize])
 
                 # test also that we correctly fail to identify wrong keys
                 flip = bool(randint(0, 1))
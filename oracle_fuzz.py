@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Differential fuzzing of the AES and LowMC Grover oracles against the classical implementations.
+
+A test case is a key k, the plaintexts of the r plaintext-ciphertext pairs and a target key k',
+and the oracle is asked whether k encrypts the plaintexts to their ciphertexts under k'. The
+expected answer comes from the batched classical engines (aes_batch, lowmc_batch), and the
+oracle's from the Toffoli simulator, through the batched test operations
+(QTests.AES.SmartWideGroverOracleBatch, QTests.LowMC.GroverOracleBatch), a few hundred cases
+per call.
+
+Besides random cases, the corpus holds structured cases where bugs tend to hide: keys of
+Hamming weight at most 2, all-zero and all-one plaintexts and keys, and for some keys every key
+at Hamming distance 1. Failing cases are shrunk, by clearing as many set bits as possible while
+the case still fails, and appended to a regression corpus that is replayed before anything
+else on the following runs.
+
+    cd aes
+    python3 ../oracle_fuzz.py aes --Nk 4 --pairs 2 --cases 20000
+    cd ../lowmc
+    python3 ../oracle_fuzz.py lowmc -c 1 --pairs 1 --server
+
+All vectors are uint8 arrays of bits, in the order of the Q# registers (see registers.py).
+"""
+import collections
+import json
+import os
+import sys
+
+import numpy as np
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [_ROOT, os.path.join(_ROOT, "aes"), os.path.join(_ROOT, "lowmc")]
+from registers import decode_bits, encode_bits
+import aes_batch
+import lowmc_batch
+
+
+class Cases(collections.namedtuple("Cases", ["keys", "plaintexts", "target_keys"])):
+    """
+    A batch of test cases, as (N, key_bits), (N, pairs*block_bits) and (N, key_bits) arrays.
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def take(self, index):
+        return Cases(*(a[index] for a in self))
+
+    @staticmethod
+    def concatenate(batches):
+        return Cases(*(np.concatenate(arrays) for arrays in zip(*batches)))
+
+
+class Target(object):
+    """
+    A Grover oracle under test. Subclasses give the classical encryption and the simulation
+    of the oracle, both on batches.
+    """
+    name = None
+    key_bits = None
+    block_bits = None
+    pairs = 1
+
+    def encrypt(self, keys, plaintexts):
+        """
+        Ciphertexts of the plaintexts of every case, as an (N, pairs*block_bits) array.
+        """
+        raise NotImplementedError
+
+    def oracle(self, cases):
+        """
+        Outputs of the oracle for every case, as an array of 0/1.
+        """
+        raise NotImplementedError
+
+    def expected(self, cases):
+        ciphertexts = self.encrypt(cases.target_keys, cases.plaintexts)
+        return np.all(self.encrypt(cases.keys, cases.plaintexts) == ciphertexts, axis=1).astype(np.uint8)
+
+
+class AESTarget(Target):
+    """
+    QAES.SmartWide.GroverOracle for AES-128, -192 or -256, run from the aes directory.
+    """
+
+    def __init__(self, Nk=4, pairs=1, in_place_mixcolumn=True, widest=False):
+        self.Nk = Nk
+        self.Nr = {4: 10, 6: 12, 8: 14}[Nk]
+        self.pairs = pairs
+        self.in_place_mixcolumn = in_place_mixcolumn
+        self.widest = widest
+        self.key_bits = 32 * Nk
+        self.block_bits = 128
+        self.name = "aes-%d-r%d-%s-MC%s" % (self.key_bits, pairs, "in-place" if in_place_mixcolumn else "out-of-place", "-widest" if widest else "")
+
+    def encrypt(self, keys, plaintexts):
+        n = len(keys)
+        keys = np.repeat(np.packbits(keys, axis=-1, bitorder='little'), self.pairs, axis=0)
+        blocks = np.packbits(plaintexts, axis=-1, bitorder='little').reshape(n * self.pairs, 16)
+        ciphertexts = aes_batch.Rijndael(blocks, keys, Nk=self.Nk, Nr=self.Nr)
+        return np.unpackbits(ciphertexts.reshape(n, -1), axis=-1, bitorder='little')
+
+    def oracle(self, cases):
+        from QTests.AES import SmartWideGroverOracleBatch # pylint: disable=no-name-in-module,import-error
+        ciphertexts = self.encrypt(cases.target_keys, cases.plaintexts)
+        res = SmartWideGroverOracleBatch.toffoli_simulate(_keys=cases.keys.tolist(), _plaintexts=cases.plaintexts.tolist(),
+                                                          target_ciphertexts=ciphertexts.tolist(), pairs=self.pairs,
+                                                          Nr=self.Nr, Nk=self.Nk, in_place_mixcolumn=self.in_place_mixcolumn,
+                                                          widest=self.widest, costing=False)
+        return np.array(res, dtype=np.uint8)
+
+
+class LowMCTarget(Target):
+    """
+    QLowMC.GroverOracle for a LowMC scheme, run from the lowmc directory.
+
+    :params scheme: lowmc_scheme.LowMCScheme
+    :params pairs:  plaintext-ciphertext pairs
+    """
+
+    def __init__(self, scheme, pairs=1):
+        self.scheme = scheme
+        self.pairs = pairs
+        self.key_bits = scheme['keysize']
+        self.block_bits = scheme['blocksize']
+        self.name = "lowmc-%s-r%d" % (scheme.name, pairs)
+
+    def encrypt(self, keys, plaintexts):
+        n = len(keys)
+        blocks = plaintexts.reshape(n * self.pairs, self.block_bits)
+        ciphertexts = lowmc_batch.Encrypt(np.repeat(keys, self.pairs, axis=0), blocks, self.scheme, self.scheme.batch_arrays)
+        return ciphertexts.reshape(n, -1)
+
+    def oracle(self, cases):
+        from QTests.LowMC import GroverOracleBatch # pylint: disable=no-name-in-module,import-error
+        ciphertexts = self.encrypt(cases.target_keys, cases.plaintexts)
+        res = GroverOracleBatch.toffoli_simulate(_keys=cases.keys.tolist(), _plaintexts=cases.plaintexts.tolist(),
+                                                 target_ciphertexts=ciphertexts.tolist(), pairs=self.pairs,
+                                                 id=self.scheme['id'], costing=False)
+        return np.array(res, dtype=np.uint8)
+
+
+# Corpora. Every generator yields batches of Cases for a target.
+
+def _random_bits(rng, n, width):
+    return rng.integers(0, 2, size=(n, width), dtype=np.uint8)
+
+
+def RandomCases(target, rng, count):
+    """
+    Random keys and plaintexts, checked against themselves or against another random key.
+    """
+    keys = _random_bits(rng, count, target.key_bits)
+    plaintexts = _random_bits(rng, count, target.pairs * target.block_bits)
+    other = _random_bits(rng, count, target.key_bits)
+    same = rng.integers(0, 2, size=(count, 1), dtype=np.uint8).astype(bool)
+    yield Cases(keys, plaintexts, np.where(same, keys, other))
+
+
+def LowWeightKeys(target, rng, max_weight=2):
+    """
+    Every key of Hamming weight 0 and 1, and as many random keys of every weight up to
+    max_weight, checked against themselves and against a random key.
+
+    TESTS:
+        >>> t = Target(); t.key_bits, t.block_bits = 8, 8
+        >>> cases = Cases.concatenate(LowWeightKeys(t, np.random.default_rng(0)))
+        >>> len(cases), sorted(set(cases.keys.sum(axis=1).tolist()))
+        (34, [0, 1, 2])
+    """
+    n = target.key_bits
+    keys = [np.zeros((1, n), dtype=np.uint8), np.eye(n, dtype=np.uint8)]
+    for w in range(2, max_weight + 1):
+        k = np.zeros((n, n), dtype=np.uint8)
+        for row in k:
+            row[rng.choice(n, size=w, replace=False)] = 1
+        keys.append(k)
+    keys = np.concatenate(keys)
+    m = len(keys)
+    plaintexts = _random_bits(rng, 2 * m, target.pairs * target.block_bits)
+    yield Cases(np.concatenate([keys, keys]), plaintexts, np.concatenate([keys, _random_bits(rng, m, n)]))
+
+
+def ExtremeBlocks(target, rng):
+    """
+    All-zero and all-one plaintexts, under all-zero, all-one and random keys, checked against
+    themselves and against the key with its first bit flipped.
+    """
+    n, width = target.key_bits, target.pairs * target.block_bits
+    keys = np.concatenate([np.zeros((1, n), dtype=np.uint8), np.ones((1, n), dtype=np.uint8), _random_bits(rng, 2, n)])
+    blocks = np.concatenate([np.zeros((1, width), dtype=np.uint8), np.ones((1, width), dtype=np.uint8)])
+    flipped = keys.copy()
+    flipped[:, 0] ^= 1
+    for target_keys in (keys, flipped):
+        yield Cases(np.repeat(keys, 2, axis=0), np.tile(blocks, (len(keys), 1)), np.repeat(target_keys, 2, axis=0))
+
+
+def SingleBitFlips(target, rng, count=1):
+    """
+    For count random keys k, the key k and every key at Hamming distance 1 from it, checked
+    against k, on the same plaintexts.
+
+    TESTS:
+        >>> t = Target(); t.key_bits, t.block_bits = 8, 8
+        >>> cases = next(SingleBitFlips(t, np.random.default_rng(0)))
+        >>> len(cases), (cases.keys ^ cases.target_keys).sum(axis=1).tolist()
+        (9, [0, 1, 1, 1, 1, 1, 1, 1, 1])
+    """
+    n = target.key_bits
+    for _ in range(count):
+        key = _random_bits(rng, 1, n)
+        keys = np.concatenate([key, key ^ np.eye(n, dtype=np.uint8)])
+        plaintexts = np.repeat(_random_bits(rng, 1, target.pairs * target.block_bits), n + 1, axis=0)
+        yield Cases(keys, plaintexts, np.repeat(key, n + 1, axis=0))
+
+
+def Corpus(target, rng, count, regressions=()):
+    """
+    The regression cases, then the structured corpora, then random cases up to count cases
+    in total.
+    """
+    total = 0
+    for gen in (iter(regressions), LowWeightKeys(target, rng), ExtremeBlocks(target, rng), SingleBitFlips(target, rng, 4)):
+        for cases in gen:
+            total += len(cases)
+            yield cases
+    while total < count:
+        cases = next(RandomCases(target, rng, min(4096, count - total)))
+        total += len(cases)
+        yield cases
+
+
+def _rebatch(batches, size):
+    """
+    The cases of batches, in batches of size cases (the last one may be smaller).
+    """
+    pending, n = [], 0
+    for cases in batches:
+        pending.append(cases)
+        n += len(cases)
+        while n >= size:
+            cases = Cases.concatenate(pending)
+            yield cases.take(slice(0, size))
+            pending, n = [cases.take(slice(size, None))], n - size
+    if n:
+        yield Cases.concatenate(pending)
+
+
+# Shrinking and regression corpus
+
+def Shrink(target, case):
+    """
+    Shrinks a failing case (a Cases of length 1) by clearing set bits of its key, plaintexts
+    and target key, as long as the oracle still disagrees with the expected answer, which must
+    not change. Every step tries clearing every half, quarter, ... and single set bit of every
+    vector, and of the bits set in both keys, in one batch, and keeps the lightest candidate that
+    still fails.
+
+    TESTS:
+        >>> from lowmc_scheme import LowMCScheme
+        >>> import lowmc
+        >>> class Buggy(LowMCTarget):
+        ...     # an oracle ignoring key bit 5 when plaintext bit 3 is set
+        ...     def oracle(self, cases):
+        ...         keys = cases.keys.copy()
+        ...         keys[:, 5] &= 1 - cases.plaintexts[:, 3]
+        ...         return self.expected(Cases(keys, cases.plaintexts, cases.target_keys))
+        >>> target = Buggy(LowMCScheme(0, lowmc.random_scheme(32, 32, 4, seed=0)))
+        >>> rng = np.random.default_rng(1)
+        >>> failures = [f for f in Fuzz(target, Corpus(target, rng, 2000))]
+        >>> len(failures) > 0
+        True
+        >>> case, expected, got = failures[0]
+        >>> small = Shrink(target, case)
+        >>> [np.flatnonzero(v[0]).tolist() for v in small], target.expected(small).tolist()
+        ([[5], [3], [5]], [1])
+    """
+    expected = target.expected(case)
+    while True:
+        candidates = []
+        # bits set in both keys are also cleared together, which keeps matching keys matching
+        both = case.keys[0] & case.target_keys[0]
+        for fields, vector in (((0,), case.keys[0]), ((1,), case.plaintexts[0]), ((2,), case.target_keys[0]), ((0, 2), both)):
+            ones = np.flatnonzero(vector)
+            size = len(ones)
+            while size >= 1:
+                for start in range(0, len(ones), size):
+                    c = [v.copy() for v in case]
+                    for field in fields:
+                        c[field][0, ones[start:start + size]] = 0
+                    candidates.append(Cases(*c))
+                size //= 2
+        if not candidates:
+            return case
+        batch = Cases.concatenate(candidates)
+        batch_expected = target.expected(batch)
+        failing = (target.oracle(batch) != batch_expected) & (batch_expected == expected)
+        if not failing.any():
+            return case
+        weights = sum(v.sum(axis=1) for v in batch)
+        best = np.flatnonzero(failing)[np.argmin(weights[failing])]
+        case = batch.take(slice(best, best + 1))
+
+
+def SaveRegression(path, target, case):
+    """
+    Appends a case to the regression corpus at path, unless it is already there.
+    """
+    record = {"target": target.name}
+    for name, vector in zip(Cases._fields, case):
+        record[name] = "%x" % decode_bits(vector[0], packed=True)
+    if record in _read(path):
+        return False
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+    return True
+
+
+def LoadRegressions(path, target):
+    """
+    Cases of the regression corpus at path recorded for target.
+
+    TESTS:
+        >>> import tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "regressions.jsonl")
+        >>> t = Target(); t.name, t.key_bits, t.block_bits = "t", 8, 8
+        >>> case = Cases(np.array([[1, 0, 0, 0, 0, 0, 0, 1]], dtype=np.uint8), np.ones((1, 8), dtype=np.uint8), np.zeros((1, 8), dtype=np.uint8))
+        >>> SaveRegression(path, t, case), SaveRegression(path, t, case)
+        (True, False)
+        >>> [np.array_equal(a, b) for a, b in zip(next(LoadRegressions(path, t)), case)]
+        [True, True, True]
+    """
+    rows = [r for r in _read(path) if r["target"] == target.name]
+    if not rows:
+        return
+    widths = {"keys": target.key_bits, "plaintexts": target.pairs * target.block_bits, "target_keys": target.key_bits}
+    yield Cases(*(np.array(encode_bits([int(r[name], 16) for r in rows], widths[name], batch=True), dtype=np.uint8)
+                  for name in Cases._fields))
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def Fuzz(target, corpus, batch_size=256, stats=None):
+    """
+    Runs the corpus through the oracle, batch_size cases per simulator call, and yields
+    (case, expected, got) for every case where the oracle is wrong. The number of cases run
+    is kept in stats["cases"], if given.
+    """
+    for cases in _rebatch(corpus, batch_size):
+        if stats is not None:
+            stats["cases"] = stats.get("cases", 0) + len(cases)
+        expected = target.expected(cases)
+        got = target.oracle(cases)
+        for i in np.flatnonzero(expected != got):
+            yield cases.take(slice(i, i + 1)), int(expected[i]), int(got[i])
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Differential fuzzing of the Grover oracles against the classical implementations.")
+    parser.add_argument("cipher", choices=["aes", "lowmc"])
+    parser.add_argument("--Nk", type=int, default=4, choices=[4, 6, 8], help="AES key length in 32-bit words")
+    parser.add_argument("--out-of-place-mixcolumn", action="store_true", help="AES oracle with out-of-place MixColumn")
+    parser.add_argument("-c", "--category", type=int, default=1, help="LowMC security category")
+    parser.add_argument("--pairs", type=int, default=1, help="plaintext-ciphertext pairs")
+    parser.add_argument("--cases", type=int, default=10000, help="total number of cases, structured ones included")
+    parser.add_argument("--batch", type=int, default=256, help="cases per simulator call")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--regressions", default="fuzz_regressions.jsonl", help="regression corpus, replayed first and extended")
+    parser.add_argument("--no-shrink", action="store_true", help="record failures as found")
+    parser.add_argument("--server", action="store_true", help="simulate through qsharp_server.py instead of importing qsharp")
+    args = parser.parse_args()
+
+    if args.server:
+        import qsharp_server
+        qsharp_server.install(".")
+    else:
+        import qsharp # pylint: disable=import-error,unused-import
+
+    if args.cipher == "aes":
+        target = AESTarget(args.Nk, args.pairs, in_place_mixcolumn=not args.out_of_place_mixcolumn)
+    else:
+        from lowmc_scheme import LowMCScheme
+        target = LowMCTarget(LowMCScheme.load(args.category), args.pairs)
+
+    rng = np.random.default_rng(args.seed)
+    regressions = list(LoadRegressions(args.regressions, target))
+    start = time.perf_counter()
+    failures = 0
+    stats = {}
+    for case, expected, got in Fuzz(target, Corpus(target, rng, args.cases, regressions), args.batch, stats):
+        failures += 1
+        if not args.no_shrink:
+            case = Shrink(target, case)
+        new = SaveRegression(args.regressions, target, case)
+        print("FAIL expected %d got %d%s: key %x plaintexts %x target key %x" % (
+            expected, got, "" if new else " (known)", *(decode_bits(v[0], packed=True) for v in case)), flush=True)
+    seconds = time.perf_counter() - start
+    print("%s: %d failures in %d cases, %.1fs" % (target.name, failures, stats.get("cases", 0), seconds))
+    sys.exit(1 if failures else 0)
@@ -1,16 +1,79 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT license.
-#!/usr/bin/env sage
-from sage.all import RealField, pi, arcsin, sqrt, sin, log, floor, ceil, e, exp, Infinity
-R = RealField(1000)
+#!/usr/bin/env python3
+"""
+Cost of Grover key search under a depth limit, parallelised by splitting the key space.
+
+Arithmetic goes through an mpmath context, passed as the last argument ctx of every function:
+R works with 1000 bits of precision (as the Sage RealField(1000) this script used to be written
+against), mpmath.fp works on Python floats, for fast evaluation when two decimals are all that is
+needed. Running the script prints the LaTeX tables of the paper.
+
+TESTS:
+    >>> from mpmath import fp
+    >>> i = iterations(1, 2**128, 1)
+    >>> '%.6e' % i, abs(iterations(1, 2**128, 1, ctx=fp) / i - 1) < 1e-12
+    ('1.448804e+19', True)
+    >>> '%.2f' % p_succ(R.floor(i), 2**128, 1)
+    '1.00'
+"""
+import functools
+from mpmath import MPContext, fp
+import estimates
+
+R = MPContext()
+R.prec = 1000
+
+# entries kept by every memoised function
+CACHE_SIZE = 1 << 12
+
+
+def set_precision(bits):
+    """
+    Sets the working precision of R. The default 1000 bits are far more than the two decimals of
+    the tables need. Memoised values are kept per precision, so they never need clearing.
+    """
+    R.prec = bits
+
+
+def memoize(f):
+    """
+    Bounded memoisation of f(*args, ctx=R), keyed on the arguments and on the precision of ctx.
+    The cache can be inspected and cleared through the cache_info and cache_clear attributes of
+    the result, as for functools.lru_cache.
+
+    TESTS:
+        >>> theta.cache_clear()
+        >>> a = theta(3, 1); set_precision(100); b = theta(3, 1, R); set_precision(1000)
+        >>> a == b, theta(3, 1, ctx=R) == a
+        (False, True)
+        >>> theta.cache_info().hits, theta.cache_info().misses
+        (1, 2)
+    """
+    nargs = f.__code__.co_argcount - 1
 
-def theta(N, t):
+    @functools.lru_cache(maxsize=CACHE_SIZE)
+    def cached(args, ctx, prec):
+        return f(*args, ctx=ctx)
+
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        ctx = args[nargs] if len(args) > nargs else kwargs.get("ctx", R)
+        return cached(args[:nargs], ctx, ctx.prec)
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+
+@memoize
+def theta(N, t, ctx=R):
     """
     Given search space of size N with t solutions, returns angle theta that each Grover iteration advances.
     """
-    return R(arcsin(sqrt(R(t)/N)))
+    return ctx.asin(ctx.sqrt(ctx.mpf(t)/N))
 
-def p_succ(i, N, t):
+def p_succ(i, N, t, ctx=R):
     """
     Success probability after i iterations of measuring a solution.
 
@@ -18,21 +81,26 @@ def p_succ(i, N, t):
     :param  N:  Grover's search space size
     :params t:  target solutions in search space
     """
-    return R((sin((2*i+1)*theta(N, t)))**2)
+    return ctx.sin((2*i+1)*theta(N, t, ctx))**2
 
-def p_succ_outer(p, S):
+def p_succ_outer(p, S, ctx=R):
     """
     Success probability of outer parallelisation strategy using S computers, each with success probability p.
 
     :params p:  success probability for single computer
     :params S:  total number of parallel computers
     """
-    return R((1-(1-p)**S))
+    return 1-(1-ctx.mpf(p))**S
+
+def p_succ_outer_inv(P, S, ctx=R):
+    return p_succ_outer(P, ctx.mpf(1)/S, ctx)
 
-def p_succ_outer_inv(P, S):
-    return R(p_succ_outer(P, R(1)/S))
+@memoize
+def arcsin_sqrt(p, ctx=R):
+    return ctx.asin(ctx.sqrt(p))
 
-def iterations(p, N, t):
+@memoize
+def iterations(p, N, t, ctx=R):
     """
     Grover succeeds with probability p(j) = sin^2((2j+1)theta).
     This is the inverse function for obtaining the number of iterations j from theta and p(j).
@@ -41,9 +109,9 @@ def iterations(p, N, t):
     :params N:  Grover's search space size
     :params t:  targets. Right now, assumed to be 1.
     """
-    return (R(arcsin(sqrt(p)))/theta(N,t) - 1)/2
+    return (arcsin_sqrt(p, ctx)/theta(N, t, ctx) - 1)/2
 
-def cost_out_p(p, S, w, d, N, t):
+def cost_out_p(p, S, w, d, N, t, ctx=R):
     """
     DW cost for running Grover on S machines to achieve success probability p.
 
@@ -54,43 +122,44 @@ def cost_out_p(p, S, w, d, N, t):
     :params N:  Grover's search space size
     :params t:  targets, i.e. number of solutions to the problem
     """
-    return S * w * d * iterations(p, N, t)
+    return S * w * d * iterations(p, N, t, ctx)
 
-def printS(P, w, d, N, t, Smax, M):
+def printS(P, w, d, N, t, Smax, M, ctx=R):
     step = (Smax-1)//M
 
-    for i in xrange(M+1):
+    for i in range(M+1):
         Si = 1 + step*i
-        p = p_succ_outer_inv(P, Si)
-        it = iterations(p, N, t)
-        c = cost_out_p(p, Si, w, d, N, t)
-        print "S = %s, p = %.2f, iter = %.2f, cost = %.2f" % (Si, p, it, log(c, 2))
+        p = p_succ_outer_inv(P, Si, ctx)
+        it = iterations(p, N, t, ctx)
+        c = cost_out_p(p, Si, w, d, N, t, ctx)
+        print("S = %s, p = %.2f, iter = %.2f, cost = %.2f" % (Si, p, it, ctx.log(c, 2)))
 
 
 
 
 # ////////////////////////////////////////////////////////
-def format_pow(a):
+def format_pow(a, ctx=R):
     """
     Given positive real a, format as [0, 1) x 2 ^ {integer power}
 
     :params a:          positive real
     :returns (fa, ea):  a = fa x 2 ^ ea
+
+    TESTS:
+        >>> fa, ea = format_pow(3 * 2**70)
+        >>> '%.2f' % fa, ea
+        ('1.50', 71)
     """
-    loga = log(R(a), 2)
-    try:
-        ea = floor(loga)
-    except:
-        import pdb; pdb.set_trace()
-    fa = R(a)/2**ea
+    ea = int(ctx.floor(ctx.log(a, 2)))
+    fa = ctx.mpf(a)/ctx.mpf(2)**ea
     return (fa, ea)
 
 logMDs = [40, 64, 96]
 
-def spurious_keys_probability(k, n, r, S):
+def spurious_keys_probability(k, n, r, S, ctx=R):
     """
     Inner parallelization can result in reducing the number of plaintext-ciphertext blocks
-    required for a success probability=1 attack, by separating spurious keys in 
+    required for a success probability=1 attack, by separating spurious keys in
     different search spaces.
 
     We compute here the probability that this is _not_ the case.
@@ -99,11 +168,17 @@ def spurious_keys_probability(k, n, r, S):
     :params n:  block size
     :params r:  number of plaintext-ciphertext pairs
     :params S:  number of key space subsets/parallel instances
+
+    TESTS:
+        >>> '%.2f' % R.log(spurious_keys_probability(128, 128, 2, 2**20), 2)
+        '-148.00'
     """
-    p = 1 - exp(-2**(k-n*r)/S)
+    # 1 - exp(-x), without cancellation for small x
+    p = -ctx.expm1(-ctx.mpf(2)**(k-n*r)/S)
     return p
 
-def instances(GD, N, MD, p):
+@memoize
+def instances(GD, N, MD, p, ctx=R):
     """
     The formula from "Optimizing the oracle under a depth limit". Assuming single-target, t = 1.
 
@@ -114,7 +189,7 @@ def instances(GD, N, MD, p):
 
     Assuming p = 1
         In depth MD can fit j = floor(MD/GD) iterations.
-        These give probability 1 for a search space of size M. 
+        These give probability 1 for a search space of size M.
             p(j) = sin((2j+1)theta)**2
             1 = sin((2j+1)theta)**2
             1 = sin((2j+1)theta)
@@ -136,10 +211,17 @@ def instances(GD, N, MD, p):
         Or could just run full depth but have less machines.
             For a target p, one would choose to have ceil(p*S) machines, where S is chosen as in the p = 1 case.
         Then look at which of both strategies gives lower cost.
+
+    TESTS:
+        >>> instances(2816, 2**128, 2**64, 1), instances(2816, 2**128, 2**96, 1)
+        (mpf('4891534.0'), mpf('1.0'))
     """
 
+    # MD and GD are integers, so MD//GD is the exact floor
+    j = MD//GD
+
     # compute the p=1 case first
-    S1 = ceil(N/(2*(2*floor(MD/GD)+1)/pi)**2)
+    S1 = ctx.ceil(N/(2*(2*j+1)/ctx.pi)**2)
 
     # An alternative reasoning giving the same result for p == 1 (up to a very small difference):
     # Inner parallelisation gives sqrt(S) speedup without loosing success prob.
@@ -149,228 +231,335 @@ def instances(GD, N, MD, p):
     if p == 1:
         return S1
     else:
-        Sp = ceil(N*(arcsin(sqrt(R(p)))/(2*floor(MD/GD)+1))**2)
-        if ceil(p*S1) == Sp:
-            print "NOTE: for (GD, log2(N), log2(MD), p) == (%d, %.2f, %.2f, %.2f) naive reduction of parallel machines is not worse!" % (GD, log(N, 2).n(), log(MD, 2).n(), p)
-        elif ceil(p*S1) < Sp:
-            print "NOTE: for (GD, log2(N), log2(MD), p) == (%d, %.2f, %.2f, %.2f) naive reduction of parallel machines is better!" % (GD, log(N, 2).n(), log(MD, 2).n(), p)
-            
-        res = min(Sp, ceil(p*S1))
+        Sp = ctx.ceil(N*(arcsin_sqrt(ctx.mpf(p), ctx)/(2*j+1))**2)
+        if ctx.ceil(p*S1) == Sp:
+            print("NOTE: for (GD, log2(N), log2(MD), p) == (%d, %.2f, %.2f, %.2f) naive reduction of parallel machines is not worse!" % (GD, ctx.log(N, 2), ctx.log(MD, 2), p))
+        elif ctx.ceil(p*S1) < Sp:
+            print("NOTE: for (GD, log2(N), log2(MD), p) == (%d, %.2f, %.2f, %.2f) naive reduction of parallel machines is better!" % (GD, ctx.log(N, 2), ctx.log(MD, 2), p))
+
+        res = min(Sp, ctx.ceil(p*S1))
         return res
 
-def GroverDWCost(cipher, GDs, Ws, Gs, key_pc, ps, spurious_key_threshold=2**(-20), caption="", ignore_r=False, lowmc=False):
+def GroverCost(lk, lMD, r, p, GD, GW, GG, n, ctx=R):
+    """
+    Circuit sizes for finding a key of lk bits with probability p within depth 2^lMD, using
+    inner parallelisation with an oracle of depth GD, width GW and GG gates on r
+    plaintext-ciphertext pairs of n bits.
+
+    :returns:   dict with the Grover iterations needed without depth limit, the number S of
+                parallel instances, depth D, width W, G-cost, DW-cost and the spurious key
+                probability skp
+
+    TESTS:
+        >>> c = GroverCost(128, 64, 1, 1, 2816, 1665, 445376, 128)
+        >>> c['S'], format_pow(c['DW_cost'])[1]
+        (mpf('4891534.0'), 96)
+    """
+    N = 2**lk
+    MD = 2**lMD
+
+    # compute iterations for targetted success p with traditional Grover (1 target only)
+    ip = iterations(p, N, 1, ctx)
+    # Total depth for traditional Grover
+    Dp = ip*GD
+    # Used depth: either MAXDEPTH or the depth of traditional grover
+    D = min(Dp, MD)
+    # How many quantum computers are needed for targetted MAXDEPTH?
+    S = instances(GD, N, MD, p, ctx)
+
+    skp = spurious_keys_probability(lk, n, r, S, ctx)
+
+    c_p = ctx.pi/4
+    if S > 1:
+        G_cost = c_p**2 * ctx.mpf(2)**(lk-lMD) * GD * GG
+        DW_cost = c_p**2 * ctx.mpf(2)**(lk-lMD) * GD**2 * GW
+    else:
+        # Serial Grover!
+        G_cost = ctx.floor(c_p * ctx.mpf(2)**(ctx.mpf(lk)/2)) * GG
+        DW_cost = GW * D
+
+    # total width given S parallel instances
+    W = S * GW
+    return {"iterations": ip, "S": S, "D": D, "W": W, "G_cost": G_cost, "DW_cost": DW_cost, "skp": skp}
+
+def GroverDWCost(cipher, GDs, Ws, Gs, key_pc, ps, spurious_key_threshold=2**(-20), lowmc=False, ctx=R, **tags):
     """
     Given a single-target Grover problem limited by MAXDEPTH, computes the appropriate inner-parallel strategy.
+    Returns a record for every target success probability in ps, MAXDEPTH in logMDs and key size
+    in key_pc, in this order, to be passed to one of the RENDERERS.
+
+    :params GDs, Ws, Gs:    oracle depth, width and gate count, indexed by number of pairs and key size
+    :params key_pc:         (key length, number of plaintext-ciphertext pairs guaranteeing no spurious keys)
+    :params tags:           extra fields added to every record
+
+    TESTS:
+        >>> rec = GroverDWCost("aes", {1: [2816]}, {1: [1665]}, {1: [445376]}, [(128, 1)], [1], mixcolumn="in-place")
+        >>> rec[1]["log_md"], rec[1]["r"], '%.2f' % rec[1]["log2_skp"], rec[1]["mixcolumn"]
+        (64, 1, '-22.22', 'in-place')
     """
-    # print "Unique key:"
+    records = []
     for p in ps:
-        # print "@@@ target p = %.2f" % p
-        table = """
-\\begin{table}
-    \\centering
-    \\renewcommand{\\tabcolsep}{0.05in}
-    \\renewcommand{\\arraystretch}{1.3}
-    \\resizebox{\\textwidth}{!}{
-        \\begin{tabular}{lccccccccc}
-            \\toprule\n"""
-        table += "            scheme & \\texttt{MD} & %s $S$ & %s $D$ & $W$ & $G$-cost & $DW$-cost \\\\ \midrule\n" % (
-            "" if ignore_r else "$r$ &",
-            "" if ignore_r else "$\\log_2{(\\text{SKP})}$ &",
-        )
         for lMD in logMDs:
-            # print "@@@ MAXDEPTH = 2^%s" % lMD
-            # table += "            \\multicolumn{6}{c}$\\nistmaxdepth = 2^{%d}$} \\\\ \midrule\n" % lMD
-            # table += "\\midrule"
-
-            MD = 2**lMD
-            
             for i in range(len(key_pc)):
                 # obtain size of search problem and maxdepth info
                 lk, pairs = key_pc[i]
-                N = 2**lk
-                
-                # compute iterations for targetted success p with traditional Grover (1 target only)
-                ip = iterations(p, N, 1)    
 
                 """
-                we look at how likely are spurious keys in the subset we are searching. 
+                we look at how likely are spurious keys in the subset we are searching.
                 if they arent (< 1/(1<<20)), then we can reduce r, even down to 1!
-                only cost the lowest r, and re-cost the value of W. calling this full function 
+                only cost the lowest r, and re-cost the value of W. calling this full function
                     with different r' != r > whatever we actually need, should result in the same costs
 
                 we also want to deal with the no parallelism required case of aes128 in md96 (check whatsapp)
                 """
                 for r in range(1, pairs+1):
-                    GD = GDs[r][i]  
-                    # Total depth for traditional Grover
-                    Dp = ip*GD
-                    # Used depth: either MAXDEPTH or the depth of traditional grover
-                    D = min(Dp, MD)
-                    # How many quantum computers are needed for targetted MAXDEPTH?
-                    S = instances(GD, N, MD, p)
-                    
-                    skp = spurious_keys_probability(lk, 128 if not lowmc else lk, r, S)
-
-                    c_p = pi/4
-                    GW = Ws[r][i]
-                    GG = Gs[r][i]
-                    if S > 1:
-                        G_cost = c_p**2 * 2**(lk-lMD) * GD * GG
-                        DW_cost = c_p**2 * 2**(lk-lMD) * GD**2 * GW
-                    else:
-                        # Serial Grover!
-                        G_cost = floor(c_p * 2**(lk/2)) * GG
-                        DW_cost = GW * D
-                    
+                    cost = GroverCost(lk, lMD, r, p, GDs[r][i], Ws[r][i], Gs[r][i], 128 if not lowmc else lk, ctx)
+                    skp = cost["skp"]
+
                     # print "@@@@ k = %d,\tMD = %d,\tlog(S) = %.1f,\tr = %d,\tlog2(spurious key prob) %.1f,\tG-cost %.1f,\tDW-cost %.1f" % (lk, lMD, R(log(S,2)), r, R(log(skp,2)), R(log(G_cost,2)), R(log(DW_cost,2)))
-                
+
                     if skp <= spurious_key_threshold:
                         pairs = r
-                        break 
-                
-                # total width given S parallel instances
-                W = S * Ws[pairs][i] 
+                        break
+
+                record = dict(tags)
+                record.update({
+                    "cipher": cipher, "key_length": lk, "log_md": lMD, "p": p, "r": pairs,
+                    "S": cost["S"], "D": cost["D"], "W": cost["W"],
+                    "G_cost": cost["G_cost"], "DW_cost": cost["DW_cost"],
+                    "log2_skp": ctx.log(skp, 2) if skp > 0 else -ctx.inf,
+                })
+                records.append(record)
+    return records
+
 
+def render_latex(records, caption="", ignore_r=False):
+    """
+    LaTeX tables of GroverDWCost records, one per target success probability.
+    """
+    tables = []
+    for p in _unique(rec["p"] for rec in records):
+        table = """
+\\begin{table}
+    \\centering
+    \\renewcommand{\\tabcolsep}{0.05in}
+    \\renewcommand{\\arraystretch}{1.3}
+    \\resizebox{\\textwidth}{!}{
+        \\begin{tabular}{lccccccccc}
+            \\toprule\n"""
+        table += "            scheme & \\texttt{MD} & %s $S$ & %s $D$ & $W$ & $G$-cost & $DW$-cost \\\\ \\midrule\n" % (
+            "" if ignore_r else "$r$ &",
+            "" if ignore_r else "$\\log_2{(\\text{SKP})}$ &",
+        )
+        for lMD in _unique(rec["log_md"] for rec in records if rec["p"] == p):
+            for rec in records:
+                if rec["p"] != p or rec["log_md"] != lMD:
+                    continue
                 # Formatting circuit size
-                Sf, Se = format_pow(S)
-                Df, De = format_pow(D)
-                Wf, We = format_pow(W)
-                DWf, DWe = format_pow(D*W)
-                G_costf, G_coste = format_pow(G_cost)
-                DW_costf, DW_coste = format_pow(DW_cost)
-                # timeCf, timeCe = format_pow(S * key_pc[i][1])
-                # timeQf, timeQe = format_pow(D)
-
-                # print "%s-%s: " % (cipher, lk),
-                # print "S = %.2f \cdot 2^{%s}, D = %.2f \cdot 2^{%s}, W = %.2f \cdot 2^{%s}, DW = %.2f \cdot 2^{%s}" % (Sf, Se, Df, De, Wf, We, DWf, DWe)
-                table += "            \\%s-%d & $2^{%d}$ & %s $%.2f \cdot 2^{%s}$ & %s $%.2f \cdot 2^{%s}$ & $%.2f \cdot 2^{%s}$ & $%.2f \cdot 2^{%s}$ & $%.2f \cdot 2^{%s}$ \\\\\n" % (
-                    cipher, lk, lMD, 
-                    "" if ignore_r else (" $%d$ &" % pairs), 
-                    Sf, Se, 
-                    "" if ignore_r else ("$%s$ &" % (("%.2f" % R(log(skp,2))) if R(log(skp,2)) > (-Infinity) else "-\infty")), # prob
-                    Df, De, 
-                    Wf, We, 
-                    # DWf, DWe,
+                Sf, Se = format_pow(rec["S"])
+                Df, De = format_pow(rec["D"])
+                Wf, We = format_pow(rec["W"])
+                G_costf, G_coste = format_pow(rec["G_cost"])
+                DW_costf, DW_coste = format_pow(rec["DW_cost"])
+
+                table += "            \\%s-%d & $2^{%d}$ & %s $%.2f \\cdot 2^{%s}$ & %s $%.2f \\cdot 2^{%s}$ & $%.2f \\cdot 2^{%s}$ & $%.2f \\cdot 2^{%s}$ & $%.2f \\cdot 2^{%s}$ \\\\\n" % (
+                    rec["cipher"], rec["key_length"], lMD,
+                    "" if ignore_r else (" $%d$ &" % rec["r"]),
+                    Sf, Se,
+                    "" if ignore_r else ("$%s$ &" % (("%.2f" % rec["log2_skp"]) if rec["log2_skp"] > -R.inf else "-\\infty")), # prob
+                    Df, De,
+                    Wf, We,
                     G_costf, G_coste,
                     DW_costf, DW_coste,
-                    # timeCf, timeCe, # Clas
-                    # cipher, lk,
-                    # timeQf, timeQe, # Quant
                     )
             table += "            \\midrule\n"
-        table += """        \end{tabular}
+        table += """        \\end{tabular}
     }
     \\caption{%s}
 \\end{table}\n""" % caption
-        print table
+        tables.append(table)
+    return "\n".join(tables)
 
 
-def CostAES(t_depth_only, in_place_mixcolumn):
-    if t_depth_only:
-        # indexed by number of p-c pairs
-        GDs = {
-            1: [121, 120, 126],
-            2: [121, 120, 126],
-            3: [121, 120, 126],
-        }
-    else:
-        # indexed by number of p-c pairs
-        if in_place_mixcolumn:
-            GDs = {
-                1: [2816, 2978, 3353],
-                2: [2815, 2981, 3356],
-                3: [2830, 2982, 3347],
-            }
+def _unique(values):
+    seen = []
+    for v in values:
+        if v not in seen:
+            seen.append(v)
+    return seen
+
+
+# integer fields of GroverDWCost records, other numbers are rendered as floats
+INT_FIELDS = ["key_length", "log_md", "r"]
+
+def _plain(name, value):
+    """
+    Record value as a Python int, float or str.
+    """
+    if isinstance(value, str) or value is None:
+        return value
+    return int(value) if name in INT_FIELDS else float(value)
+
+
+def _fields(records):
+    return _unique(name for rec in records for name in rec)
+
+
+def render_csv(records):
+    """
+    CSV with a header line, numbers as Python floats.
+
+    TESTS:
+        >>> print(render_csv([{"cipher": "aes", "S": R.mpf(2)**70}, {"cipher": "lowmc", "S": 1.5}]), end="")
+        cipher,S
+        aes,1.1805916207174113e+21
+        lowmc,1.5
+    """
+    import csv, io
+    out = io.StringIO()
+    writer = csv.DictWriter(out, _fields(records), lineterminator="\n")
+    writer.writeheader()
+    for rec in records:
+        writer.writerow({name: _plain(name, v) for name, v in rec.items()})
+    return out.getvalue()
+
+
+def render_jsonl(records):
+    """
+    One JSON object per line, with null for a probability of spurious keys of 0.
+
+    TESTS:
+        >>> print(render_jsonl([{"cipher": "aes", "r": 2, "log2_skp": -R.inf}]), end="")
+        {"cipher": "aes", "r": 2, "log2_skp": null}
+    """
+    import json, math
+    lines = []
+    for rec in records:
+        rec = {name: _plain(name, v) for name, v in rec.items()}
+        rec = {name: None if isinstance(v, float) and math.isinf(v) else v for name, v in rec.items()}
+        lines.append(json.dumps(rec) + "\n")
+    return "".join(lines)
+
+
+def render_columns(records):
+    """
+    NumPy structured array with a column per field, as returned by grover_sweep. Needs NumPy.
+
+    TESTS:
+        >>> cols = render_columns([{"cipher": "aes", "r": 2, "S": R.mpf(3)}, {"cipher": "lowmc", "r": 1, "S": 1.0}])
+        >>> cols["cipher"].tolist(), cols["r"].tolist(), cols["S"].tolist()
+        (['aes', 'lowmc'], [2, 1], [3.0, 1.0])
+    """
+    import numpy as np
+    columns = {}
+    for name in _fields(records):
+        col = [_plain(name, rec.get(name)) for rec in records]
+        if any(isinstance(v, str) for v in col):
+            # records without the field get an empty string
+            columns[name] = np.array([v or "" for v in col])
         else:
-            GDs = {
-                1: [2086, 1879, 1951],
-                2: [2096, 1890, 1952],
-                3: [2102, 1888, 1956],
-            }
+            columns[name] = np.array([np.nan if v is None else v for v in col])
+    res = np.zeros(len(records), dtype=[(name, col.dtype) for name, col in columns.items()])
+    for name, col in columns.items():
+        res[name] = col
+    return res
+
+
+RENDERERS = {
+    "latex": render_latex,
+    "csv": render_csv,
+    "jsonl": render_jsonl,
+    "columns": render_columns,
+}
+
+
+def OracleFigures(table, operation, sizes, variant, pairs, t_depth_only):
+    """
+    Depths, widths and gate counts of Grover oracles from the estimates in table, as dictionaries
+    indexed by number of p-c pairs (1 to pairs) of lists following sizes (Nk or security
+    category), for GroverDWCost.
+
+    :params t_depth_only:   use the T-depth rather than the full depth
+
+    TESTS:
+        >>> GDs, Ws, Gs = OracleFigures(estimates.load(estimates.LOWMC_CSV), "QLowMC.GroverOracle", [1, 3, 5], None, 2, False)
+        >>> GDs[1], Ws[2], Gs[1][0]
+        ([98709, 319323, 693477], [3169, 4753, 6097], 705977)
+    """
+    GDs, Ws, Gs = {}, {}, {}
+    for r in range(1, pairs + 1):
+        rows = [table.row(operation, size, variant, r) for size in sizes]
+        GDs[r] = [row.t_depth if t_depth_only else row.GD for row in rows]
+        Ws[r] = [row.W for row in rows]
+        Gs[r] = [row.G for row in rows]
+    return GDs, Ws, Gs
+
 
+def CostAES(t_depth_only, in_place_mixcolumn, ctx=R):
+    """
+    GroverDWCost records for AES, and the caption of their LaTeX table.
+    """
     # indexed by number of p-c pairs
-    if in_place_mixcolumn:
-        Ws = {
-            1: [257 + 1408, 321 + 1664, 385 + 1920],
-            2: [385 + 2944, 449 + 3520, 513 + 4096],
-            3: [513 + 4480, 577 + 5376, 641 + 6272],
-        }
-        Gs = {
-            1: [292313 + 84428 + 54908 + 13727, 329697 + 94316 + 61436 + 15359, 404139 + 116286 + 75580 + 18895],
-            2: [585051 + 169184 + 109820 + 27455, 659727 + 188520 + 122876 + 30719, 808071 + 231124 + 151164 + 37791],
-            3: [877081 + 252524 + 164732 + 41183, 989879 + 282968 + 184316 + 46079, 1212905 + 347766 + 226748 + 56687]
-        }
-    else:
-        Ws = {
-            1: [257 + 2560, 321 + 3072, 385 + 3584],
-            2: [385 + 5248, 449 + 6336, 513 + 7424],
-            3: [513 + 7936, 577 + 9600, 641 + 11264],
-        }
-        Gs = {
-            1: [294863 + 84488 + 54908 + 13727, 332665 + 94092 + 61436 + 15359, 407667 + 116062 + 75580 + 18895],
-            2: [589643 + 168288 + 109820 + 27455, 665899 + 188544 + 122876 + 30719, 815645 + 231712 + 151164 + 37791],
-            3: [884817 + 252876 + 164732 + 41183, 999491 + 283712 + 184316 + 46079, 1223087 + 346290 + 226748 + 56687]
-        }
+    GDs, Ws, Gs = OracleFigures(estimates.load(estimates.AES_CSV), "QAES.SmartWide.GroverOracle", [4, 6, 8],
+        "in-place" if in_place_mixcolumn else "maximov", 3, t_depth_only)
 
     # print "@@@ T-depth only: %s" % t_depth_only
     # print "@@@ in-place MC: %s" % in_place_mixcolumn
 
     # provide r guaranteeing no spurious keys. internally it tries to use less
     # caption = "\\aes: D = %s, %s MixColumn" % ("T-depth" if t_depth_only else "full depth", "in-place" if in_place_mixcolumn else "Maximov's")
-    caption = "Circuit sizes for parallel Grover key search against \\aes (using %s MixColumn implementation), using \emph{inner} parallelization (cf. Section~\\ref{sec:groverparallel}). \\texttt{MD} is \\nistmaxdepth, $r$ is the number of plaintext-ciphertext pairs used in the Grover oracle, S is the number of subsets in which the key-space is divided into, SKP is the probability of spurious keys being present in the subset where the target key is present, D and W are the %sdepth and qubit width of the full circuit, DW is the %sdepth~$\\times$~width circuit cost. After the Grover search is completed, each of the S measured candidate keys is classically checked against 2 (resp. 2, 3) plaintext-ciphertext pairs for \\aes-128 (resp. -192, -256)." % (
+    caption = "Circuit sizes for parallel Grover key search against \\aes (using %s MixColumn implementation), using \\emph{inner} parallelization (cf. Section~\\ref{sec:groverparallel}). \\texttt{MD} is \\nistmaxdepth, $r$ is the number of plaintext-ciphertext pairs used in the Grover oracle, S is the number of subsets in which the key-space is divided into, SKP is the probability of spurious keys being present in the subset where the target key is present, D and W are the %sdepth and qubit width of the full circuit, DW is the %sdepth~$\\times$~width circuit cost. After the Grover search is completed, each of the S measured candidate keys is classically checked against 2 (resp. 2, 3) plaintext-ciphertext pairs for \\aes-128 (resp. -192, -256)." % (
         "an in-place" if in_place_mixcolumn else "Maximov's~\\cite{cryptoeprint:2019:833}",
         "T-" if t_depth_only else "full ",
         "T-" if t_depth_only else "full ",
     )
-    GroverDWCost("aes", GDs, Ws, Gs, [(128, 2), (192, 2), (256, 3)], [1], caption=caption) #, 0.5, R(1/e)])
+    records = GroverDWCost("aes", GDs, Ws, Gs, [(128, 2), (192, 2), (256, 3)], [1], ctx=ctx, #, 0.5, R(1/e)])
+        depth="T" if t_depth_only else "full", mixcolumn="in-place" if in_place_mixcolumn else "maximov")
+    return records, caption
 
 
-def CostLowMC(t_depth_only):
-    if t_depth_only:
-        # indexed by number of p-c pairs
-        GDs = {
-                1: [41, 61, 77],
-                2: [41, 61, 77]
-            }
-    else:
-        # indexed by number of p-c pairs
-        GDs = { 
-            1: [98709, 319323, 693477],
-            2: [98707, 319329, 693483] 
-        }
-
+def CostLowMC(t_depth_only, ctx=R):
+    """
+    GroverDWCost records for LowMC, and the caption of their LaTeX table.
+    """
     # indexed by number of p-c pairs
-    Ws = {
-        1: [257 + 1328, 385 + 1992, 513 + 2536],
-        2: [385 + 2784, 577 + 4176, 769 + 5328],
-    }
-
-    Gs = {
-        1: [690961 + 5917 + 8908 + 191, 2273397 + 10881 + 13364 + 286, 5072343 + 16209 + 16980 + 372],
-        2: [1382143 + 11774 + 17820 + 362, 4547191 + 21783 + 26732 + 576, 10145281 + 32567 + 33964 + 783]
-    }
+    GDs, Ws, Gs = OracleFigures(estimates.load(estimates.LOWMC_CSV), "QLowMC.GroverOracle", [1, 3, 5], None, 2, t_depth_only)
     # print "T-depth only: %s" % t_depth_only
 
     # Not sure it makes sense to have lower than 1 prob for these next values
-    caption = "Circuit sizes for parallel Grover key search against \\lowmc, using \\emph{inner} parallelization (cf. Section~\\ref{sec:groverparallel}). \\texttt{MD} is \\nistmaxdepth, S is the number of subsets in which the key-space is divided into, D and W are the %sdepth and qubit width of the full circuit, DW is the %sdepth~$\\times$~width circuit cost. The Grover oracle is always implemented using a single plaintext-ciphertext pair, given that this is sufficient for key-recovery againist \picnic. After the Grover search is completed, each of the S measured candidate keys is classically checked against 1 plaintext-ciphertext pairs." % (
+    caption = "Circuit sizes for parallel Grover key search against \\lowmc, using \\emph{inner} parallelization (cf. Section~\\ref{sec:groverparallel}). \\texttt{MD} is \\nistmaxdepth, S is the number of subsets in which the key-space is divided into, D and W are the %sdepth and qubit width of the full circuit, DW is the %sdepth~$\\times$~width circuit cost. The Grover oracle is always implemented using a single plaintext-ciphertext pair, given that this is sufficient for key-recovery againist \\picnic. After the Grover search is completed, each of the S measured candidate keys is classically checked against 1 plaintext-ciphertext pairs." % (
         "T-" if t_depth_only else "full ",
         "T-" if t_depth_only else "full ",
     )
-    GroverDWCost("lowmc", GDs, Ws, Gs, [(128, 2), (192, 2), (256, 2)], [1], spurious_key_threshold=2**(-20), caption=caption, ignore_r=False, lowmc=True)
-
-
-# print "@@@ ########## in-place MC"
-CostAES(False, True)
-CostAES(True, True)
-# print "@@@"
-# print "@@@"
-# print "@@@ ########## Maximov's MC"
-CostAES(False, False)
-CostAES(True, False)
-# print "@@@"
-# print "@@@"
-# print "@@@ ########## LowMC"
-CostLowMC(False)
-# print "@@@"
-# print "@@@"
-CostLowMC(True)
+    records = GroverDWCost("lowmc", GDs, Ws, Gs, [(128, 2), (192, 2), (256, 2)], [1], spurious_key_threshold=2**(-20), lowmc=True, ctx=ctx,
+        depth="T" if t_depth_only else "full")
+    return records, caption
+
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fast", action="store_true", help="compute in double precision instead of 1000 bits")
+    parser.add_argument("--prec", type=int, default=1000, help="bits of precision, unless --fast")
+    parser.add_argument("--format", choices=["latex", "csv", "jsonl"], default="latex", help="output format")
+    args = parser.parse_args()
+    set_precision(args.prec)
+    ctx = fp if args.fast else R
+
+    tables = [
+        # in-place MC
+        CostAES(False, True, ctx),
+        CostAES(True, True, ctx),
+        # Maximov's MC
+        CostAES(False, False, ctx),
+        CostAES(True, False, ctx),
+        # LowMC
+        CostLowMC(False, ctx),
+        CostLowMC(True, ctx),
+    ]
+    if args.format == "latex":
+        for records, caption in tables:
+            print(render_latex(records, caption=caption))
+    else:
+        print(RENDERERS[args.format]([rec for records, _ in tables for rec in records]), end="")
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Long lived process holding the compiled Q# workspace of a project directory (aes or lowmc), and
+serving toffoli_simulate, estimate_resources and simulate calls from other processes over a local
+socket (a named pipe on Windows).
+
+`import qsharp` compiles the whole project, which for LowMC includes hundreds of generated
+affine layer files, before the first test runs. The server pays for this once. Before every
+call it checks whether the Q# sources changed, by their size and modification time and then by
+their hash, and only then recompiles the workspace through qsharp.reload().
+
+    cd aes
+    python3 ../qsharp_server.py serve &      # or let the first client start it
+    python3 ../qsharp_server.py test -k Mul  # runs the doctests of qtests.py through the server
+    python3 ../qsharp_server.py stop
+
+Clients either call operations by name,
+
+    >>> conn = connect("aes")                                               # doctest: +SKIP
+    >>> conn.operation("QTests.GF256.Mul").toffoli_simulate(_a=a, _b=b, unrolled=False, costing=False)  # doctest: +SKIP
+
+or install() an import hook, after which `from QTests.GF256 import Mul` returns a proxy with the
+same methods as the callables of the qsharp package. qtests.py does not import qsharp when the
+QSHARP_SERVER environment variable is set, as `qsharp_server.py test` does.
+
+Calls are served one at a time, in the order connections are accepted. Messages are pickles, so
+clients and server authenticate each other with a random key, which the server writes next to
+its socket, in a directory and a file only the user can access.
+"""
+import argparse
+import glob
+import hashlib
+import importlib
+import importlib.abc
+import importlib.util
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+import types
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+SOURCES = ("*.qs", "*.csproj")
+METHODS = ("toffoli_simulate", "estimate_resources", "simulate")
+
+
+class QSharpServerError(Exception):
+    """
+    Failure of a call on the server side, carrying the remote traceback.
+    """
+
+
+def _tag(directory):
+    return hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()[:16]
+
+
+def _check_private(path, mode):
+    """
+    Raises QSharpServerError unless path is owned by the current user and has exactly the
+    given permissions, so that other local users can neither read nor replace it.
+    """
+    if sys.platform == "win32":
+        return
+    st = os.lstat(path)
+    if st.st_uid != os.getuid() or (st.st_mode & 0o777) != mode:
+        raise QSharpServerError("%s must be owned by uid %d with mode %o" % (path, os.getuid(), mode))
+
+
+def run_dir():
+    """
+    Directory holding the sockets and keys of the servers of the current user. On POSIX it is
+    created with mode 0700, and refused if someone else created it first.
+
+    TESTS:
+        >>> _check_private(run_dir(), 0o700)
+    """
+    if sys.platform == "win32":
+        # the temporary directory is private to the user on Windows
+        path = os.path.join(tempfile.gettempdir(), "qsharp-server")
+    else:
+        path = os.path.join(tempfile.gettempdir(), "qsharp-server-%d" % os.getuid())
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.path.islink(path) or not os.path.isdir(path):
+        raise QSharpServerError("%s is not a directory" % path)
+    _check_private(path, 0o700)
+    return path
+
+
+def address(directory):
+    """
+    Address the server of a project directory listens on, private to the user.
+
+    TESTS:
+        >>> address("aes") == address(os.path.join("aes", "..", "aes")) != address("lowmc")
+        True
+    """
+    if sys.platform == "win32":
+        return r"\\.\pipe\qsharp-server-%s" % _tag(directory)
+    return os.path.join(run_dir(), "%s.sock" % _tag(directory))
+
+
+def authkey_path(directory):
+    return os.path.join(run_dir(), "%s.key" % _tag(directory))
+
+
+def new_authkey(directory):
+    """
+    Random key authenticating the clients of the server of directory (and the server to its
+    clients), written to a file only the user can read.
+
+    TESTS:
+        >>> d = tempfile.mkdtemp()
+        >>> key = new_authkey(d)
+        >>> read_authkey(d) == key, oct(os.stat(authkey_path(d)).st_mode & 0o777) if sys.platform != "win32" else '0o600'
+        (True, '0o600')
+        >>> os.remove(authkey_path(d))
+    """
+    key = os.urandom(32)
+    path = authkey_path(directory)
+    if os.path.lexists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    return key
+
+
+def read_authkey(directory):
+    """
+    Key of the running server of directory. Raises FileNotFoundError if there is none.
+    """
+    path = authkey_path(directory)
+    _check_private(path, 0o600)
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def namespaces(directory):
+    """
+    Q# namespaces declared in the sources of directory, ignoring commented out code.
+
+    TESTS:
+        >>> d = os.path.join(os.path.dirname(os.path.abspath(__file__)), "aes")
+        >>> sorted(n for n in namespaces(d) if n.startswith("QTests"))
+        ['QTests.AES', 'QTests.GF256', 'QTests.Utilities']
+    """
+    found = set()
+    for path in glob.glob(os.path.join(directory, "*.qs")):
+        with open(path, encoding="utf-8-sig") as f:
+            found.update(re.findall(r"^\s*namespace\s+([\w.]+)", f.read(), re.MULTILINE))
+    return found
+
+
+class SourceVersion(object):
+    """
+    Tracks the Q# sources of a directory. changed() compares sizes and modification times, and
+    only if these moved hashes the sources, so that touching a file or rewriting it with the
+    same content does not count as a change.
+
+    TESTS:
+        >>> d = tempfile.mkdtemp()
+        >>> with open(os.path.join(d, "A.qs"), "w") as f: _ = f.write("namespace A {}")
+        >>> v = SourceVersion(d)
+        >>> v.changed()
+        False
+        >>> with open(os.path.join(d, "A.qs"), "w") as f: _ = f.write("namespace A {}")
+        >>> v.changed()
+        False
+        >>> with open(os.path.join(d, "B.qs"), "w") as f: _ = f.write("namespace B {}")
+        >>> v.changed(), v.changed()
+        (True, False)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats = self._stats()
+        self.digest = self._digest()
+
+    def _paths(self):
+        return sorted(p for pattern in SOURCES for p in glob.glob(os.path.join(self.directory, pattern)))
+
+    def _stats(self):
+        stats = []
+        for path in self._paths():
+            st = os.stat(path)
+            stats.append((path, st.st_mtime_ns, st.st_size))
+        return stats
+
+    def _digest(self):
+        h = hashlib.sha256()
+        for path, _, _ in self.stats:
+            h.update(os.path.basename(path).encode() + b"\0")
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        return h.hexdigest()
+
+    def changed(self):
+        """
+        True if the sources differ from the last time they were looked at.
+        """
+        stats = self._stats()
+        if stats == self.stats:
+            return False
+        self.stats = stats
+        digest = self._digest()
+        if digest == self.digest:
+            return False
+        self.digest = digest
+        return True
+
+
+class Server(object):
+    """
+    The compiled workspace of a project directory, and the loop serving calls on it.
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.chdir(self.directory)
+        sys.path.insert(0, self.directory)
+        self.version = SourceVersion(self.directory)
+        start = time.perf_counter()
+        import qsharp # pylint: disable=import-error
+        self.qsharp = qsharp
+        self.log("workspace compiled in %.1fs" % (time.perf_counter() - start))
+        self.operations = {}
+
+    def log(self, message):
+        print("[%s] %s" % (time.strftime("%H:%M:%S"), message), flush=True)
+
+    def refresh(self):
+        if self.version.changed():
+            start = time.perf_counter()
+            self.qsharp.reload()
+            self.operations.clear()
+            self.log("sources changed, workspace recompiled in %.1fs" % (time.perf_counter() - start))
+
+    def operation(self, name):
+        if name not in self.operations:
+            namespace, _, op = name.rpartition(".")
+            self.operations[name] = getattr(importlib.import_module(namespace), op)
+        return self.operations[name]
+
+    def handle(self, method, name, kwargs):
+        if method == "version":
+            return self.version.digest
+        if method not in METHODS:
+            raise ValueError("unknown method %s" % method)
+        self.refresh()
+        return getattr(self.operation(name), method)(**kwargs)
+
+    def serve(self, addr, authkey):
+        self.log("listening on %s" % addr)
+        if os.path.exists(addr) and sys.platform != "win32":
+            os.remove(addr)
+        with Listener(addr, authkey=authkey) as listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    self.log("refused a client that failed authentication")
+                    continue
+                with conn:
+                    while True:
+                        try:
+                            method, name, kwargs = conn.recv()
+                        except EOFError:
+                            break
+                        if method == "stop":
+                            conn.send(("ok", None))
+                            self.log("stopped")
+                            return
+                        try:
+                            conn.send(("ok", self.handle(method, name, kwargs)))
+                        except Exception: # pylint: disable=broad-except
+                            conn.send(("error", traceback.format_exc()))
+
+
+class Connection(object):
+    """
+    Client side of a server.
+    """
+
+    def __init__(self, addr, authkey):
+        self.conn = Client(addr, authkey=authkey)
+
+    def call(self, method, name=None, **kwargs):
+        self.conn.send((method, name, kwargs))
+        status, value = self.conn.recv()
+        if status == "error":
+            raise QSharpServerError(value)
+        return value
+
+    def operation(self, name):
+        return RemoteOperation(self, name)
+
+    def close(self):
+        self.conn.close()
+
+
+class RemoteOperation(object):
+    """
+    Stand-in for a Q# callable of the qsharp package, running it on the server.
+    """
+
+    def __init__(self, conn, name):
+        self.conn = conn
+        self.name = name
+
+    def toffoli_simulate(self, **kwargs):
+        return self.conn.call("toffoli_simulate", self.name, **kwargs)
+
+    def estimate_resources(self, **kwargs):
+        return self.conn.call("estimate_resources", self.name, **kwargs)
+
+    def simulate(self, **kwargs):
+        return self.conn.call("simulate", self.name, **kwargs)
+
+    def __repr__(self):
+        return "<RemoteOperation %s>" % self.name
+
+
+def connect(directory=".", spawn=True, timeout=3600):
+    """
+    Connects to the server of directory. If there is none and spawn is True, starts one in the
+    background, logging to qsharp_server.log in directory, and waits up to timeout seconds for
+    it to compile the workspace.
+    """
+    addr = address(directory)
+    try:
+        return Connection(addr, read_authkey(directory))
+    except (FileNotFoundError, ConnectionRefusedError):
+        if not spawn:
+            raise
+    with open(os.path.join(directory, "qsharp_server.log"), "a") as log:
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", os.path.abspath(directory)],
+                                stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise QSharpServerError("server exited with status %d, see qsharp_server.log" % proc.returncode)
+        try:
+            # read again every time, the new server replaces the key of a dead one
+            return Connection(addr, read_authkey(directory))
+        except (FileNotFoundError, ConnectionRefusedError, AuthenticationError):
+            time.sleep(0.2)
+    raise QSharpServerError("server did not start within %ds" % timeout)
+
+
+class _Finder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    Import hook turning the Q# namespaces of a project, and their parents, into modules whose
+    attributes are RemoteOperations.
+    """
+
+    def __init__(self, conn, names):
+        self.conn = conn
+        self.names = set(names)
+        for name in names:
+            parts = name.split(".")
+            self.names.update(".".join(parts[:i]) for i in range(1, len(parts)))
+
+    def find_spec(self, fullname, path, target=None):
+        if fullname in self.names:
+            return importlib.util.spec_from_loader(fullname, self, is_package=True)
+        return None
+
+    def create_module(self, spec):
+        module = types.ModuleType(spec.name)
+        module.__path__ = []
+        conn = self.conn
+
+        def __getattr__(attr):
+            if attr.startswith("__"):
+                raise AttributeError(attr)
+            return RemoteOperation(conn, "%s.%s" % (spec.name, attr))
+        module.__getattr__ = __getattr__
+        return module
+
+    def exec_module(self, module):
+        pass
+
+
+def install(directory=".", spawn=True):
+    """
+    Connects to the server of directory and makes the Q# namespaces of directory importable
+    from it. Returns the Connection.
+    """
+    conn = connect(directory, spawn)
+    sys.meta_path.insert(0, _Finder(conn, namespaces(directory)))
+    return conn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the compiled Q# workspace of a project directory.")
+    parser.add_argument("command", choices=["serve", "stop", "status", "test"])
+    parser.add_argument("directory", nargs="?", default=".", help="Q# project directory")
+    parser.add_argument("-k", dest="pattern", help="with test, only run the doctests of Tests methods whose name contains PATTERN")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_intermixed_args()
+    directory = os.path.abspath(args.directory)
+
+    if args.command == "serve":
+        server = Server(directory)
+        server.serve(address(directory), new_authkey(directory))
+    elif args.command == "stop":
+        try:
+            connect(directory, spawn=False).call("stop")
+        except (FileNotFoundError, ConnectionRefusedError):
+            print("no server running for %s" % directory)
+    elif args.command == "status":
+        try:
+            print("serving %s, sources %s" % (directory, connect(directory, spawn=False).call("version")[:16]))
+        except (FileNotFoundError, ConnectionRefusedError):
+            print("no server running for %s" % directory)
+            sys.exit(1)
+    else:
+        import doctest
+        os.environ["QSHARP_SERVER"] = address(directory)
+        install(directory)
+        os.chdir(directory)
+        sys.path.insert(0, directory)
+        import qtests # pylint: disable=import-error
+        failed = 0
+        for test in doctest.DocTestFinder().find(qtests):
+            if args.pattern is None or args.pattern in test.name:
+                runner = doctest.DocTestRunner(verbose=args.verbose)
+                failed += runner.run(test).failed
+        sys.exit(1 if failed else 0)
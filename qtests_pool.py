@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Runs the doctests of aes/qtests.py or lowmc/qtests.py in a pool of worker processes, and reports
+the wall time of every test case, a case being a `>>> Tests.X(...)` line and its expected output.
+
+Importing qsharp compiles the Q# project in the current directory, so every worker imports
+qtests once when it starts, and runs all the cases it is handed in that warm workspace. Cases are
+independent of each other and single threaded in the Toffoli simulator, so with N workers the
+suite runs up to N times faster, down to the time of its longest case. Given --times, the wall
+times of a run are saved and the next run starts the slowest cases first.
+
+    cd aes
+    python3 ../qtests_pool.py -j 8
+    python3 ../qtests_pool.py -j 8 -k GroverOracle --times qtests_times.json
+
+Cases are read from the source without importing qtests, so the parent process does not compile
+the Q# project. Commented out doctests (`# >>> ...`) are skipped, as by doctest.testmod.
+"""
+import argparse
+import ast
+import collections
+import contextlib
+import doctest
+import io
+import json
+import os
+import sys
+import time
+import traceback
+from multiprocessing import Pool
+
+Case = collections.namedtuple("Case", ["name", "source", "want"])
+Result = collections.namedtuple("Result", ["case", "ok", "got", "seconds"])
+
+
+def collect(path, pattern=None):
+    """
+    Test cases in the docstrings of the module at path, of the classes in it and of their
+    methods, in the order of the source. If pattern is given, only cases whose source contains
+    it are returned.
+
+    TESTS:
+        >>> cases = collect(os.path.join(os.path.dirname(os.path.abspath(__file__)), "aes", "qtests.py"))
+        >>> cases[0]
+        Case(name='Tests.Mul', source='Tests.Mul(unrolled=False)\\n', want='Testing Mul (unrolled=False)\\n')
+        >>> len([c for c in cases if c.name == "Tests.GroverOracle"])
+        12
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    parser = doctest.DocTestParser()
+    cases = []
+
+    def visit(node, prefix):
+        doc = ast.get_docstring(node, clean=True)
+        if doc:
+            for example in parser.get_examples(doc):
+                if pattern is None or pattern in example.source:
+                    cases.append(Case(prefix.rstrip("."), example.source, example.want))
+        for child in node.body:
+            if isinstance(child, (ast.ClassDef, ast.FunctionDef)):
+                visit(child, prefix + child.name + ".")
+
+    visit(tree, "")
+    return cases
+
+
+_globs = None
+
+
+def _init(directory):
+    """
+    Worker initialiser, importing qtests (and with it compiling the Q# workspace) from directory.
+    """
+    global _globs
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    import qtests # pylint: disable=import-error
+    _globs = vars(qtests)
+
+
+def _run(case):
+    """
+    Runs a case in the worker's workspace, checking its output as doctest would.
+    """
+    out = io.StringIO()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(out):
+            exec(compile(case.source, "<%s>" % case.name, "single"), dict(_globs))
+    except Exception: # pylint: disable=broad-except
+        out.write(traceback.format_exc())
+    seconds = time.perf_counter() - start
+    got = out.getvalue()
+    ok = doctest.OutputChecker().check_output(case.want, got, 0)
+    return Result(case, ok, got, seconds)
+
+
+def run(cases, directory, jobs=1, times=None):
+    """
+    Yields a Result for every case, as the workers finish them. Cases with the largest
+    previous wall time in times (a dictionary from case source to seconds) are started first.
+
+    TESTS:
+        >>> import tempfile
+        >>> d = tempfile.mkdtemp()
+        >>> with open(os.path.join(d, "qtests.py"), "w") as f:
+        ...     _ = f.write('class Tests:\\n    @staticmethod\\n    def Double(x):\\n        print(2 * x)\\n')
+        >>> cases = [Case("Tests.Double", "Tests.Double(%d)\\n" % x, "%d\\n" % (2 * x)) for x in range(3)]
+        >>> cases.append(Case("Tests.Double", "Tests.Double(3)\\n", "7\\n"))
+        >>> res = sorted(run(cases, d, jobs=2), key=lambda r: r.case.source)
+        >>> [(r.ok, r.got) for r in res]
+        [(True, '0\\n'), (True, '2\\n'), (True, '4\\n'), (False, '6\\n')]
+    """
+    if times:
+        cases = sorted(cases, key=lambda c: -times.get(c.source, 0))
+    with Pool(max(1, min(jobs, len(cases))), initializer=_init, initargs=(directory,)) as pool:
+        for res in pool.imap_unordered(_run, cases, chunksize=1):
+            yield res
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the doctests of qtests.py in parallel.")
+    parser.add_argument("directory", nargs="?", default=".", help="directory of qtests.py and its Q# project")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("-k", dest="pattern", help="only run cases whose source contains PATTERN")
+    parser.add_argument("--times", help="JSON file of wall times, read to start the slowest cases first and updated")
+    args = parser.parse_args()
+
+    directory = os.path.abspath(args.directory)
+    cases = collect(os.path.join(directory, "qtests.py"), args.pattern)
+    times = {}
+    if args.times and os.path.exists(args.times):
+        with open(args.times) as f:
+            times = json.load(f)
+
+    failed = 0
+    start = time.perf_counter()
+    for res in run(cases, directory, args.jobs, times):
+        times[res.case.source] = res.seconds
+        print("%9.2fs  %s  %s" % (res.seconds, "ok  " if res.ok else "FAIL", res.case.source.strip()), flush=True)
+        if not res.ok:
+            failed += 1
+            print("Expected:\n%sGot:\n%s" % (res.case.want, res.got), flush=True)
+    print("%d cases, %d failed, %.2fs wall time with %d jobs" % (len(cases), failed, time.perf_counter() - start, args.jobs))
+
+    if args.times:
+        with open(args.times, 'w') as f:
+            json.dump(times, f, indent=1, sort_keys=True)
+            f.write("\n")
+    sys.exit(1 if failed else 0)
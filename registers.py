@@ -0,0 +1,147 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT license.
+"""
+Conversions between the classical values used by the Python references and the Result[] (or
+Result[][]) registers taken and returned by the Q# test operations, for single values and
+batches of them, through NumPy packbits/unpackbits.
+
+Q# registers hold the bits of every byte least significant first, as GF256Element.coeffs.
+AES states, keys and lists of states are sequences of columns of 4 bytes, state['a'] or key['k']
+in aes.py, laid out column after column, which is also the byte order of aes_batch. LowMC
+registers hold entry i of the bit lists of lowmc.py in qubit i, which is bit i of the packed
+integers of lowmc_packed.
+
+Encoders return nested Python lists of ints, which is what the qsharp package sends to the
+simulator. Decoders take what the simulator returns, flat or split into words, and with
+batch=True a list of those, one per input of a batched operation.
+
+    >>> encode_bytes([1, 128])
+    [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+    >>> decode_bytes([[1, 0, 0, 0, 0, 0, 0, 0], [0, 0, 0, 0, 0, 0, 0, 1]]).tolist()
+    [1, 128]
+
+NumPy is only imported when a conversion is made, so that the modules importing this one work
+without it until then.
+"""
+
+
+def _flatten(a, batch):
+    return a.reshape(len(a), -1) if batch else a.reshape(-1)
+
+
+def encode_bytes(data, batch=False):
+    """
+    Qubit values of a register holding the bytes of data, in order.
+
+    :params data:  bytes, as an array-like of shape (m,), or (N, m) if batch
+    :params batch: encode N registers
+    """
+    import numpy as np
+    data = _flatten(np.asarray(data, dtype=np.uint8), batch)
+    return np.unpackbits(data, axis=-1, bitorder='little').tolist()
+
+
+def decode_bytes(bits, batch=False):
+    """
+    Bytes held by measured registers, as a uint8 array of shape (m,), or (N, m) if batch.
+    Registers split into words (Result[][]) are read word after word.
+
+    TESTS:
+        >>> import numpy as np
+        >>> decode_bytes(encode_bytes(np.arange(256).reshape(16, 16), batch=True), batch=True).ravel().tolist() == list(range(256))
+        True
+    """
+    import numpy as np
+    bits = _flatten(np.asarray(bits, dtype=np.uint8), batch)
+    if bits.shape[-1] % 8:
+        raise ValueError("registers of %d qubits do not hold whole bytes" % bits.shape[-1])
+    return np.packbits(bits, axis=-1, bitorder='little')
+
+
+def encode_columns(columns, batch=False):
+    """
+    Qubit values of an AES register holding columns of 4 bytes: a state (Nb columns), a key
+    (Nk columns), or the states of several plaintext-ciphertext pairs one after the other
+    (4*pairs columns).
+
+    :params columns: array-like of shape (C, 4), or (N, C, 4) if batch
+    :params batch:   encode N registers
+
+    TESTS:
+        >>> state = [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]
+        >>> from itertools import chain
+        >>> encode_columns(state) == list(chain(*[[(b >> i) & 1 for i in range(8)] for b in range(16)]))
+        True
+        >>> len(encode_columns([state, state], batch=True)[1])
+        128
+    """
+    return encode_bytes(columns, batch)
+
+
+def decode_columns(bits, batch=False):
+    """
+    Columns of 4 bytes held by measured AES registers, as nested lists comparable to
+    state['a'] or key['k'] in aes.py.
+
+    TESTS:
+        >>> state = [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]]
+        >>> qstate = encode_columns(state)
+        >>> words = [qstate[32*j:32*(j+1)] for j in range(4)]
+        >>> decode_columns(words) == decode_columns(qstate) == state
+        True
+        >>> decode_columns([words, words], batch=True) == [state, state]
+        True
+    """
+    data = decode_bytes(bits, batch)
+    return data.reshape(data.shape[:-1] + (-1, 4)).tolist()
+
+
+def encode_bits(values, n=None, batch=False):
+    """
+    Qubit values of LowMC registers, from lists of bits (entry i in qubit i) or from packed
+    integers as in lowmc_packed (bit i in qubit i), in which case n is the register size.
+
+    TESTS:
+        >>> encode_bits(13, 6)
+        [1, 0, 1, 1, 0, 0]
+        >>> encode_bits([13, 2], 6, batch=True)
+        [[1, 0, 1, 1, 0, 0], [0, 1, 0, 0, 0, 0]]
+        >>> import numpy as np
+        >>> encode_bits(np.array([[1, 0], [0, 1]], dtype=np.uint8), batch=True)
+        [[1, 0], [0, 1]]
+    """
+    import numpy as np
+    if n is None:
+        return _flatten(np.asarray(values, dtype=np.uint8), batch).tolist()
+    if not batch:
+        return encode_bits([values], n, batch=True)[0]
+    nbytes = (n + 7) // 8
+    data = np.frombuffer(b"".join(int(x).to_bytes(nbytes, 'little') for x in values), dtype=np.uint8)
+    bits = np.unpackbits(data.reshape(-1, nbytes), axis=-1, bitorder='little')
+    return bits[:, :n].tolist()
+
+
+def decode_bits(bits, packed=False, batch=False):
+    """
+    Bits held by measured LowMC registers, as a uint8 array of shape (n,), or (N, n) if batch,
+    or as packed integers if packed.
+
+    TESTS:
+        >>> decode_bits([1, 0, 1, 1, 0, 0]).tolist(), decode_bits([1, 0, 1, 1, 0, 0], packed=True)
+        ([1, 0, 1, 1, 0, 0], 13)
+        >>> decode_bits([[1, 0, 1, 1, 0, 0, 0, 0, 1], [0] * 9], packed=True, batch=True)
+        [269, 0]
+    """
+    import numpy as np
+    bits = np.atleast_2d(_flatten(np.asarray(bits, dtype=np.uint8), batch))
+    if packed:
+        data = np.packbits(bits, axis=-1, bitorder='little')
+        values = [int.from_bytes(row.tobytes(), 'little') for row in data]
+    else:
+        values = bits
+    return values if batch else values[0]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()